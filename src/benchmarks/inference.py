@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from src.benchmarks.mock_endpoint import MockEndpoint, train_booster
+from src.benchmarks.serialization import make_batch
+from src.config.inference import CONNECT_TIMEOUT, READ_TIMEOUT
+from src.inference import inference
+from src.inference.client import create_session
+from src.utils.memory import RssSampler
+
+
+def percentiles(seconds: List[float]) -> Dict[str, float]:
+    if not seconds:
+        return {"p50_ms": None, "p99_ms": None}
+    p50, p99 = np.percentile(seconds, [50, 99]) * 1000
+    return {"p50_ms": round(float(p50), 2), "p99_ms": round(float(p99), 2)}
+
+
+def measure(
+    endpoint: MockEndpoint, func: Callable[[], List[float]], n_rows: int
+) -> Dict[str, Any]:
+    """
+    Runs `func` against a freshly reset endpoint. Latencies are the ones `func`
+    returns, the endpoint's service times if it returns none.
+    """
+    endpoint.reset()
+    with RssSampler() as rss:
+        start_time = time.perf_counter()
+        latencies = func()
+        seconds = time.perf_counter() - start_time
+    return {
+        "rows": n_rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(n_rows / seconds),
+        **percentiles(latencies or endpoint.service_times),
+        "requests": len(endpoint.statuses),
+        "failed_requests": sum(status != 200 for status in endpoint.statuses),
+        "peak_rss_mb": round(rss.peak / 1024**2, 1),
+    }
+
+
+def bench_score_model(
+    url: str, data: pd.DataFrame, batch_size: int, timeout: float = READ_TIMEOUT
+) -> List[float]:
+    """
+    Sends the batches one after another with `score_model`, returning the
+    latency of every request as the client sees it.
+    """
+    latencies = []
+    with create_session(1) as session:
+        for start in range(0, len(data), batch_size):
+            start_time = time.perf_counter()
+            inference.score_model(
+                url,
+                data.iloc[start : start + batch_size],
+                session,
+                timeout=(CONNECT_TIMEOUT, timeout),
+            )
+            latencies.append(time.perf_counter() - start_time)
+    return latencies
+
+
+def bench_main(
+    url: str,
+    input_path: str,
+    output_path: str,
+    batch_size: int,
+    timeout: float = READ_TIMEOUT,
+) -> List[float]:
+    """
+    Runs the inference CLI end to end: reading the input, scoring it through
+    the endpoint and writing the results.
+    """
+    argv = [
+        "inference",
+        "--input_data_path",
+        input_path,
+        "--output_data_path",
+        output_path,
+        "--endpoint_name",
+        url,
+        "--batch_size",
+        str(batch_size),
+        "--max_retries",
+        "10",
+        "--timeout",
+        str(timeout),
+    ]
+    with patch.object(sys, "argv", argv):
+        inference.main()
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark scoring against a local mock endpoint."
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--features", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--throttle_rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=READ_TIMEOUT)
+    parser.add_argument("--output", type=str, help="JSON file of the results.")
+    args = parser.parse_args()
+
+    endpoint = MockEndpoint(
+        train_booster(args.features),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        random_state=42,
+    )
+    results = {
+        "features": args.features,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "throttle_rate": args.throttle_rate,
+        "cases": [],
+    }
+    with endpoint, tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in args.rows:
+            data = make_batch(n_rows, args.features)
+            input_path = os.path.join(tmp_dir, f"input_{n_rows}.parquet")
+            output_path = os.path.join(tmp_dir, f"output_{n_rows}.parquet")
+            data.to_parquet(input_path, index=False)
+            for batch_size in args.batch_sizes:
+                if args.error_rate == 0 and args.throttle_rate == 0:
+                    # score_model does not retry, so it only runs without faults.
+                    results["cases"].append(
+                        {
+                            "flow": "score_model",
+                            "batch_size": batch_size,
+                            **measure(
+                                endpoint,
+                                lambda: bench_score_model(
+                                    endpoint.url, data, batch_size, args.timeout
+                                ),
+                                n_rows,
+                            ),
+                        }
+                    )
+                results["cases"].append(
+                    {
+                        "flow": "inference_main",
+                        "batch_size": batch_size,
+                        **measure(
+                            endpoint,
+                            lambda: bench_main(
+                                endpoint.url,
+                                input_path,
+                                output_path,
+                                batch_size,
+                                args.timeout,
+                            ),
+                            n_rows,
+                        ),
+                    }
+                )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
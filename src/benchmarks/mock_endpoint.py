@@ -0,0 +1,252 @@
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from src.models.metrics import apply_threshold, stored_threshold
+
+
+def train_booster(
+    n_features: int = 30, n_rows: int = 10_000, random_state: int = 42
+) -> xgb.Booster:
+    """
+    Small real model on synthetic data, so the endpoint does the prediction
+    work a served model does.
+    """
+    rng = np.random.default_rng(random_state)
+    features = rng.normal(size=(n_rows, n_features)).astype(np.float32)
+    labels = (features[:, 0] + rng.normal(size=n_rows) > 2).astype(np.int64)
+    dtrain = xgb.DMatrix(
+        features, label=labels, feature_names=[f"V{i}" for i in range(n_features)]
+    )
+    return xgb.train(
+        {"objective": "binary:logistic", "max_depth": 6, "nthread": 1},
+        dtrain,
+        num_boost_round=50,
+    )
+
+
+def parse_inputs(payload: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Frame of a serving request, either `dataframe_split` or column oriented
+    `inputs`.
+    """
+    if "dataframe_split" in payload:
+        split = payload["dataframe_split"]
+        return pd.DataFrame(split["data"], columns=split["columns"])
+    if "inputs" in payload:
+        return pd.DataFrame(payload["inputs"])
+    raise ValueError("Expected dataframe_split or inputs.")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = b"".join(chunks)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            body = zlib.decompress(body, 31)
+        return body
+
+    def _respond(
+        self,
+        status_code: int,
+        body: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        encoded = json.dumps(body).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_POST(self) -> None:
+        start_time = time.perf_counter()
+        endpoint = self.server.endpoint
+        body = self._read_body()
+        status_code = endpoint.inject()
+        if status_code == 429:
+            self._respond(
+                429,
+                {"error_code": "REQUEST_LIMIT_EXCEEDED"},
+                {"Retry-After": str(endpoint.retry_after)},
+            )
+        elif status_code != 200:
+            self._respond(status_code, {"error_code": "TEMPORARILY_UNAVAILABLE"})
+        else:
+            try:
+                predictions = endpoint.predict(parse_inputs(json.loads(body)))
+            except (ValueError, KeyError) as e:
+                status_code = 400
+                self._respond(400, {"error_code": "BAD_REQUEST", "message": str(e)})
+            else:
+                if endpoint.latency:
+                    time.sleep(endpoint.latency)
+                self._respond(200, {"predictions": predictions})
+        endpoint.record(status_code, time.perf_counter() - start_time)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    endpoint: "MockEndpoint"
+
+
+class MockEndpoint:
+    """
+    Local stand-in for the model serving endpoint. It accepts the requests
+    `score_model` and `ScoringClient` send, plain, gzipped or chunked, scores
+    them with a real booster and can add latency, server errors and
+    throttling. Every request is recorded with its status and service time.
+    """
+
+    def __init__(
+        self,
+        booster: xgb.Booster,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        random_state: Optional[int] = None,
+    ):
+        """
+        param booster: model scoring the requests at its stored decision
+            threshold, like the served model
+        param latency: seconds added to every successful request
+        param error_rate: share of requests answered with 503
+        param throttle_rate: share of requests answered with 429
+        param retry_after: seconds sent in the Retry-After header of a 429
+        param host: address to listen on
+        param port: port to listen on, a free one if 0
+        param random_state: seed of the injected failures
+        """
+        self.booster = booster
+        self.booster.set_param({"nthread": 1})
+        self.threshold = stored_threshold(booster)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(random_state)
+        self.lock = threading.Lock()
+        self.statuses: List[int] = []
+        self.service_times: List[float] = []
+        self.server = _Server((host, port), _Handler)
+        self.server.endpoint = self
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/invocations"
+
+    def inject(self) -> int:
+        with self.lock:
+            draw = self.random.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 503
+        return 200
+
+    def predict(self, data: pd.DataFrame) -> List[int]:
+        feature_names = self.booster.feature_names or [
+            column for column in data.columns if column != "id"
+        ]
+        features = data[feature_names].to_numpy(dtype=np.float32)
+        return apply_threshold(
+            self.booster.inplace_predict(features), self.threshold
+        ).tolist()
+
+    def record(self, status_code: int, seconds: float) -> None:
+        with self.lock:
+            self.statuses.append(status_code)
+            self.service_times.append(seconds)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.statuses.clear()
+            self.service_times.clear()
+
+    def start(self) -> "MockEndpoint":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self) -> "MockEndpoint":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock scoring endpoint.")
+    parser.add_argument("--model_path", type=str, help="Model file, trained if unset.")
+    parser.add_argument("--features", type=int, default=30)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--throttle_rate", type=float, default=0.0)
+    parser.add_argument("--retry_after", type=float, default=0.0)
+    args = parser.parse_args()
+
+    booster = (
+        xgb.Booster(model_file=args.model_path)
+        if args.model_path
+        else train_booster(args.features)
+    )
+    endpoint = MockEndpoint(
+        booster,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        port=args.port,
+    )
+    print(f"Serving on {endpoint.url}", flush=True)
+    try:
+        endpoint.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        endpoint.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+from src.data.preprocessing import preprocess
+
+TARGET = "Class"
+
+
+def make_dataset(
+    n_rows: int, n_features: int, minority_share: float, random_state: int = 42
+) -> pd.DataFrame:
+    """
+    Synthetic training data shaped like ours: an id, float32 features and a
+    rare positive class.
+    """
+    rng = np.random.default_rng(random_state)
+    data = pd.DataFrame(
+        rng.normal(size=(n_rows, n_features)).astype(np.float32),
+        columns=[f"V{i}" for i in range(n_features)],
+    )
+    data.insert(0, "id", np.arange(n_rows))
+    data[TARGET] = (rng.random(n_rows) < minority_share).astype(np.int64)
+    return data
+
+
+def mask_preprocess(data: pd.DataFrame, target_column: str):
+    """
+    The previous implementation, kept as the baseline: boolean masks, frame
+    subsets and a concat.
+    """
+    data = data.set_index("id")
+    minority_class = data[data[target_column] == 1]
+    majority_class = data[data[target_column] == 0]
+    majority_class_undersampled = majority_class.sample(
+        n=len(minority_class), random_state=42
+    )
+    data = pd.concat([majority_class_undersampled, minority_class])
+    return data.drop(target_column, axis=1), data[target_column]
+
+
+def measure(func: Callable[[], object], input_bytes: int) -> Dict[str, float]:
+    """
+    Wall time and peak traced allocations of `func`, relative to the input size.
+    """
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": round(seconds, 4),
+        "peak_mb": round(peak / 1024**2, 2),
+        "peak_to_input": round(peak / input_bytes, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark class rebalancing.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--features", type=int, default=30)
+    parser.add_argument("--minority_share", type=float, default=0.01)
+    args = parser.parse_args()
+
+    data = make_dataset(args.rows, args.features, args.minority_share)
+    input_bytes = int(data.memory_usage(index=False).sum())
+    results = {
+        "rows": args.rows,
+        "input_mb": round(input_bytes / 1024**2, 2),
+        "mask_concat": measure(lambda: mask_preprocess(data, TARGET), input_bytes),
+    }
+    for strategy in ("undersample", "class_weight"):
+        results[strategy] = measure(
+            lambda: preprocess(data, TARGET, strategy=strategy), input_bytes
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
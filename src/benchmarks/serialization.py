@@ -0,0 +1,89 @@
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+from src.inference.inference import prepare_dataset
+from src.inference.serialization import encode_payload
+
+
+def make_batch(n_rows: int, n_features: int, random_state: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(random_state)
+    data = pd.DataFrame(
+        rng.normal(size=(n_rows, n_features)).astype(np.float32),
+        columns=[f"V{i}" for i in range(n_features)],
+    )
+    data.insert(0, "id", np.arange(n_rows))
+    return data
+
+
+def split_payload(data: pd.DataFrame) -> bytes:
+    """
+    The previous path: a Python object per cell, then one string.
+    """
+    return json.dumps(prepare_dataset(data), allow_nan=True).encode("utf-8")
+
+
+def consume(body) -> int:
+    if isinstance(body, bytes):
+        return len(body)
+    return sum(len(piece) for piece in body)
+
+
+def measure(func: Callable[[], int], n_rows: int, repeats: int) -> Dict[str, float]:
+    """
+    Throughput of the bytes sent over the wire and peak traced allocations.
+    Tracing slows allocations down, so it runs separately from the timing.
+    """
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        n_bytes = func()
+    seconds = (time.perf_counter() - start_time) / repeats
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "body_mb": round(n_bytes / 1024**2, 2),
+        "seconds": round(seconds, 4),
+        "mb_per_sec": round(n_bytes / 1024**2 / seconds, 1),
+        "rows_per_sec": round(n_rows / seconds),
+        "peak_mb": round(peak / 1024**2, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request serialization.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--features", type=int, default=30)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    data = make_batch(args.rows, args.features)
+    results = {
+        "rows": args.rows,
+        "dataframe_split": measure(
+            lambda: len(split_payload(data)), args.rows, args.repeats
+        ),
+    }
+    for name, compress, stream in [
+        ("columns", False, False),
+        ("columns_stream", False, True),
+        ("columns_gzip_stream", True, True),
+    ]:
+        results[name] = measure(
+            lambda: consume(encode_payload(data, compress, stream)[0]),
+            args.rows,
+            args.repeats,
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import argparse
+import cProfile
+import functools
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence
+from unittest.mock import patch
+
+import numpy as np
+import optuna
+import pandas as pd
+
+from src.config.modelling import FEATURE_DTYPE, TARGET
+from src.data.features import FeaturePipeline
+from src.models.model_definitions import ModelOptimization
+from src.models.model_registry import LocalModelRegistry
+from src.training import train
+from src.utils.memory import RssSampler, peak_rss
+
+
+def make_fraud_dataset(
+    n_rows: int,
+    n_features: int = 28,
+    fraud_rate: float = 0.002,
+    random_state: int = 42,
+) -> pd.DataFrame:
+    """
+    Synthetic transactions shaped like the credit card fraud data: an id,
+    anonymized float32 features, a skewed amount and a rare positive class
+    whose features are shifted, so the search has something to learn.
+    """
+    rng = np.random.default_rng(random_state)
+    fraud = rng.random(n_rows) < fraud_rate
+    features = rng.normal(size=(n_rows, n_features)).astype(FEATURE_DTYPE)
+    shift = rng.normal(scale=1.5, size=n_features).astype(FEATURE_DTYPE)
+    features[fraud] += shift
+
+    data = pd.DataFrame(features, columns=[f"V{i + 1}" for i in range(n_features)])
+    data.insert(0, "id", np.arange(n_rows))
+    data["Amount"] = rng.lognormal(3, 1.5, n_rows).astype(FEATURE_DTYPE)
+    data[TARGET] = fraud.astype(np.int64)
+    return data
+
+
+class StageProfiler:
+    """
+    Accumulates wall time, CPU time of all threads and peak RSS per pipeline
+    stage, and optionally a cProfile dump per stage. Calls made while another
+    stage is running count towards the outer stage.
+    """
+
+    def __init__(self, profile_dir: Optional[str] = None):
+        """
+        param profile_dir: directory of the `<stage>.prof` dumps, none if not set
+        """
+        self.profile_dir = profile_dir
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self.active: Optional[str] = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if self.active is not None:
+            yield
+            return
+
+        profile = None
+        if self.profile_dir:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+        self.active = name
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            with RssSampler() as rss:
+                if profile is not None:
+                    profile.enable()
+                try:
+                    yield
+                finally:
+                    if profile is not None:
+                        profile.disable()
+        finally:
+            self.active = None
+            stats = self.stages.setdefault(
+                name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0}
+            )
+            stats["calls"] += 1
+            stats["wall_seconds"] += time.perf_counter() - wall_start
+            stats["cpu_seconds"] += time.process_time() - cpu_start
+            stats["peak_rss_mb"] = max(
+                stats.get("peak_rss_mb", 0.0), rss.peak / 1024**2
+            )
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def dump(self) -> None:
+        if not self.profile_dir:
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        for name, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {
+                key: round(value, 4) if isinstance(value, float) else value
+                for key, value in stats.items()
+            }
+            for name, stats in self.stages.items()
+        }
+
+
+def run_pipeline(
+    data_path: str,
+    registry_dir: str,
+    profiler: StageProfiler,
+    train_args: Sequence[str] = (),
+) -> Dict[str, Any]:
+    """
+    Runs `src.training.train.main` on a local file with the local registry in
+    `registry_dir`. Its stages are timed by patching the functions they run in.
+    """
+    registered = []
+    # Created up front, so the one-off database setup is not timed as a stage.
+    registry = LocalModelRegistry(registry_dir)
+    registry._experiment_id()
+    push_model = registry.push_model
+
+    def push(model, score, name, **kwargs):
+        registered.append(score)
+        return push_model(model, score, name, **kwargs)
+
+    registry.push_model = profiler.wrap("registry", push)
+
+    argv = ["train", "--data_path", data_path, "--model_name", "benchmark"]
+    stages = [
+        (train, "load_data", "load"),
+        (train, "preprocess", "preprocess"),
+        (FeaturePipeline, "fit", "features"),
+        (FeaturePipeline, "transform_frame", "features"),
+        (optuna.study.Study, "optimize", "trials"),
+        (ModelOptimization, "_fit", "refit"),
+    ]
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(sys, "argv", argv + list(train_args)))
+        stack.enter_context(
+            patch.object(train, "get_registry", lambda backend: registry)
+        )
+        for owner, attribute, stage in stages:
+            original = owner.__dict__[attribute]
+            if isinstance(original, classmethod):
+                wrapped = classmethod(profiler.wrap(stage, original.__func__))
+            else:
+                wrapped = profiler.wrap(stage, original)
+            stack.enter_context(patch.object(owner, attribute, wrapped))
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        train.main()
+
+    return {
+        "registered": bool(registered),
+        "score": registered[0] if registered else None,
+        "wall_seconds": round(time.perf_counter() - wall_start, 4),
+        "cpu_seconds": round(time.process_time() - cpu_start, 4),
+        "peak_rss_mb": round(peak_rss() / 1024**2, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark and profile the training pipeline on synthetic data."
+    )
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--features", type=int, default=28)
+    parser.add_argument("--fraud_rate", type=float, default=0.002)
+    parser.add_argument("--profile_dir", type=str, help="Per stage cProfile dumps.")
+    parser.add_argument("--output", type=str, help="JSON file of the results.")
+    args, train_args = parser.parse_known_args()
+
+    profiler = StageProfiler(args.profile_dir)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data = make_fraud_dataset(args.rows, args.features, args.fraud_rate)
+        data_path = os.path.join(tmp_dir, "train.parquet")
+        data.to_parquet(data_path, index=False)
+        del data
+        result = run_pipeline(
+            data_path, os.path.join(tmp_dir, "registry"), profiler, train_args
+        )
+    profiler.dump()
+
+    results = {
+        "rows": args.rows,
+        "features": args.features,
+        "fraud_rate": args.fraud_rate,
+        "train_args": train_args,
+        "cpu_count": os.cpu_count(),
+        **result,
+        "stages": profiler.report(),
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
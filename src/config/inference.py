@@ -0,0 +1,19 @@
+import os
+
+BATCH_SIZE = 5000
+CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+CONNECT_TIMEOUT = 10
+# Generous, a scale-to-zero endpoint answers slowly while it starts.
+READ_TIMEOUT = 300
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+CHUNK_SIZE = 100_000
+MODEL_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "thesis_mlops", "models"
+)
+MICRO_BATCH_SIZE = 256
+MICRO_BATCH_LATENCY = 0.005
+PREDICTION_CACHE_TTL = 7 * 24 * 3600
+PREDICTION_CACHE_MAX_ENTRIES = 10_000_000
@@ -1,2 +1,6 @@
 TARGET = "Class"
 PERFORMANCE_THRESHOLD = 0.8
+FEATURE_DTYPE = "float32"
+CHUNK_SIZE = 100_000
+MEMORY_BUDGET_MB = 1024
+INCREMENTAL_ROUNDS = 100
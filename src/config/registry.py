@@ -0,0 +1,11 @@
+import os
+
+REGISTRY_BACKEND = os.getenv("MODEL_REGISTRY_BACKEND", "databricks")
+CATALOG_NAME = "workspace"
+SCHEMA_NAME = "default"
+EXPERIMENT_NAME = "fraud_detection_model_registry_experiment"
+# Tracking database, artifacts and deployed endpoints of the local backend.
+LOCAL_REGISTRY_DIR = os.getenv(
+    "LOCAL_REGISTRY_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "thesis_mlops", "registry"),
+)
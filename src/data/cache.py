@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import os
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 5 * 1024**3
+
+
+class S3DataCache:
+    """
+    On-disk cache of parsed S3 data files, keyed by bucket, key and ETag, so a
+    changed object never serves stale data. Entries are uncompressed Arrow IPC
+    files read through a memory map, the least recently used ones are evicted
+    once the cache grows over `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        param cache_dir: directory holding the cached files
+        param max_bytes: maximum total size of the cache
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(
+        self,
+        bucket_name: str,
+        file_key: str,
+        etag: str,
+        columns: Optional[List[str]],
+        feature_dtype: Optional[str],
+    ) -> str:
+        entry_key = f"{bucket_name}/{file_key}/{etag}/{columns}/{feature_dtype}"
+        digest = hashlib.sha256(entry_key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.arrow")
+
+    def get(
+        self,
+        bucket_name: str,
+        file_key: str,
+        etag: str,
+        columns: Optional[List[str]] = None,
+        feature_dtype: Optional[str] = None,
+    ) -> Optional[pd.DataFrame]:
+        path = self._entry_path(bucket_name, file_key, etag, columns, feature_dtype)
+        # A parallel loader may evict the entry at any point, which is a miss.
+        try:
+            os.utime(path)
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+        except FileNotFoundError:
+            return None
+
+        logger.info(f"Cache hit for s3://{bucket_name}/{file_key}.")
+        return table.to_pandas(split_blocks=True)
+
+    def put(
+        self,
+        bucket_name: str,
+        file_key: str,
+        etag: str,
+        data: pd.DataFrame,
+        columns: Optional[List[str]] = None,
+        feature_dtype: Optional[str] = None,
+    ) -> None:
+        path = self._entry_path(bucket_name, file_key, etag, columns, feature_dtype)
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self) -> None:
+        # Parallel loaders evict concurrently, entries another one removed
+        # in the meantime are skipped.
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".arrow"):
+                continue
+            try:
+                entries.append((entry, entry.stat()))
+            except FileNotFoundError:
+                continue
+        entries.sort(key=lambda item: item[1].st_mtime)
+        total_bytes = sum(stat.st_size for _, stat in entries)
+
+        for entry, stat in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            total_bytes -= stat.st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            logger.info(f"Evicted {entry.name} from the data cache.")
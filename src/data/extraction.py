@@ -1,62 +1,409 @@
-from io import StringIO
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from io import BytesIO, StringIO
+from typing import Any, Dict, Iterator, List, Optional
 
 import boto3
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.config import Config
 from dotenv import load_dotenv
 
+from src.config.modelling import TARGET
+from src.data.cache import S3DataCache
 from src.utils.aws import parse_s3_path
+from src.utils.instrumentation import count
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
 
-def load_data(file_path: str) -> pd.DataFrame:
+FILE_FORMATS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet"}
+PARQUET_COMPRESSION = "zstd"
+NON_FEATURE_COLUMNS = ("id", TARGET)
+PARTITION_DATE_PATTERN = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})")
+
+
+def detect_format(file_path: str) -> str:
+    """
+    Detects the file format from the extension, CSV is assumed when unknown.
+    """
+    return FILE_FORMATS.get(os.path.splitext(file_path)[1].lower(), "csv")
+
+
+def _cast_features(data: pd.DataFrame, feature_dtype: Optional[str]) -> pd.DataFrame:
+    if feature_dtype is None:
+        return data
+
+    return data.astype(
+        {
+            column: feature_dtype
+            for column in data.columns
+            if column not in NON_FEATURE_COLUMNS
+        }
+    )
+
+
+def _read_parquet(
+    source, columns: Optional[List[str]], feature_dtype: Optional[str]
+) -> pd.DataFrame:
+    table = pq.read_table(source, columns=columns)
+    if feature_dtype is not None:
+        target_type = pa.from_numpy_dtype(feature_dtype)
+        table = table.cast(
+            pa.schema(
+                field
+                if field.name in NON_FEATURE_COLUMNS
+                else field.with_type(target_type)
+                for field in table.schema
+            )
+        )
+
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def _read_frame(
+    source,
+    file_format: str,
+    columns: Optional[List[str]] = None,
+    feature_dtype: Optional[str] = None,
+) -> pd.DataFrame:
+    if file_format == "parquet":
+        return _read_parquet(source, columns, feature_dtype)
+
+    return _cast_features(pd.read_csv(source, usecols=columns), feature_dtype)
+
+
+def load_data(
+    file_path: str,
+    columns: Optional[List[str]] = None,
+    feature_dtype: Optional[str] = None,
+    cache: Optional[S3DataCache] = None,
+) -> pd.DataFrame:
+    """
+    Loads a CSV or Parquet file from a local path or S3.
+
+    param file_path: local path or S3 path/prefix
+    param columns: columns to load, all if not set
+    param feature_dtype: dtype of the feature columns, e.g. float32
+    param cache: local cache for S3 files, not used if not set
+    return: loaded data
+    """
     if file_path.startswith("s3://"):
-        df = load_data_from_s3(*parse_s3_path(file_path))
+        df = load_data_from_s3(
+            *parse_s3_path(file_path),
+            columns=columns,
+            feature_dtype=feature_dtype,
+            cache=cache,
+        )
     else:
-        df = pd.read_csv(file_path)
+        df = _read_frame(file_path, detect_format(file_path), columns, feature_dtype)
 
     return df
 
 
+def resolve_data_path(file_path: str) -> str:
+    """
+    Resolves the exact file that `load_data` would read. For S3 prefixes this is
+    the most recent file under the prefix, local paths are returned unchanged.
+
+    param file_path: local path or S3 path/prefix
+    return: path of a single file
+    """
+    if file_path.startswith("s3://"):
+        bucket_name, prefix = parse_s3_path(file_path)
+        s3_client = boto3.client("s3")
+        file_key = find_most_recent_file_in_s3(s3_client, bucket_name, prefix)
+        return f"s3://{bucket_name}/{file_key}"
+
+    return file_path
+
+
+def _iter_parquet(source, chunk_size: int, skip_rows: int) -> Iterator[pd.DataFrame]:
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+        if skip_rows >= batch.num_rows:
+            skip_rows -= batch.num_rows
+            continue
+
+        yield batch.slice(skip_rows).to_pandas()
+        skip_rows = 0
+
+
+def load_data_in_chunks(
+    file_path: str, chunk_size: int, skip_rows: int = 0
+) -> Iterator[pd.DataFrame]:
+    """
+    Reads a single CSV or Parquet file chunk by chunk, so only `chunk_size` rows
+    are held in memory at once. S3 CSV objects are parsed straight from the
+    response stream, Parquet needs random access and is buffered undecoded.
+
+    param file_path: local path or S3 path of the file (see `resolve_data_path`)
+    param chunk_size: number of rows per chunk
+    param skip_rows: number of data rows to skip, used to resume a partial run
+    return: iterator over chunks
+    """
+    file_format = detect_format(file_path)
+
+    if file_path.startswith("s3://"):
+        bucket_name, file_key = parse_s3_path(file_path)
+        s3_client = boto3.client("s3")
+        response = s3_client.get_object(Bucket=bucket_name, Key=file_key)
+        source = response["Body"]
+        if file_format == "parquet":
+            source = pa.BufferReader(source.read())
+    else:
+        source = file_path
+
+    if file_format == "parquet":
+        yield from _iter_parquet(source, chunk_size, skip_rows)
+        return
+
+    skiprows = range(1, skip_rows + 1) if skip_rows else None
+    with pd.read_csv(source, chunksize=chunk_size, skiprows=skiprows) as reader:
+        yield from reader
+
+
 def save_data(data: pd.DataFrame, file_path: str) -> None:
     if file_path.startswith("s3://"):
         save_data_to_s3(data, *parse_s3_path(file_path))
+    elif detect_format(file_path) == "parquet":
+        data.to_parquet(file_path, compression=PARQUET_COMPRESSION, index=False)
     else:
         data.to_csv(file_path)
 
 
-def load_data_from_s3(bucket_name: str, file_key: str) -> pd.DataFrame:
+def _load_s3_object(
+    s3_client: boto3.client,
+    bucket_name: str,
+    file_key: str,
+    columns: Optional[List[str]] = None,
+    feature_dtype: Optional[str] = None,
+    cache: Optional[S3DataCache] = None,
+    etag: Optional[str] = None,
+) -> pd.DataFrame:
+    request = {"Bucket": bucket_name, "Key": file_key}
+    if cache is not None:
+        etag = etag or s3_client.head_object(**request)["ETag"]
+        data = cache.get(bucket_name, file_key, etag, columns, feature_dtype)
+        if data is not None:
+            return data
+        request["IfMatch"] = etag
+
+    response = s3_client.get_object(**request)
+    count("s3_bytes_read", response.get("ContentLength", 0))
+    file_format = detect_format(file_key)
+    if file_format == "parquet":
+        source = pa.BufferReader(response["Body"].read())
+    else:
+        source = response["Body"]
+    data = _read_frame(source, file_format, columns, feature_dtype)
+
+    if cache is not None:
+        cache.put(bucket_name, file_key, etag, data, columns, feature_dtype)
+    return data
+
+
+def load_data_from_s3(
+    bucket_name: str,
+    file_key: str,
+    columns: Optional[List[str]] = None,
+    feature_dtype: Optional[str] = None,
+    cache: Optional[S3DataCache] = None,
+) -> pd.DataFrame:
     s3_client = boto3.client("s3")
     most_recent_data_key = find_most_recent_file_in_s3(s3_client, bucket_name, file_key)
-    response = s3_client.get_object(Bucket=bucket_name, Key=most_recent_data_key)
-    data = response["Body"].read().decode("utf-8")
-    return pd.read_csv(StringIO(data))
+    return _load_s3_object(
+        s3_client, bucket_name, most_recent_data_key, columns, feature_dtype, cache
+    )
+
+
+def create_s3_client(max_pool_connections: int = 10) -> boto3.client:
+    """
+    Creates a S3 client whose connection pool can serve `max_pool_connections`
+    threads at once. Clients are thread safe, so one is shared by all workers.
+    """
+    return boto3.client("s3", config=Config(max_pool_connections=max_pool_connections))
+
+
+def partition_date(s3_object: Dict[str, Any]) -> date:
+    """
+    Date of a daily partition, taken from the key (e.g. `date=2025-06-01/` or
+    `20250601.csv`) and falling back to the object's modification date.
+    """
+    match = PARTITION_DATE_PATTERN.search(s3_object["Key"])
+    if match:
+        try:
+            return date(*map(int, match.groups()))
+        except ValueError:
+            pass
+
+    return s3_object["LastModified"].date()
+
+
+def select_partitions(
+    s3_objects: List[Dict[str, Any]],
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    latest_n: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Selects partitions within the inclusive date range, keeping only the latest
+    `latest_n` of them if set. The result is ordered from oldest to newest.
+    """
+    selected = sorted(
+        (
+            s3_object
+            for s3_object in s3_objects
+            if (start_date is None or partition_date(s3_object) >= start_date)
+            and (end_date is None or partition_date(s3_object) <= end_date)
+        ),
+        key=lambda s3_object: (partition_date(s3_object), s3_object["Key"]),
+    )
+    return selected[-latest_n:] if latest_n else selected
+
+
+def _find_partitions(
+    s3_client: boto3.client,
+    bucket_name: str,
+    prefix: str,
+    start_date: Optional[date],
+    end_date: Optional[date],
+    latest_n: Optional[int],
+) -> List[Dict[str, Any]]:
+    partitions = select_partitions(
+        list_s3_files(s3_client, bucket_name, prefix), start_date, end_date, latest_n
+    )
+    if not partitions:
+        raise ValueError(
+            f"No partitions selected in bucket {bucket_name} with prefix {prefix}"
+        )
+
+    return partitions
+
+
+def load_dataset_from_s3(
+    bucket_name: str,
+    prefix: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    latest_n: Optional[int] = None,
+    max_workers: int = 8,
+    columns: Optional[List[str]] = None,
+    feature_dtype: Optional[str] = None,
+    cache: Optional[S3DataCache] = None,
+) -> pd.DataFrame:
+    """
+    Loads all partitions under the prefix that match the selection, downloading
+    and parsing them concurrently, and concatenates them into one frame.
+
+    param bucket_name: name of the bucket
+    param prefix: prefix the partitions are stored under
+    param start_date: first partition date to load
+    param end_date: last partition date to load
+    param latest_n: load only the newest `latest_n` selected partitions
+    param max_workers: number of concurrent downloads
+    param columns: columns to load, all if not set
+    param feature_dtype: dtype of the feature columns, e.g. float32
+    param cache: local cache for the partitions, not used if not set
+    return: concatenated partitions, oldest first
+    """
+    s3_client = create_s3_client(max_pool_connections=max_workers)
+    partitions = _find_partitions(
+        s3_client, bucket_name, prefix, start_date, end_date, latest_n
+    )
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(
+            executor.map(
+                lambda s3_object: _load_s3_object(
+                    s3_client,
+                    bucket_name,
+                    s3_object["Key"],
+                    columns,
+                    feature_dtype,
+                    cache,
+                    s3_object.get("ETag"),
+                ),
+                partitions,
+            )
+        )
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_dataset_in_chunks(
+    bucket_name: str,
+    prefix: str,
+    chunk_size: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    latest_n: Optional[int] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Streams the selected partitions chunk by chunk, oldest first, so a history
+    window of any length is never held in memory at once.
+
+    param bucket_name: name of the bucket
+    param prefix: prefix the partitions are stored under
+    param chunk_size: number of rows per chunk
+    param start_date: first partition date to load
+    param end_date: last partition date to load
+    param latest_n: load only the newest `latest_n` selected partitions
+    return: iterator over chunks
+    """
+    s3_client = boto3.client("s3")
+    partitions = _find_partitions(
+        s3_client, bucket_name, prefix, start_date, end_date, latest_n
+    )
+    for s3_object in partitions:
+        yield from load_data_in_chunks(
+            f"s3://{bucket_name}/{s3_object['Key']}", chunk_size
+        )
 
 
 def save_data_to_s3(df: pd.DataFrame, bucket_name: str, file_key: str) -> None:
     try:
-        csv_buffer = StringIO()
-        df.to_csv(csv_buffer, index=False)
+        if detect_format(file_key) == "parquet":
+            buffer = BytesIO()
+            df.to_parquet(buffer, compression=PARQUET_COMPRESSION, index=False)
+        else:
+            buffer = StringIO()
+            df.to_csv(buffer, index=False)
         s3_client = boto3.client("s3")
-        s3_client.put_object(
-            Bucket=bucket_name, Key=file_key, Body=csv_buffer.getvalue()
-        )
-        print(f"Data saved to {bucket_name}/{file_key}")
+        s3_client.put_object(Bucket=bucket_name, Key=file_key, Body=buffer.getvalue())
+        logger.info(f"Data saved to {bucket_name}/{file_key}")
     except Exception as e:
-        print(f"Error saving data to S3: {e}")
+        logger.error(f"Error saving data to S3: {e}")
         raise e
 
 
+def list_s3_files(
+    s3_client: boto3.client, bucket_name: str, prefix: str
+) -> List[Dict[str, Any]]:
+    """
+    Lists all data files under the prefix, following pagination past the
+    1000 keys returned by a single `list_objects_v2` call.
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    return [
+        obj
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+        for obj in page.get("Contents", [])
+        if os.path.splitext(obj["Key"])[1].lower() in FILE_FORMATS
+    ]
+
+
 def find_most_recent_file_in_s3(
     s3_client: boto3.client, bucket_name: str, prefix: str
 ) -> str:
-    response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-    csv_files = [
-        obj for obj in response.get("Contents", []) if obj["Key"].endswith(".csv")
-    ]
-    if not csv_files:
+    data_files = list_s3_files(s3_client, bucket_name, prefix)
+    if not data_files:
         raise ValueError(f"No files found in bucket {bucket_name} with prefix {prefix}")
 
-    most_recent_csv = max(response["Contents"], key=lambda x: x["LastModified"])["Key"]
+    most_recent_file = max(data_files, key=lambda x: x["LastModified"])["Key"]
 
-    return most_recent_csv
+    return most_recent_file
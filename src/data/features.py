@@ -0,0 +1,104 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.config.modelling import FEATURE_DTYPE
+
+logger = logging.getLogger(__name__)
+
+FEATURE_PIPELINE_FILE = "feature_pipeline.json"
+FILL_STRATEGIES = ("none", "median")
+
+
+class FeaturePipeline:
+    """
+    Fitted feature transform shared by training and inference. It records the
+    feature columns in model order, their dtype and the values missing features
+    are filled with, and applies them to a frame in one vectorized pass.
+    """
+
+    def __init__(
+        self,
+        columns: List[str],
+        dtype: str = FEATURE_DTYPE,
+        fill_values: Optional[List[float]] = None,
+    ):
+        """
+        param columns: feature columns in the order the model expects
+        param dtype: dtype of the feature matrix
+        param fill_values: value per column replacing NaN, kept as NaN if not set
+        """
+        self.columns = list(columns)
+        self.dtype = dtype
+        self.fill_values = (
+            None if fill_values is None else np.asarray(fill_values, dtype=dtype)
+        )
+
+    @classmethod
+    def fit(
+        cls,
+        X: pd.DataFrame,
+        fill_strategy: str = "none",
+        dtype: str = FEATURE_DTYPE,
+    ) -> "FeaturePipeline":
+        """
+        Fits the pipeline on the training features.
+
+        param X: training features, without id and target
+        param fill_strategy: "median" fills NaN with the training median, "none"
+            leaves them to XGBoost's missing value handling
+        param dtype: dtype of the feature matrix
+        return: fitted pipeline
+        """
+        if fill_strategy not in FILL_STRATEGIES:
+            raise ValueError(f"Unknown fill strategy {fill_strategy}.")
+
+        fill_values = None
+        if fill_strategy == "median":
+            medians = np.nanmedian(X.to_numpy(dtype=dtype), axis=0)
+            fill_values = np.nan_to_num(medians, nan=0.0).tolist()
+        return cls(list(X.columns), dtype, fill_values)
+
+    def transform(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        Selects the feature columns in model order and returns them as a single
+        contiguous array, other columns such as the id are ignored.
+        """
+        missing = [column for column in self.columns if column not in data.columns]
+        if missing:
+            raise ValueError(f"Data is missing feature columns {missing}.")
+
+        features = np.ascontiguousarray(data[self.columns].to_numpy(dtype=self.dtype))
+        if self.fill_values is not None:
+            np.copyto(features, self.fill_values, where=np.isnan(features))
+        return features
+
+    def transform_frame(self, data: pd.DataFrame) -> pd.DataFrame:
+        return pd.DataFrame(
+            self.transform(data), columns=self.columns, index=data.index
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "columns": self.columns,
+            "dtype": self.dtype,
+            "fill_values": None
+            if self.fill_values is None
+            else self.fill_values.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "FeaturePipeline":
+        return cls(state["columns"], state["dtype"], state["fill_values"])
+
+    def save(self, file_path: str) -> None:
+        with open(file_path, "w") as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, file_path: str) -> "FeaturePipeline":
+        with open(file_path) as file:
+            return cls.from_dict(json.load(file))
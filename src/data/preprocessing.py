@@ -1,26 +1,189 @@
-from typing import Tuple
+import logging
+from typing import Dict, Iterable, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
+
+REBALANCE_STRATEGIES = ("undersample", "class_weight")
+
+
+def rebalance_indices(
+    target: np.ndarray,
+    strategy: str = "undersample",
+    ratio: float = 1.0,
+    random_state: int = 42,
+) -> Tuple[np.ndarray, Optional[Dict[int, float]]]:
+    """
+    Rebalances a binary target by row positions only, no data is copied. With
+    "undersample" the majority class is sampled down to `ratio` times the size
+    of the minority class, with "class_weight" all rows are kept and the
+    minority class is weighted up to the same effective ratio instead.
+
+    param target: binary target, 1 marks the minority class
+    param strategy: one of `REBALANCE_STRATEGIES`
+    param ratio: majority to minority ratio after rebalancing
+    param random_state: random state for reproducibility
+    return: sorted positions of the kept rows and the class weights, if any
+    """
+    if strategy not in REBALANCE_STRATEGIES:
+        raise ValueError(f"Unknown rebalance strategy {strategy}.")
+
+    is_minority = target == 1
+    n_minority = int(np.count_nonzero(is_minority))
+    n_majority = len(target) - n_minority
+
+    if strategy == "class_weight":
+        weight = n_majority / (ratio * n_minority) if n_minority else 1.0
+        return np.arange(len(target)), {0: 1.0, 1: weight}
+
+    n_sampled = min(n_majority, int(round(ratio * n_minority)))
+    rng = np.random.default_rng(random_state)
+    sampled = rng.choice(np.flatnonzero(~is_minority), n_sampled, replace=False)
+    positions = np.concatenate([np.flatnonzero(is_minority), sampled])
+    positions.sort()
+    return positions, None
+
 
 def preprocess(
-    data: pd.DataFrame, target_column: str
-) -> Tuple[pd.DataFrame, pd.Series]:
+    data: pd.DataFrame,
+    target_column: str,
+    strategy: str = "undersample",
+    ratio: float = 1.0,
+) -> Tuple[pd.DataFrame, pd.Series, Optional[Dict[int, float]]]:
     """
-    Preprocessing the data for TRAINING step.
+    Preprocessing the data for TRAINING step. The features of the kept rows are
+    taken from the data in a single copy and indexed by id. When all rows are
+    kept only the columns are selected, skipping the row gather.
 
     param data: data to be preprocessed
     param target_column: name of the target column
-    return: preprocessed data
+    param strategy: rebalancing strategy, see `rebalance_indices`
+    param ratio: majority to minority ratio after rebalancing
+    return: preprocessed data and the class weights, if any
     """
+    positions, class_weight = rebalance_indices(
+        data[target_column].to_numpy(), strategy, ratio
+    )
+    feature_positions = [
+        i
+        for i, column in enumerate(data.columns)
+        if column not in ("id", target_column)
+    ]
+    index = pd.Index(data["id"].to_numpy()[positions], name="id")
 
-    data = data.set_index("id")
-    minority_class = data[data[target_column] == 1]
-    majority_class = data[data[target_column] == 0]
-
-    majority_class_undersampled = majority_class.sample(
-        n=len(minority_class), random_state=42
+    if len(positions) == len(data):
+        X = data.iloc[:, feature_positions]
+    else:
+        X = data.iloc[positions, feature_positions]
+    X.index = index
+    y = pd.Series(
+        data[target_column].to_numpy()[positions], index=index, name=target_column
     )
+    return X, y, class_weight
+
 
-    data = pd.concat([majority_class_undersampled, minority_class])
-    return data.drop(target_column, axis=1), data[target_column]
+class ReservoirSampler:
+    """
+    Uniform sample of at most `capacity` rows of a stream (reservoir sampling,
+    Algorithm R), updated a whole chunk at a time.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        n_columns: int,
+        rng: np.random.Generator,
+        dtype: str = "float32",
+    ):
+        """
+        param capacity: maximum number of rows kept
+        param n_columns: number of columns of the rows
+        param rng: random generator
+        param dtype: dtype the rows are stored in
+        """
+        self.capacity = capacity
+        self.rows = np.empty((capacity, n_columns), dtype=dtype)
+        self.rng = rng
+        self.size = 0
+        self.seen = 0
+
+    def add(self, rows: np.ndarray) -> None:
+        free = min(self.capacity - self.size, len(rows))
+        self.rows[self.size : self.size + free] = rows[:free]
+        self.size += free
+
+        rest = rows[free:]
+        if len(rest):
+            # Row t of the stream replaces a random slot with probability
+            # capacity / (t + 1), later rows win if they draw the same slot.
+            positions = self.seen + free + np.arange(len(rest))
+            slots = self.rng.integers(0, positions + 1)
+            kept = slots < self.capacity
+            self.rows[slots[kept]] = rest[kept]
+        self.seen += len(rows)
+
+    def sample(self, n: Optional[int] = None) -> np.ndarray:
+        rows = self.rows[: self.size]
+        if n is None or n >= self.size:
+            return rows
+
+        return rows[np.sort(self.rng.choice(self.size, n, replace=False))]
+
+
+def undersample_in_chunks(
+    chunks: Iterable[pd.DataFrame],
+    target_column: str,
+    memory_budget_bytes: int,
+    random_state: int = 42,
+) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Preprocessing for TRAINING on data streamed in chunks. Like `preprocess`, the
+    majority class is undersampled to the size of the minority class, but both
+    classes are collected in reservoirs, so memory is bounded by the budget
+    instead of the size of the data. The reservoirs use half of the budget, the
+    other half is left for the sampled set. Should the minority class not fit,
+    it is sampled as well.
+
+    param chunks: chunks of the data, e.g. from `load_data_in_chunks`
+    param target_column: name of the target column
+    param memory_budget_bytes: memory available for the sampled data
+    param random_state: random state for reproducibility
+    return: sampled float32 features and target
+    """
+    rng = np.random.default_rng(random_state)
+    feature_columns = None
+    for chunk in chunks:
+        if feature_columns is None:
+            feature_columns = [
+                column
+                for column in chunk.columns
+                if column not in ("id", target_column)
+            ]
+            row_bytes = np.dtype(np.float32).itemsize * len(feature_columns)
+            capacity = max(1, memory_budget_bytes // (4 * row_bytes))
+            minority = ReservoirSampler(capacity, len(feature_columns), rng)
+            majority = ReservoirSampler(capacity, len(feature_columns), rng)
+
+        features = chunk[feature_columns].to_numpy(dtype=np.float32)
+        is_minority = chunk[target_column].to_numpy() == 1
+        minority.add(features[is_minority])
+        majority.add(features[~is_minority])
+
+    if feature_columns is None:
+        raise ValueError("No data to preprocess.")
+    if minority.seen > minority.capacity:
+        logger.warning(
+            f"Minority class of {minority.seen} rows exceeds the memory budget, "
+            f"sampled {minority.capacity} of them."
+        )
+
+    features = np.concatenate([majority.sample(minority.size), minority.sample()])
+    target = np.repeat([0, 1], [min(minority.size, majority.size), minority.size])
+    logger.info(f"Sampled {len(target)} of {minority.seen + majority.seen} rows.")
+    return (
+        pd.DataFrame(features, columns=feature_columns),
+        pd.Series(target, name=target_column),
+    )
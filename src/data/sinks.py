@@ -0,0 +1,197 @@
+import json
+import os
+from io import BytesIO
+from typing import Any, Dict, Optional, Protocol
+
+import boto3
+import pandas as pd
+from botocore.exceptions import ClientError
+
+from src.data.extraction import detect_format
+from src.utils.aws import parse_s3_path
+
+# S3 rejects multipart parts smaller than 5 MiB, except for the last one.
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class DataSink(Protocol):
+    def write(self, data: pd.DataFrame) -> None: ...
+
+    def checkpoint(self) -> Optional[Dict[str, Any]]: ...
+
+    def close(self) -> None: ...
+
+
+class LocalCsvSink:
+    """
+    Appends chunks to a local CSV file. Every checkpoint records the byte offset
+    of durable data, so a resumed run truncates whatever was written after it.
+    """
+
+    def __init__(self, file_path: str, state: Optional[Dict[str, Any]] = None):
+        """
+        param file_path: path of the output file
+        param state: state returned by `checkpoint` of a previous run
+        """
+        offset = state["offset"] if state else 0
+        if offset:
+            os.truncate(file_path, offset)
+            self.file = open(file_path, "a", newline="")
+        else:
+            self.file = open(file_path, "w", newline="")
+
+        self.file_path = file_path
+        self.header_written = offset > 0
+
+    def write(self, data: pd.DataFrame) -> None:
+        data.to_csv(self.file, header=not self.header_written, index=False)
+        self.header_written = True
+
+    def checkpoint(self) -> Dict[str, Any]:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {"offset": os.path.getsize(self.file_path)}
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class S3MultipartSink:
+    """
+    Streams chunks to S3 through a multipart upload. Data is buffered until a part
+    of `part_size` bytes can be uploaded, only then the chunks in it are durable.
+    Uploads of failed runs are kept open so they can be resumed, a bucket
+    lifecycle rule should abort the abandoned ones.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        file_key: str,
+        state: Optional[Dict[str, Any]] = None,
+        part_size: int = 2 * MIN_PART_SIZE,
+    ):
+        """
+        param bucket_name: output bucket
+        param file_key: output key
+        param state: state returned by `checkpoint` of a previous run
+        param part_size: number of buffered bytes that triggers a part upload
+        """
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes.")
+
+        self.s3_client = boto3.client("s3")
+        self.bucket_name = bucket_name
+        self.file_key = file_key
+        self.part_size = part_size
+        self.buffer = BytesIO()
+
+        if state:
+            self.upload_id = state["upload_id"]
+            self.parts = state["parts"]
+        else:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=bucket_name, Key=file_key
+            )["UploadId"]
+            self.parts = []
+
+        self.header_written = bool(self.parts)
+
+    def _upload_part(self) -> None:
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.file_key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=self.buffer.getvalue(),
+        )
+        self.parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+        self.buffer = BytesIO()
+
+    def write(self, data: pd.DataFrame) -> None:
+        csv = data.to_csv(header=not self.header_written, index=False)
+        self.buffer.write(csv.encode("utf-8"))
+        self.header_written = True
+
+    def checkpoint(self) -> Optional[Dict[str, Any]]:
+        if self.buffer.tell() < self.part_size:
+            return None
+
+        self._upload_part()
+        return {"upload_id": self.upload_id, "parts": self.parts}
+
+    def close(self) -> None:
+        if self.buffer.tell() or not self.parts:
+            self._upload_part()
+
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.file_key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+
+def open_sink(file_path: str, state: Optional[Dict[str, Any]] = None) -> DataSink:
+    """
+    Opens a sink for a local or S3 path, resuming from `state` if given. Sinks
+    append CSV, other output formats cannot be resumed at a byte offset and
+    are rejected.
+    """
+    if detect_format(file_path) != "csv":
+        raise ValueError(f"Streaming writes CSV, {file_path} is not a CSV output path.")
+    if file_path.startswith("s3://"):
+        return S3MultipartSink(*parse_s3_path(file_path), state=state)
+
+    return LocalCsvSink(file_path, state=state)
+
+
+class Checkpoint:
+    """
+    Progress of a streaming run, stored as JSON next to its output.
+    """
+
+    def __init__(self, output_path: str):
+        """
+        param output_path: local or S3 path of the output the checkpoint belongs to
+        """
+        self.path = f"{output_path}.checkpoint.json"
+        if self.path.startswith("s3://"):
+            self.bucket_name, self.file_key = parse_s3_path(self.path)
+            self.s3_client = boto3.client("s3")
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not self.path.startswith("s3://"):
+            if not os.path.exists(self.path):
+                return None
+            with open(self.path) as file:
+                return json.load(file)
+
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name, Key=self.file_key
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchKey":
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def save(self, state: Dict[str, Any]) -> None:
+        if self.path.startswith("s3://"):
+            self.s3_client.put_object(
+                Bucket=self.bucket_name, Key=self.file_key, Body=json.dumps(state)
+            )
+            return
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if self.path.startswith("s3://"):
+            self.s3_client.delete_object(Bucket=self.bucket_name, Key=self.file_key)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
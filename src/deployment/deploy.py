@@ -1,7 +1,9 @@
 import argparse
 import logging
 
-from src.models.model_registry import DatabricksModelRegistry
+from src.config.registry import REGISTRY_BACKEND
+from src.models.model_registry import REGISTRIES, get_registry
+from src.utils.instrumentation import instrumentation, span
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,20 +20,41 @@ def parse_args():
         required=True,
         help="Name of the model to be deployed.",
     )
+    parser.add_argument(
+        "--registry_backend",
+        type=str,
+        choices=sorted(REGISTRIES),
+        default=REGISTRY_BACKEND,
+        help="Model registry, Databricks or the local MLflow stand-in.",
+    )
+    parser.add_argument(
+        "--metrics_path",
+        type=str,
+        help="Record timings and peak RSS, exported to this JSON or .prom file.",
+    )
 
     return parser.parse_args()
 
 
 def main():
-    registry = DatabricksModelRegistry()
     args = parse_args()
+    if args.metrics_path:
+        instrumentation.enable()
 
     endpoint_name = args.endpoint_name
     model_name = args.model_name
 
-    logger.info(f"Creating endpoint {endpoint_name} for model {model_name}.")
-    endpoint = registry.deploy_model(endpoint_name=endpoint_name, model_name=model_name)
-    logger.info(f"Endpoint {endpoint} created successfully!")
+    try:
+        registry = get_registry(args.registry_backend)
+        logger.info(f"Creating endpoint {endpoint_name} for model {model_name}.")
+        with span("deploy_model"):
+            endpoint = registry.deploy_model(
+                endpoint_name=endpoint_name, model_name=model_name
+            )
+        logger.info(f"Endpoint {endpoint} created successfully!")
+    finally:
+        if args.metrics_path:
+            instrumentation.export(args.metrics_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,304 @@
+import asyncio
+import json
+import logging
+import ssl
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+from src.config.inference import (
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+    MAX_CONCURRENCY,
+    MAX_RETRIES,
+    MICRO_BATCH_LATENCY,
+    MICRO_BATCH_SIZE,
+    READ_TIMEOUT,
+)
+from src.data.features import FeaturePipeline
+from src.inference.client import (
+    RETRY_STATUS_CODES,
+    backoff_delay,
+    parse_retry_after,
+    request_headers,
+)
+from src.inference.serialization import encode_payload
+
+logger = logging.getLogger(__name__)
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class EndpointError(Exception):
+    """
+    Error response of the serving endpoint.
+    """
+
+    def __init__(self, status_code: int, body: bytes):
+        super().__init__(f"Endpoint responded with {status_code}: {body[:500]!r}")
+        self.status_code = status_code
+
+
+async def _read_response(
+    reader: asyncio.StreamReader,
+) -> Tuple[int, Dict[str, str], bytes]:
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status_code = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        headers["connection"] = "close"
+    return status_code, headers, body
+
+
+class AsyncScoringClient:
+    """
+    Non-blocking client of the model serving endpoint, speaking HTTP/1.1 over
+    asyncio streams with a pool of keep-alive connections. Failed requests are
+    retried like in `ScoringClient`.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        max_connections: int = MAX_CONCURRENCY,
+        timeout: float = READ_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_max: float = BACKOFF_MAX,
+        compress: bool = False,
+    ):
+        """
+        param url: endpoint invocation url
+        param max_connections: maximum number of requests in flight
+        param timeout: seconds a request may take, including the connect
+        param max_retries: retries of a request before its error is raised
+        param backoff_base: first backoff in seconds, doubled on every retry
+        param backoff_max: longest wait between retries in seconds
+        param compress: gzip the request bodies
+        """
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.path = parts.path or "/"
+        if parts.query:
+            self.path += f"?{parts.query}"
+        self.ssl = ssl.create_default_context() if parts.scheme == "https" else None
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.compress = compress
+        self.slots = asyncio.Semaphore(max_connections)
+        self.idle: List[Connection] = []
+
+    async def _exchange(self, request: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        while True:
+            reused = bool(self.idle)
+            if reused:
+                reader, writer = self.idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection(
+                    self.host, self.port, ssl=self.ssl
+                )
+            try:
+                writer.write(request)
+                await writer.drain()
+                status_code, headers, body = await _read_response(reader)
+                break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                # The endpoint may have closed an idle connection, use another.
+                if not reused:
+                    raise
+            except BaseException:
+                writer.close()
+                raise
+
+        if headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self.idle.append((reader, writer))
+        return status_code, headers, body
+
+    def _request(self, body: bytes, content_encoding: Optional[str]) -> bytes:
+        headers = {
+            "Host": self.host,
+            **request_headers(content_encoding),
+            "Content-Length": str(len(body)),
+        }
+        head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        return f"POST {self.path} HTTP/1.1\r\n{head}\r\n".encode("latin-1") + body
+
+    async def score(self, data: pd.DataFrame) -> Dict[str, Any]:
+        """
+        Scores a frame with a single request, retrying it until it succeeds or
+        the retries run out.
+
+        param data: data to be scored
+        return: decoded response
+        """
+        body, content_encoding = encode_payload(data, self.compress)
+        request = self._request(body, content_encoding)
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self.slots, asyncio.timeout(self.timeout):
+                    status_code, headers, response = await self._exchange(request)
+            except (OSError, asyncio.IncompleteReadError, TimeoutError) as e:
+                error = e
+            else:
+                if status_code == 200:
+                    return json.loads(response)
+
+                error = EndpointError(status_code, response)
+                if status_code not in RETRY_STATUS_CODES:
+                    logger.error(str(error))
+                    raise error
+                retry_after = parse_retry_after(headers.get("retry-after"))
+
+            if attempt == self.max_retries:
+                logger.error(f"Request failed after {attempt} retries: {error}")
+                raise error
+
+            delay = backoff_delay(
+                attempt, retry_after, self.backoff_base, self.backoff_max
+            )
+            logger.warning(
+                f"Request failed ({error!r}), retry {attempt + 1} of "
+                f"{self.max_retries} in {delay:.2f}s."
+            )
+            await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        while self.idle:
+            _, writer = self.idle.pop()
+            writer.close()
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single transaction calls into one endpoint request.
+    A batch is sent once it holds `max_batch_size` transactions or the first of
+    them waited `max_latency` seconds, and every caller gets its own prediction
+    back, or the error of the request.
+    """
+
+    def __init__(
+        self,
+        client: AsyncScoringClient,
+        max_batch_size: int = MICRO_BATCH_SIZE,
+        max_latency: float = MICRO_BATCH_LATENCY,
+        pipeline: Optional[FeaturePipeline] = None,
+    ):
+        """
+        param client: client sending the batches
+        param max_batch_size: maximum number of transactions per request
+        param max_latency: seconds a transaction waits for others to join it
+        param pipeline: feature pipeline applied to every batch
+        """
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.pipeline = pipeline
+        self.pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def score(self, transaction: Union[Dict[str, Any], pd.Series]) -> Any:
+        """
+        Scores a single transaction.
+
+        param transaction: feature values by column name
+        return: prediction of the transaction
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((dict(transaction), future))
+        if len(self.pending) >= self.max_batch_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_latency, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.pending:
+            return
+
+        batch, self.pending = self.pending, []
+        task = asyncio.create_task(self._send(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        try:
+            data = pd.DataFrame.from_records([transaction for transaction, _ in batch])
+            if self.pipeline is not None:
+                data = self.pipeline.transform_frame(data)
+            predictions = (await self.client.score(data))["predictions"]
+            # Predictions cannot be matched to rows if some are missing.
+            if len(predictions) != len(batch):
+                raise ValueError(
+                    f"Sent {len(batch)} transactions, got {len(predictions)} "
+                    "predictions."
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(prediction)
+
+    async def close(self) -> None:
+        """
+        Sends the pending transactions and waits for all requests in flight.
+        """
+        self._flush()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def score_model_async(
+    url: str, dataset: pd.DataFrame, client: Optional[AsyncScoringClient] = None
+) -> Dict[str, Any]:
+    """
+    Async counterpart of `score_model` for a frame.
+
+    param url: endpoint invocation url
+    param dataset: data to be scored
+    param client: client to reuse, a new one is created and closed if missing
+    return: decoded response
+    """
+    if client is not None:
+        return await client.score(dataset)
+
+    client = AsyncScoringClient(url)
+    try:
+        return await client.score(dataset)
+    finally:
+        await client.close()
@@ -0,0 +1,264 @@
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, Union
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.config.inference import (
+    BACKOFF_BASE,
+    BACKOFF_MAX,
+    CONCURRENCY,
+    CONNECT_TIMEOUT,
+    MAX_CONCURRENCY,
+    MAX_RETRIES,
+    READ_TIMEOUT,
+)
+from src.inference.serialization import encode_payload
+from src.utils.instrumentation import count
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Responses signalling that the endpoint is overloaded, they shrink the limit.
+THROTTLE_STATUS_CODES = {429, 503}
+
+Body = Union[str, bytes, Iterator[bytes]]
+
+
+def create_session(pool_size: int = CONCURRENCY) -> requests.Session:
+    """
+    Creates a HTTP session which keeps up to `pool_size` connections alive,
+    so consecutive requests to the endpoint skip the TCP/TLS handshake.
+
+    param pool_size: maximum number of pooled connections
+    return: configured session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait according to a `Retry-After` header, given either as a
+    number of seconds or as a HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def request_headers(content_encoding: Optional[str] = None) -> Dict[str, str]:
+    headers = {
+        "Authorization": f"Bearer {os.getenv('DATABRICKS_TOKEN')}",
+        "Content-Type": "application/json",
+    }
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return headers
+
+
+def backoff_delay(
+    attempt: int,
+    retry_after: Optional[float],
+    backoff_base: float = BACKOFF_BASE,
+    backoff_max: float = BACKOFF_MAX,
+) -> float:
+    """
+    Seconds to wait before retry `attempt + 1`: the `Retry-After` of the
+    endpoint if given, otherwise exponential backoff with full jitter.
+    """
+    if retry_after is not None:
+        return min(retry_after, backoff_max)
+    return random.uniform(0, min(backoff_max, backoff_base * 2**attempt))
+
+
+def _count_bytes(pieces: Iterator[bytes]) -> Iterator[bytes]:
+    for piece in pieces:
+        count("request_bytes", len(piece))
+        yield piece
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the requests in flight with additive increase, multiplicative
+    decrease (AIMD). Every successful request raises the limit by 1 / limit, so
+    by about one per round of requests, every throttled one halves it. Requests
+    started before a decrease cannot decrease it again, so a burst of 429s from
+    one round only counts once.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = CONCURRENCY,
+        min_limit: int = 1,
+        max_limit: int = MAX_CONCURRENCY,
+        decrease_factor: float = 0.5,
+    ):
+        """
+        param initial_limit: requests allowed in flight at the start
+        param min_limit: lowest limit throttling can lead to
+        param max_limit: highest limit a healthy endpoint can lead to
+        param decrease_factor: factor the limit is multiplied with on throttling
+        """
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError("Limits must satisfy 1 <= min <= initial <= max.")
+
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.generation = 0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> int:
+        """
+        Blocks until a request may be sent, returns the token for `release`.
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            return self.generation
+
+    def release(self, token: int, throttled: bool = False) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            if not throttled:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif token == self.generation:
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                self.generation += 1
+                logger.info(f"Endpoint throttled, concurrency limit {int(self.limit)}.")
+            self.condition.notify_all()
+
+
+class ScoringClient:
+    """
+    Client of the model serving endpoint. Requests go over a pooled keep-alive
+    session with timeouts, throttled and failed requests are retried with
+    exponential backoff and full jitter, or after the `Retry-After` the
+    endpoint asks for, and the requests in flight are bounded by an adaptive
+    limiter.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        timeout: Tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+        backoff_max: float = BACKOFF_MAX,
+        compress: bool = False,
+        stream: bool = False,
+        session: Optional[requests.Session] = None,
+    ):
+        """
+        param url: endpoint invocation url
+        param limiter: limiter of the requests in flight, AIMD defaults if not set
+        param timeout: connect and read timeout in seconds
+        param max_retries: retries of a request before its error is raised
+        param backoff_base: first backoff in seconds, doubled on every retry
+        param backoff_max: longest wait between retries in seconds
+        param compress: gzip the request bodies
+        param stream: stream the request bodies instead of building them whole
+        param session: session to reuse, a new pooled one is created if missing
+        """
+        self.url = url
+        self.limiter = limiter or AdaptiveConcurrencyLimiter()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.compress = compress
+        self.stream = stream
+        self.owns_session = session is None
+        self.session = session or create_session(self.limiter.max_limit)
+        self.retries = 0
+
+    def post(self, encode: Callable[[], Tuple[Body, Optional[str]]]) -> Dict[str, Any]:
+        """
+        Sends a request, retrying it until it succeeds or the retries run out.
+
+        param encode: returns the body and its content encoding, called for
+            every attempt since a streamed body can only be sent once
+        return: decoded response
+        """
+        for attempt in range(self.max_retries + 1):
+            body, content_encoding = encode()
+            if isinstance(body, (str, bytes)):
+                count("request_bytes", len(body))
+            else:
+                body = _count_bytes(body)
+            count("requests")
+            token = self.limiter.acquire()
+            throttled = False
+            retry_after = None
+            try:
+                response = self.session.post(
+                    self.url,
+                    headers=request_headers(content_encoding),
+                    data=body,
+                    timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                throttled = isinstance(e, requests.Timeout)
+                error = e
+            else:
+                if response.status_code == 200:
+                    return response.json()
+
+                throttled = response.status_code in THROTTLE_STATUS_CODES
+                if response.status_code not in RETRY_STATUS_CODES:
+                    logger.error(
+                        f"Request failed with status code {response.status_code}: "
+                        f"{response.text}"
+                    )
+                    response.raise_for_status()
+                error = requests.HTTPError(
+                    f"{response.status_code}: {response.text}", response=response
+                )
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            finally:
+                self.limiter.release(token, throttled)
+
+            if attempt == self.max_retries:
+                logger.error(f"Request failed after {attempt} retries: {error}")
+                raise error
+
+            delay = backoff_delay(
+                attempt, retry_after, self.backoff_base, self.backoff_max
+            )
+            self.retries += 1
+            count("retries")
+            logger.warning(
+                f"Request failed ({error}), retry {attempt + 1} of "
+                f"{self.max_retries} in {delay:.2f}s."
+            )
+            time.sleep(delay)
+
+    def score(self, data: pd.DataFrame) -> Dict[str, Any]:
+        return self.post(lambda: encode_payload(data, self.compress, self.stream))
+
+    def close(self) -> None:
+        if self.owns_session:
+            self.session.close()
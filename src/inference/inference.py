@@ -1,14 +1,53 @@
 import argparse
+import hashlib
 import json
 import logging
 import os
-from typing import Any, Dict, Union
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional, Protocol, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import requests
+import xgboost as xgb
 from dotenv import load_dotenv
 
-from src.data.extraction import load_data, save_data
+from src.config.inference import (
+    BATCH_SIZE,
+    CHUNK_SIZE,
+    CONCURRENCY,
+    CONNECT_TIMEOUT,
+    MAX_CONCURRENCY,
+    MAX_RETRIES,
+    MODEL_CACHE_DIR,
+    PREDICTION_CACHE_MAX_ENTRIES,
+    PREDICTION_CACHE_TTL,
+    READ_TIMEOUT,
+)
+from src.config.registry import REGISTRY_BACKEND
+from src.data.cache import S3DataCache
+from src.data.extraction import (
+    load_data,
+    load_data_in_chunks,
+    resolve_data_path,
+    save_data,
+)
+from src.data.features import FEATURE_PIPELINE_FILE, FeaturePipeline
+from src.data.sinks import Checkpoint, open_sink
+from src.inference.client import (
+    AdaptiveConcurrencyLimiter,
+    ScoringClient,
+)
+from src.inference.prediction_cache import CachedScorer, PredictionCache
+from src.inference.serialization import encode_payload
+from src.models.metrics import apply_threshold, stored_threshold
+from src.models.model_registry import (
+    REGISTRIES,
+    DatabricksModelRegistry,
+    get_registry,
+)
+from src.utils.instrumentation import count, instrumentation, span
 
 load_dotenv()
 
@@ -30,18 +69,173 @@ def parse_args():
     )
 
     parser.add_argument(
-        "--endpoint_name", type=str, required=True, help="The name of the endpoint."
+        "--backend",
+        type=str,
+        choices=["remote", "local"],
+        default="remote",
+        help="Score through the serving endpoint or with the model loaded in-process.",
+    )
+
+    parser.add_argument(
+        "--endpoint_name",
+        type=str,
+        help="The name of the endpoint, required by the remote backend.",
+    )
+
+    parser.add_argument(
+        "--model_name",
+        type=str,
+        help="Registered model whose champion version and feature pipeline are used.",
+    )
+
+    parser.add_argument(
+        "--model_path",
+        type=str,
+        help="Local XGBoost model file, used by the local backend instead of the registry.",
+    )
+
+    parser.add_argument(
+        "--feature_pipeline_path",
+        type=str,
+        help="Local feature pipeline file, used instead of the registered one.",
+    )
+
+    parser.add_argument(
+        "--model_cache_dir",
+        type=str,
+        default=MODEL_CACHE_DIR,
+        help="Directory where the local backend caches models by version.",
+    )
+    parser.add_argument(
+        "--registry_backend",
+        type=str,
+        choices=sorted(REGISTRIES),
+        default=REGISTRY_BACKEND,
+        help="Model registry, Databricks or the local MLflow stand-in.",
+    )
+
+    parser.add_argument(
+        "--nthread",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of threads used by the local backend for prediction.",
+    )
+
+    parser.add_argument(
+        "--decision_threshold",
+        type=float,
+        help="Probability above which the local backend predicts fraud, "
+        "the threshold stored with the model by default.",
+    )
+
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Number of rows sent to the endpoint in a single request.",
+    )
+
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=CONCURRENCY,
+        help="Number of requests in flight at the start.",
+    )
+
+    parser.add_argument(
+        "--max_concurrency",
+        type=int,
+        default=MAX_CONCURRENCY,
+        help="Highest number of requests in flight while the endpoint keeps up.",
+    )
+
+    parser.add_argument(
+        "--max_retries",
+        type=int,
+        default=MAX_RETRIES,
+        help="Retries of a throttled or failed request before the run fails.",
+    )
+
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=READ_TIMEOUT,
+        help="Seconds to wait for an endpoint response.",
+    )
+
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Compress request bodies sent to the endpoint with gzip.",
+    )
+
+    parser.add_argument(
+        "--stream_body",
+        action="store_true",
+        help="Stream request bodies with chunked transfer encoding.",
+    )
+
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read, score and export the data chunk by chunk, resuming unfinished "
+        "runs. The output is written as CSV.",
+    )
+
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="Number of rows read from the input at once in streaming mode.",
+    )
+
+    parser.add_argument(
+        "--prediction_cache",
+        type=str,
+        help="SQLite file caching predictions by feature row, disabled if not set.",
+    )
+
+    parser.add_argument(
+        "--prediction_cache_ttl",
+        type=float,
+        default=PREDICTION_CACHE_TTL,
+        help="Seconds a cached prediction stays valid.",
+    )
+
+    parser.add_argument(
+        "--prediction_cache_max_entries",
+        type=int,
+        default=PREDICTION_CACHE_MAX_ENTRIES,
+        help="Maximum number of cached predictions.",
+    )
+
+    parser.add_argument(
+        "--metrics_path",
+        type=str,
+        help="Record stage timings, counters and peak RSS, exported to this JSON "
+        "or .prom file.",
+    )
+
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=os.getenv("DATA_CACHE_DIR"),
+        help="Directory of the local S3 data cache, disabled if not set.",
     )
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.backend == "remote" and not args.endpoint_name:
+        parser.error("--endpoint_name is required by the remote backend.")
+    if args.backend == "local" and not (args.model_name or args.model_path):
+        parser.error("--model_name or --model_path is required by the local backend.")
+    if args.prediction_cache and not (args.model_name or args.model_path):
+        parser.error("--prediction_cache needs --model_name or --model_path.")
+
+    return args
 
 
 def create_serving_json(data: Union[Dict[str, Any], pd.DataFrame]) -> Dict[str, Any]:
-    return {
-        "inputs": {name: data[name].tolist() for name in data.keys()}
-        if isinstance(data, dict)
-        else data.to_list()
-    }
+    return {"inputs": {name: np.asarray(data[name]).tolist() for name in data.keys()}}
 
 
 def prepare_dataset(dataset: Union[pd.DataFrame, Dict[str, Any]]) -> Dict[str, Any]:
@@ -52,13 +246,27 @@ def prepare_dataset(dataset: Union[pd.DataFrame, Dict[str, Any]]) -> Dict[str, A
     }
 
 
-def send_request(url: str, data_json: str) -> Dict[str, Any]:
+def send_request(
+    url: str,
+    data_json: Union[str, bytes, Iterator[bytes]],
+    session: Optional[requests.Session] = None,
+    content_encoding: Optional[str] = None,
+    timeout: Tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+) -> Dict[str, Any]:
     headers = {
         "Authorization": f"Bearer {os.getenv('DATABRICKS_TOKEN')}",
         "Content-Type": "application/json",
     }
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
 
-    response = requests.post(url, headers=headers, data=data_json)
+    post = session.post if session is not None else requests.post
+    response = post(
+        url,
+        headers=headers,
+        data=data_json,
+        timeout=timeout,
+    )
     if response.status_code != 200:
         logger.error(
             f"Request failed with status code {response.status_code}: {response.text}"
@@ -69,12 +277,34 @@ def send_request(url: str, data_json: str) -> Dict[str, Any]:
 
 
 def score_model(
-    url: str, dataset: Union[pd.DataFrame, Dict[str, Any]]
+    url: str,
+    dataset: Union[pd.DataFrame, Dict[str, Any]],
+    session: Optional[requests.Session] = None,
+    compress: bool = False,
+    stream: bool = False,
+    timeout: Tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
 ) -> Dict[str, Any]:
+    """
+    Scores a dataset with a single request. Frames are sent column oriented,
+    encoded straight from their arrays, see `encode_payload`.
+
+    param url: endpoint invocation url
+    param dataset: data to be scored
+    param session: session to send the request with
+    param compress: gzip the request body
+    param stream: stream the request body instead of building it whole
+    param timeout: connect and read timeout in seconds
+    return: decoded response
+    """
     try:
-        ds_dict = prepare_dataset(dataset)
-        data_json = json.dumps(ds_dict, allow_nan=True)
-        return send_request(url, data_json)
+        if isinstance(dataset, pd.DataFrame):
+            body, content_encoding = encode_payload(dataset, compress, stream)
+        else:
+            body = json.dumps(prepare_dataset(dataset), allow_nan=True)
+            content_encoding = None
+        return send_request(
+            url, body, session, content_encoding=content_encoding, timeout=timeout
+        )
     except requests.RequestException as e:
         logger.error(f"Error during model scoring: {e}")
         raise
@@ -86,16 +316,435 @@ def score_model(
         raise
 
 
+def _score_batch(
+    client: ScoringClient,
+    batch: pd.DataFrame,
+    pipeline: Optional[FeaturePipeline] = None,
+) -> pd.DataFrame:
+    features = pipeline.transform_frame(batch) if pipeline is not None else batch
+    predictions = pd.DataFrame(client.score(features)["predictions"], index=batch.index)
+    return pd.concat([batch["id"], predictions], axis=1)
+
+
+def score_model_in_batches(
+    url: str,
+    dataset: pd.DataFrame,
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = CONCURRENCY,
+    session: Optional[requests.Session] = None,
+    pipeline: Optional[FeaturePipeline] = None,
+    compress: bool = False,
+    stream: bool = False,
+    client: Optional[ScoringClient] = None,
+) -> pd.DataFrame:
+    """
+    Scores the dataset in chunks of `batch_size` rows through a `ScoringClient`,
+    which retries failed requests and adapts the number of requests in flight.
+    If any chunk still fails the remaining ones are cancelled and the error is
+    raised.
+
+    param url: endpoint invocation url
+    param dataset: data to be scored, must contain the `id` column
+    param batch_size: number of rows per request
+    param concurrency: maximum number of concurrent requests, if no client is given
+    param session: session to reuse, a new pooled one is created if missing
+    param pipeline: feature pipeline applied before sending, the data is sent
+        as it is if not set
+    param compress: gzip the request bodies
+    param stream: stream the request bodies instead of building them whole
+    param client: client to send the requests with, replaces the options above
+    return: `id` column joined with predictions, in the original row order
+    """
+    if batch_size < 1 or concurrency < 1:
+        raise ValueError("batch_size and concurrency must be positive integers.")
+
+    batches = [
+        dataset.iloc[start : start + batch_size]
+        for start in range(0, len(dataset), batch_size)
+    ]
+    owns_client = client is None
+    if client is None:
+        client = ScoringClient(
+            url,
+            AdaptiveConcurrencyLimiter(concurrency, max_limit=concurrency),
+            compress=compress,
+            stream=stream,
+            session=session,
+        )
+    start_time = time.perf_counter()
+    retries = client.retries
+
+    try:
+        with ThreadPoolExecutor(max_workers=client.limiter.max_limit) as executor:
+            futures = [
+                executor.submit(_score_batch, client, batch, pipeline)
+                for batch in batches
+            ]
+            try:
+                results = [future.result() for future in futures]
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        if owns_client:
+            client.close()
+
+    elapsed = time.perf_counter() - start_time
+    logger.info(
+        f"Scored {len(dataset)} rows in {len(batches)} batches in {elapsed:.2f}s "
+        f"({len(dataset) / max(elapsed, 1e-9):.0f} rows/sec, "
+        f"{client.retries - retries} retries, "
+        f"concurrency limit {int(client.limiter.limit)})."
+    )
+
+    if not results:
+        return pd.DataFrame({"id": dataset["id"]})
+    return pd.concat(results)
+
+
+def load_feature_pipeline(
+    registry: DatabricksModelRegistry,
+    model_name: str,
+    model_version,
+    cache_dir: str = MODEL_CACHE_DIR,
+) -> Optional[FeaturePipeline]:
+    """
+    Loads the feature pipeline logged with a model version, cached on disk next
+    to the model. Versions registered without one return None.
+    """
+    pipeline_path = os.path.join(
+        cache_dir, model_name, str(model_version.version), FEATURE_PIPELINE_FILE
+    )
+    if not os.path.exists(pipeline_path):
+        state = registry.load_feature_pipeline(model_version)
+        if state is None:
+            logger.warning(
+                f"{model_name} version {model_version.version} has no feature pipeline."
+            )
+            return None
+        os.makedirs(os.path.dirname(pipeline_path), exist_ok=True)
+        tmp_path = f"{pipeline_path}.partial"
+        FeaturePipeline.from_dict(state).save(tmp_path)
+        os.replace(tmp_path, pipeline_path)
+
+    return FeaturePipeline.load(pipeline_path)
+
+
+class Scorer(Protocol):
+    def predict(self, data: pd.DataFrame) -> pd.DataFrame: ...
+
+    def close(self) -> None: ...
+
+
+class RemoteScorer:
+    """
+    Scores through the model serving endpoint. The number of requests in flight
+    starts at `concurrency` and adapts between 1 and `max_concurrency` to how
+    the endpoint copes with the load.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        batch_size: int = BATCH_SIZE,
+        concurrency: int = CONCURRENCY,
+        pipeline: Optional[FeaturePipeline] = None,
+        compress: bool = False,
+        stream: bool = False,
+        max_concurrency: Optional[int] = None,
+        max_retries: int = MAX_RETRIES,
+        timeout: Tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+    ):
+        """
+        param url: endpoint invocation url
+        param batch_size: number of rows per request
+        param concurrency: initial number of concurrent requests
+        param pipeline: feature pipeline applied before sending
+        param compress: gzip the request bodies
+        param stream: stream the request bodies instead of building them whole
+        param max_concurrency: highest number of concurrent requests, fixed at
+            `concurrency` if not set
+        param max_retries: retries of a request before the run fails
+        param timeout: connect and read timeout in seconds
+        """
+        self.batch_size = batch_size
+        self.pipeline = pipeline
+        self.client = ScoringClient(
+            url,
+            AdaptiveConcurrencyLimiter(
+                concurrency, max_limit=max(concurrency, max_concurrency or 0)
+            ),
+            timeout=timeout,
+            max_retries=max_retries,
+            compress=compress,
+            stream=stream,
+        )
+
+    def predict(self, data: pd.DataFrame) -> pd.DataFrame:
+        return score_model_in_batches(
+            self.client.url,
+            data,
+            self.batch_size,
+            pipeline=self.pipeline,
+            client=self.client,
+        )
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class LocalScorer:
+    """
+    Scores in-process with the XGBoost booster, skipping serialization, the
+    network and the endpoint cold start.
+    """
+
+    def __init__(
+        self,
+        booster: xgb.Booster,
+        nthread: Optional[int] = None,
+        pipeline: Optional[FeaturePipeline] = None,
+        threshold: Optional[float] = None,
+    ):
+        """
+        param booster: trained booster
+        param nthread: number of prediction threads, all cores if not set
+        param pipeline: feature pipeline producing the model input
+        param threshold: decision threshold, the one stored with the model or
+            0.5 if not set
+        """
+        self.booster = booster
+        self.booster.set_param({"nthread": nthread or os.cpu_count()})
+        self.pipeline = pipeline
+        self.threshold = stored_threshold(booster) if threshold is None else threshold
+
+    @classmethod
+    def from_path(
+        cls,
+        model_path: str,
+        nthread: Optional[int] = None,
+        pipeline_path: Optional[str] = None,
+        threshold: Optional[float] = None,
+    ) -> "LocalScorer":
+        pipeline = FeaturePipeline.load(pipeline_path) if pipeline_path else None
+        return cls(xgb.Booster(model_file=model_path), nthread, pipeline, threshold)
+
+    @classmethod
+    def from_registry(
+        cls,
+        model_name: str,
+        cache_dir: str = MODEL_CACHE_DIR,
+        nthread: Optional[int] = None,
+        threshold: Optional[float] = None,
+        registry_backend: str = REGISTRY_BACKEND,
+    ) -> "LocalScorer":
+        """
+        Loads the champion version of a registered model and its feature
+        pipeline. Both are cached on disk by version, so only the first run
+        after a promotion downloads them.
+        """
+        registry = get_registry(registry_backend)
+        model_version = registry.get_champion_version(model_name)
+        version = model_version.version
+        model_path = os.path.join(cache_dir, model_name, str(version), "model.ubj")
+
+        if os.path.exists(model_path):
+            logger.info(f"Using cached {model_name} version {version}.")
+        else:
+            logger.info(f"Downloading {model_name} version {version}.")
+            model = registry.load_model(model_name, version)
+            booster = model.get_booster() if hasattr(model, "get_booster") else model
+            os.makedirs(os.path.dirname(model_path), exist_ok=True)
+            tmp_path = model_path.replace("model.ubj", "model.partial.ubj")
+            booster.save_model(tmp_path)
+            os.replace(tmp_path, model_path)
+
+        pipeline = load_feature_pipeline(registry, model_name, model_version, cache_dir)
+        return cls(xgb.Booster(model_file=model_path), nthread, pipeline, threshold)
+
+    def predict(self, data: pd.DataFrame) -> pd.DataFrame:
+        if self.pipeline is not None:
+            features = self.pipeline.transform(data)
+        else:
+            feature_names = self.booster.feature_names or [
+                column for column in data.columns if column != "id"
+            ]
+            features = data[feature_names].to_numpy(dtype=np.float32)
+        predictions = pd.DataFrame(
+            apply_threshold(self.booster.inplace_predict(features), self.threshold),
+            index=data.index,
+        )
+        return pd.concat([data["id"], predictions], axis=1)
+
+    def close(self) -> None:
+        pass
+
+
+def model_version(args: argparse.Namespace) -> str:
+    """
+    Version of the model the predictions come from: the champion version of a
+    registered model, or the content hash of a local model file.
+    """
+    if args.model_path:
+        with open(args.model_path, "rb") as file:
+            return hashlib.file_digest(file, "sha256").hexdigest()
+
+    registry = get_registry(args.registry_backend)
+    return str(registry.get_champion_version(args.model_name).version)
+
+
+def create_scorer(args: argparse.Namespace) -> Scorer:
+    scorer = _create_scorer(args)
+    if not args.prediction_cache:
+        return scorer
+
+    cache = PredictionCache(
+        args.prediction_cache,
+        model_version(args),
+        ttl=args.prediction_cache_ttl,
+        max_entries=args.prediction_cache_max_entries,
+    )
+    pipeline = getattr(scorer, "pipeline", None)
+    return CachedScorer(scorer, cache, pipeline.columns if pipeline else None)
+
+
+def _create_scorer(args: argparse.Namespace) -> Scorer:
+    if args.backend == "remote":
+        if args.feature_pipeline_path:
+            pipeline = FeaturePipeline.load(args.feature_pipeline_path)
+        elif args.model_name:
+            registry = get_registry(args.registry_backend)
+            pipeline = load_feature_pipeline(
+                registry,
+                args.model_name,
+                registry.get_champion_version(args.model_name),
+                args.model_cache_dir,
+            )
+        else:
+            pipeline = None
+        return RemoteScorer(
+            args.endpoint_name,
+            args.batch_size,
+            args.concurrency,
+            pipeline,
+            compress=args.gzip,
+            stream=args.stream_body,
+            max_concurrency=args.max_concurrency,
+            max_retries=args.max_retries,
+            timeout=(CONNECT_TIMEOUT, args.timeout),
+        )
+    if args.model_path:
+        return LocalScorer.from_path(
+            args.model_path,
+            args.nthread,
+            args.feature_pipeline_path,
+            args.decision_threshold,
+        )
+
+    return LocalScorer.from_registry(
+        args.model_name,
+        args.model_cache_dir,
+        args.nthread,
+        args.decision_threshold,
+        args.registry_backend,
+    )
+
+
+def stream_inference(
+    input_path: str,
+    output_path: str,
+    scorer: Scorer,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """
+    Scores the input chunk by chunk and appends predictions straight to the
+    output, so memory does not grow with the input size. Progress is
+    checkpointed next to the output whenever the written data is durable, a
+    rerun with the same arguments continues after the last committed chunk.
+
+    param input_path: local or S3 path of the inference data
+    param output_path: local or S3 path of the results
+    param scorer: scorer producing the predictions
+    param chunk_size: number of rows read at once
+    return: number of rows scored in this run
+    """
+    source = resolve_data_path(input_path)
+    checkpoint = Checkpoint(output_path)
+    state = checkpoint.load()
+    if state and state["source"] != source:
+        logger.warning(
+            f"Checkpoint belongs to {state['source']}, starting over for {source}."
+        )
+        state = None
+
+    committed_rows = state["rows"] if state else 0
+    if committed_rows:
+        logger.info(f"Resuming after {committed_rows} committed rows.")
+
+    sink = open_sink(output_path, state["sink"] if state else None)
+    pending_rows = scored_rows = 0
+    for chunk in load_data_in_chunks(source, chunk_size, skip_rows=committed_rows):
+        with span("score"):
+            predictions = scorer.predict(chunk)
+        with span("save_data"):
+            sink.write(predictions)
+        count("rows_scored", len(chunk))
+        pending_rows += len(chunk)
+        scored_rows += len(chunk)
+        sink_state = sink.checkpoint()
+        if sink_state is not None:
+            committed_rows += pending_rows
+            pending_rows = 0
+            checkpoint.save(
+                {"source": source, "rows": committed_rows, "sink": sink_state}
+            )
+            logger.info(f"Committed {committed_rows} rows.")
+
+    sink.close()
+    checkpoint.clear()
+    return scored_rows
+
+
 def main():
     args = parse_args()
-    data = load_data(args.input_data_path)
-    print("URL CHECK->>", args.endpoint_name)
-
-    predictions = pd.DataFrame(score_model(args.endpoint_name, data)["predictions"])
-    predictions_df = pd.concat([data["id"], predictions], axis=1)
-    logger.info("Results generated successfully.")
-    save_data(predictions_df, args.output_data_path)
-    logger.info("Results exported!")
+    if args.metrics_path:
+        instrumentation.enable()
+    try:
+        run(args)
+    finally:
+        if args.metrics_path:
+            instrumentation.export(args.metrics_path)
+
+
+def run(args: argparse.Namespace) -> None:
+    with span("create_scorer"):
+        scorer = create_scorer(args)
+    try:
+        if args.stream:
+            rows = stream_inference(
+                args.input_data_path,
+                args.output_data_path,
+                scorer,
+                chunk_size=args.chunk_size,
+            )
+            logger.info(f"Streamed {rows} rows, results exported!")
+            return
+
+        cache = S3DataCache(args.cache_dir) if args.cache_dir else None
+        with span("load_data"):
+            data = load_data(args.input_data_path, cache=cache)
+        logger.info(f"Scoring {len(data)} rows with the {args.backend} backend.")
+
+        with span("score"):
+            predictions_df = scorer.predict(data)
+        count("rows_scored", len(data))
+        logger.info("Results generated successfully.")
+        with span("save_data"):
+            save_data(predictions_df, args.output_data_path)
+        logger.info("Results exported!")
+    finally:
+        scorer.close()
 
 
 if __name__ == "__main__":
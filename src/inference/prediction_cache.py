@@ -0,0 +1,184 @@
+import logging
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.config.inference import PREDICTION_CACHE_MAX_ENTRIES, PREDICTION_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Keys per statement, below SQLite's limit of bound parameters.
+_LOOKUP_ROWS = 10_000
+
+
+def hash_rows(features: pd.DataFrame) -> np.ndarray:
+    """
+    64 bit hash of every feature row, vectorized over the whole frame. The
+    index is not part of the hash, so the same features share the key.
+    """
+    hashes = pd.util.hash_pandas_object(features, index=False).to_numpy()
+    # SQLite integers are signed.
+    return hashes.view(np.int64)
+
+
+class PredictionCache:
+    """
+    On-disk cache of predictions in SQLite, keyed by the hash of the feature row.
+    The cache belongs to one model version, opening it with another version
+    clears it. Entries expire after `ttl` seconds and the oldest ones are
+    evicted beyond `max_entries`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        model_version: str,
+        ttl: float = PREDICTION_CACHE_TTL,
+        max_entries: int = PREDICTION_CACHE_MAX_ENTRIES,
+    ):
+        """
+        param path: path of the SQLite database
+        param model_version: version of the model producing the predictions
+        param ttl: seconds a prediction stays valid
+        param max_entries: maximum number of cached predictions
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS predictions (
+                key INTEGER PRIMARY KEY, prediction, created REAL
+            );
+            CREATE INDEX IF NOT EXISTS predictions_created ON predictions (created);
+            CREATE TEMP TABLE lookup (key INTEGER PRIMARY KEY);
+            """
+        )
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE name = 'model_version'"
+        ).fetchone()
+        if row is None or row[0] != str(model_version):
+            if row is not None:
+                logger.info(
+                    f"Model version changed from {row[0]} to {model_version}, "
+                    "clearing the prediction cache."
+                )
+            with self.connection:
+                self.connection.execute("DELETE FROM predictions")
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('model_version', ?)",
+                    (str(model_version),),
+                )
+
+    def get(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Looks up the predictions of `keys`.
+
+        return: mask of the keys found and their predictions, None for misses
+        """
+        cutoff = time.time() - self.ttl
+        found = {}
+        with self.connection:
+            for start in range(0, len(keys), _LOOKUP_ROWS):
+                self.connection.execute("DELETE FROM lookup")
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO lookup VALUES (?)",
+                    ((int(key),) for key in keys[start : start + _LOOKUP_ROWS]),
+                )
+                found.update(
+                    self.connection.execute(
+                        "SELECT key, prediction FROM predictions JOIN lookup "
+                        "USING (key) WHERE created >= ?",
+                        (cutoff,),
+                    )
+                )
+
+        keys = pd.Series(keys)
+        mask = keys.isin(list(found)).to_numpy()
+        predictions = keys.map(found).to_numpy(dtype=object)
+        predictions[~mask] = None
+        self.hits += int(mask.sum())
+        self.misses += int((~mask).sum())
+        return mask, predictions
+
+    def put(self, keys: np.ndarray, predictions: np.ndarray) -> None:
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)",
+                zip(keys.tolist(), predictions.tolist(), [now] * len(keys)),
+            )
+            self.connection.execute(
+                "DELETE FROM predictions WHERE created < ?", (now - self.ttl,)
+            )
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM predictions"
+            ).fetchone()
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM predictions WHERE key IN "
+                    "(SELECT key FROM predictions ORDER BY created LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class CachedScorer:
+    """
+    Scorer that only sends rows without a cached prediction to the wrapped
+    scorer. Scorers return the `id` column and a single prediction column.
+    """
+
+    def __init__(
+        self,
+        scorer,
+        cache: PredictionCache,
+        feature_columns: Optional[List[str]] = None,
+    ):
+        """
+        param scorer: scorer producing the missing predictions
+        param cache: cache of the predictions
+        param feature_columns: columns hashed into the key, all but `id` if not set
+        """
+        self.scorer = scorer
+        self.cache = cache
+        self.feature_columns = feature_columns
+
+    def predict(self, data: pd.DataFrame) -> pd.DataFrame:
+        feature_columns = self.feature_columns or [
+            column for column in data.columns if column != "id"
+        ]
+        keys = hash_rows(data[feature_columns])
+        found, predictions = self.cache.get(keys)
+
+        if not found.all():
+            scored = self.scorer.predict(data[~found])
+            scored_predictions = scored.drop(columns="id").iloc[:, 0].to_numpy()
+            self.cache.put(keys[~found], scored_predictions)
+            predictions[~found] = scored_predictions
+
+        result = pd.DataFrame({"id": data["id"]})
+        result[0] = pd.Series(predictions, index=data.index).infer_objects()
+        return result
+
+    def close(self) -> None:
+        logger.info(
+            f"Prediction cache hit rate {self.cache.hit_rate:.1%} "
+            f"({self.cache.hits} hits, {self.cache.misses} misses)."
+        )
+        self.cache.close()
+        self.scorer.close()
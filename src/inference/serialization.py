@@ -0,0 +1,84 @@
+import json
+import zlib
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+import orjson
+import pandas as pd
+
+# Rows encoded at once, bounds the memory of a streamed body.
+PIECE_ROWS = 10_000
+GZIP_LEVEL = 1
+
+
+def _encode_values(values: np.ndarray) -> bytes:
+    """
+    Encodes an array as the comma separated elements of a JSON list. orjson
+    reads numeric buffers directly, other arrays go through Python objects,
+    and NaN is written as null either way so the body stays valid JSON.
+    """
+    if values.dtype.kind in "biuf":
+        encoded = orjson.dumps(
+            np.ascontiguousarray(values), option=orjson.OPT_SERIALIZE_NUMPY
+        )
+    else:
+        encoded = orjson.dumps(
+            values.tolist(), default=str, option=orjson.OPT_SERIALIZE_NUMPY
+        )
+    return encoded[1:-1]
+
+
+def iter_column_json(
+    data: pd.DataFrame, piece_rows: int = PIECE_ROWS
+) -> Iterator[bytes]:
+    """
+    Yields the column oriented payload `{"inputs": {column: [values]}}` piece by
+    piece, each piece holding at most `piece_rows` values of one column.
+
+    param data: data to be scored
+    param piece_rows: number of values encoded at once
+    return: iterator over the pieces of the JSON body
+    """
+    yield b'{"inputs":{'
+    for i, column in enumerate(data.columns):
+        name = json.dumps(str(column)).encode("utf-8")
+        yield (b"," if i else b"") + name + b":["
+        values = data[column].to_numpy()
+        for start in range(0, len(values), piece_rows):
+            yield (b"," if start else b"") + _encode_values(
+                values[start : start + piece_rows]
+            )
+        yield b"]"
+    yield b"}}"
+
+
+def gzip_pieces(pieces: Iterable[bytes], level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    """
+    Compresses a body piece by piece into a single gzip stream.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def encode_payload(
+    data: pd.DataFrame, compress: bool = False, stream: bool = False
+) -> Tuple[Union[bytes, Iterator[bytes]], Optional[str]]:
+    """
+    Encodes data for the serving endpoint.
+
+    param data: data to be scored
+    param compress: gzip the body
+    param stream: return an iterator over the body, sent with chunked transfer
+        encoding, instead of building it whole
+    return: body and its content encoding
+    """
+    pieces = iter_column_json(data)
+    if compress:
+        pieces = gzip_pieces(pieces)
+
+    body = pieces if stream else b"".join(pieces)
+    return body, "gzip" if compress else None
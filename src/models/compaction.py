@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from src.data.features import FEATURE_PIPELINE_FILE, FeaturePipeline
+from src.models.model_definitions import (
+    FIXED_PARAMS,
+    Model,
+    ModelOptimization,
+    champion_params,
+)
+
+logger = logging.getLogger(__name__)
+
+COMPACT_MODEL_FILE = "model.ubj"
+LATENCY_REPORT_FILE = "latency_report.json"
+LATENCY_BATCH_SIZES = (1, 1000)
+
+
+def gain_importance(booster: xgb.Booster) -> Dict[str, float]:
+    """
+    Total gain of the splits on every feature, zero for unused features.
+    """
+    gains = booster.get_score(importance_type="total_gain")
+    return {name: gains.get(name, 0.0) for name in booster.feature_names}
+
+
+def select_features(booster: xgb.Booster, max_features: int) -> List[str]:
+    """
+    The `max_features` features with the highest total gain in model order,
+    features no split uses are never kept.
+    """
+    gains = gain_importance(booster)
+    ranked = sorted(
+        (name for name, gain in gains.items() if gain > 0),
+        key=lambda name: -gains[name],
+    )
+    kept = set(ranked[:max_features])
+    return [name for name in booster.feature_names if name in kept]
+
+
+def reduce_features(
+    model: Model,
+    X: pd.DataFrame,
+    y: pd.Series,
+    feature_pipeline: FeaturePipeline,
+    max_features: int,
+    performance_threshold: float,
+    class_weight: Optional[Dict[int, float]] = None,
+) -> Tuple[Model, FeaturePipeline, Optional[tuple]]:
+    """
+    Retrains the model's hyperparameters on its `max_features` features of
+    highest gain. The reduced model gets its decision threshold and holdout
+    check like the search's, and the model is kept as it is if the check fails
+    or nothing would be dropped.
+
+    param model: trained XGBoost model
+    param X: transformed training features
+    param y: training target
+    param feature_pipeline: pipeline producing `X`
+    param max_features: maximum number of features of the reduced model
+    param performance_threshold: holdout F1 the reduced model has to exceed
+    param class_weight: training weight of each class, unweighted if not set
+    return: model, its feature pipeline and the holdout score of the reduced
+        model, None if the model is kept
+    """
+    booster = model.get_booster()
+    columns = select_features(booster, max_features)
+    if len(columns) >= len(booster.feature_names):
+        return model, feature_pipeline, None
+
+    params = champion_params(model) or {}
+    params = {**params, **FIXED_PARAMS, "n_estimators": booster.num_boosted_rounds()}
+    optimization = ModelOptimization(
+        X[columns],
+        y,
+        type(model),
+        performance_threshold,
+        early_stopping_rounds=None,
+        class_weight=class_weight,
+    )
+    reduced = optimization.refit(params)
+    if reduced is None:
+        logger.warning(
+            f"Kept all {len(booster.feature_names)} features, the model on the "
+            f"{len(columns)} of highest gain is below the threshold."
+        )
+        return model, feature_pipeline, None
+
+    logger.info(
+        f"Reduced the model from {len(booster.feature_names)} to "
+        f"{len(columns)} features."
+    )
+    indices = [feature_pipeline.columns.index(column) for column in columns]
+    fill_values = feature_pipeline.fill_values
+    reduced_pipeline = FeaturePipeline(
+        columns,
+        feature_pipeline.dtype,
+        None if fill_values is None else fill_values[indices].tolist(),
+    )
+    return reduced, reduced_pipeline, optimization.get_score()
+
+
+def export_model(
+    model: Model, feature_pipeline: FeaturePipeline, directory: str
+) -> Tuple[str, str]:
+    """
+    Writes the booster as UBJSON and the feature map, the feature pipeline with
+    the columns in model order, which `LocalScorer.from_path` serves directly.
+
+    return: paths of the model and the feature map
+    """
+    os.makedirs(directory, exist_ok=True)
+    model_path = os.path.join(directory, COMPACT_MODEL_FILE)
+    pipeline_path = os.path.join(directory, FEATURE_PIPELINE_FILE)
+    model.get_booster().save_model(model_path)
+    feature_pipeline.save(pipeline_path)
+    return model_path, pipeline_path
+
+
+def latency_report(
+    model_path: str,
+    X: pd.DataFrame,
+    batch_sizes: Sequence[int] = LATENCY_BATCH_SIZES,
+    repeats: int = 5,
+) -> Dict[str, Any]:
+    """
+    Serving cost of an exported model: its size, the time to load it and the
+    prediction latency per row at each batch size, as medians over `repeats`
+    single threaded runs.
+
+    param model_path: exported model file
+    param X: transformed features the batches are taken from
+    param batch_sizes: rows per prediction call
+    param repeats: timed runs per measurement
+    """
+    load_seconds = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        booster = xgb.Booster(model_file=model_path)
+        load_seconds.append(time.perf_counter() - start_time)
+    booster.set_param({"nthread": 1})
+
+    features = np.ascontiguousarray(X[booster.feature_names].to_numpy(np.float32))
+    report = {
+        "size_bytes": os.path.getsize(model_path),
+        "trees": booster.num_boosted_rounds(),
+        "features": booster.num_features(),
+        "load_ms": float(np.median(load_seconds)) * 1000,
+    }
+    for batch_size in batch_sizes:
+        batch = np.resize(features, (batch_size, features.shape[1]))
+        booster.inplace_predict(batch)
+        seconds = []
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            booster.inplace_predict(batch)
+            seconds.append(time.perf_counter() - start_time)
+        report[f"batch_{batch_size}_us_per_row"] = (
+            float(np.median(seconds)) / batch_size * 1e6
+        )
+    return report
+
+
+def compact_model(
+    model: Model,
+    X: pd.DataFrame,
+    y: pd.Series,
+    feature_pipeline: FeaturePipeline,
+    directory: str,
+    score: Optional[tuple] = None,
+    max_features: Optional[int] = None,
+    performance_threshold: float = 0.0,
+    class_weight: Optional[Dict[int, float]] = None,
+) -> Tuple[Model, FeaturePipeline, Optional[tuple], Dict[str, Any]]:
+    """
+    Post-training compaction for serving: optionally reduces the features by
+    gain, see `reduce_features`, and exports the result to `directory` with its
+    latency report. Early stopped models need no pruning, the search already
+    cuts them to their best iteration.
+
+    param model: trained XGBoost model
+    param X: transformed training features
+    param y: training target
+    param feature_pipeline: pipeline producing `X`
+    param directory: directory of the exported model, feature map and report
+    param score: holdout score of `model`
+    param max_features: maximum number of features, all are kept if not set
+    param performance_threshold: holdout F1 a reduced model has to exceed
+    param class_weight: training weight of each class, unweighted if not set
+
+    return: compacted model, its feature pipeline, its holdout score, which is
+        the reduced model's own if the features were reduced, and the latency
+        report
+    """
+    if max_features:
+        model, feature_pipeline, reduced_score = reduce_features(
+            model,
+            X,
+            y,
+            feature_pipeline,
+            max_features,
+            performance_threshold,
+            class_weight,
+        )
+        if reduced_score is not None:
+            score = reduced_score
+    model_path, _ = export_model(model, feature_pipeline, directory)
+    report = latency_report(model_path, X)
+    with open(os.path.join(directory, LATENCY_REPORT_FILE), "w") as file:
+        json.dump(report, file, indent=2)
+    logger.info(f"Compacted model latency: {report}")
+    return model, feature_pipeline, score, report
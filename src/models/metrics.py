@@ -0,0 +1,93 @@
+from typing import Dict, Tuple
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.5
+# Booster attribute holding the decision threshold chosen at training time.
+THRESHOLD_ATTR = "decision_threshold"
+
+
+def stored_threshold(booster) -> float:
+    """
+    Decision threshold stored with a booster, the default one if it has none.
+    """
+    stored = booster.attr(THRESHOLD_ATTR)
+    return float(stored) if stored is not None else DEFAULT_THRESHOLD
+
+
+def threshold_sweep(y_true, y_score) -> Dict[str, np.ndarray]:
+    """
+    Precision, recall and F1 of every distinct decision threshold in a single
+    pass: the scores are sorted once and the true and false positives above
+    each threshold are cumulative sums, O(n log n) overall. A row is predicted
+    positive when its score is at least the threshold.
+
+    param y_true: binary labels
+    param y_score: predicted probabilities of the positive class
+    return: thresholds in decreasing order and their precision, recall and F1
+    """
+    y_true = np.asarray(y_true).ravel() == 1
+    y_score = np.asarray(y_score, dtype=np.float64).ravel()
+    order = np.argsort(-y_score, kind="stable")
+    sorted_scores = y_score[order]
+    true_positives = np.cumsum(y_true[order])
+    # Last row of every run of equal scores, all of them share a threshold.
+    last = np.flatnonzero(np.diff(sorted_scores, append=-np.inf))
+    true_positives = true_positives[last]
+    predicted_positives = last + 1
+
+    positives = true_positives[-1] if len(true_positives) else 0
+    precision = true_positives / predicted_positives
+    recall = true_positives / positives if positives else np.zeros(len(last))
+    denominator = predicted_positives + positives
+    f1 = np.divide(
+        2 * true_positives,
+        denominator,
+        out=np.zeros(len(last)),
+        where=denominator > 0,
+    )
+    return {
+        "thresholds": sorted_scores[last],
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+    }
+
+
+def best_threshold(y_true, y_score) -> Tuple[float, float]:
+    """
+    Decision threshold with the highest F1, ties go to the higher threshold.
+
+    return: threshold and its F1
+    """
+    sweep = threshold_sweep(y_true, y_score)
+    if not len(sweep["f1"]):
+        return DEFAULT_THRESHOLD, 0.0
+    best = int(np.argmax(sweep["f1"]))
+    return float(sweep["thresholds"][best]), float(sweep["f1"][best])
+
+
+def f1_at_threshold(y_true, y_score, threshold: float) -> float:
+    """
+    F1 of the predictions at a fixed decision threshold.
+    """
+    y_true = np.asarray(y_true).ravel() == 1
+    predicted = np.asarray(y_score).ravel() >= threshold
+    denominator = np.count_nonzero(y_true) + np.count_nonzero(predicted)
+    if not denominator:
+        return 0.0
+    return 2 * np.count_nonzero(y_true & predicted) / denominator
+
+
+def apply_threshold(y_score, threshold: float = DEFAULT_THRESHOLD) -> np.ndarray:
+    return (np.asarray(y_score) >= threshold).astype(int)
+
+
+def positive_scores(model, X) -> np.ndarray:
+    """
+    Probabilities of the positive class, or the predicted labels for models
+    without `predict_proba`.
+    """
+    if hasattr(model, "predict_proba"):
+        return np.asarray(model.predict_proba(X))[:, 1]
+    return np.asarray(model.predict(X), dtype=np.float64)
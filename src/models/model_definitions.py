@@ -1,9 +1,74 @@
-from typing import Protocol
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+import numpy as np
 import optuna
 import pandas as pd
-from sklearn.metrics import f1_score
-from sklearn.model_selection import train_test_split
+import xgboost as xgb
+from optuna.storages import BaseStorage, JournalStorage
+from optuna.storages.journal import JournalFileBackend
+from optuna.trial import TrialState
+from sklearn.model_selection import StratifiedKFold, train_test_split
+
+from src.config.modelling import INCREMENTAL_ROUNDS
+from src.models.metrics import (
+    DEFAULT_THRESHOLD,
+    THRESHOLD_ATTR,
+    best_threshold,
+    f1_at_threshold,
+    positive_scores,
+)
+
+logger = logging.getLogger(__name__)
+
+STUDY_NAME = "model_optimization"
+# Parameters every trial and refit shares, they are not searched.
+FIXED_PARAMS = {"objective": "binary:logistic"}
+# Booster attribute holding the searched hyperparameters of a model, XGBoost
+# does not persist training parameters in the model file.
+PARAMS_ATTR = "search_params"
+PRUNERS = {
+    "median": lambda: optuna.pruners.MedianPruner(
+        n_startup_trials=5, n_warmup_steps=20
+    ),
+    "successive_halving": lambda: optuna.pruners.SuccessiveHalvingPruner(
+        min_resource=10
+    ),
+    "hyperband": lambda: optuna.pruners.HyperbandPruner(
+        min_resource=10, max_resource=1000
+    ),
+    "none": optuna.pruners.NopPruner,
+}
+# Guards the best trial fit kept by parallel trials, module level so that
+# ModelOptimization stays picklable for worker processes.
+_BEST_FIT_LOCK = threading.Lock()
+# Guards the lazily built arrays and matrices shared by parallel trials.
+_MATRIX_LOCK = threading.RLock()
+MAX_BIN_GRID = (64, 128, 256)
+# Training arrays memory-mapped by cross-validation workers and the quantile
+# matrices of their folds, loaded once per process and reused by every trial.
+_SHARED_ARRAYS: Dict[str, Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]] = {}
+_FOLD_MATRICES: Dict[
+    Tuple[str, int, int, bool], Tuple[xgb.DMatrix, Optional[xgb.DMatrix]]
+] = {}
 
 
 class Model(Protocol):
@@ -23,42 +88,447 @@ class ModelEvaluation:
         y: pd.Series,
         test_size: float = 0.2,
         random_state: int = 42,
+        batch_rows: Optional[int] = None,
+        class_weight: Optional[Dict[int, float]] = None,
+        cv_folds: Optional[int] = None,
+        cv_workers: Optional[int] = None,
     ):
         """
         param X: features
         param y: target
         param test_size: size of the test set
         param random_state: random state for reproducibility
+        param batch_rows: rows per batch handed to XGBoost when building the
+            matrices, the whole split is converted at once if not set
+        param class_weight: training weight of each class, unweighted if not set
+        param cv_folds: number of stratified folds of the training split used by
+            `cross_validate`, cross-validation is disabled if not set
+        param cv_workers: processes training the folds, one per fold up to the
+            number of cores if not set
         """
         self.X_train, self.X_test, self.y_train, self.y_test = train_test_split(
             X, y, test_size=test_size, random_state=random_state
         )
+        self.feature_names = list(X.columns)
+        self.batch_rows = batch_rows
+        self.class_weight = class_weight
+        self.splits: Dict[str, Tuple[pd.DataFrame, pd.Series]] = {
+            "train": (self.X_train, self.y_train),
+            "test": (self.X_test, self.y_test),
+        }
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._matrices: Dict[Tuple[str, int], xgb.DMatrix] = {}
+        self.cv_folds = cv_folds
+        self.cv_workers = cv_workers or min(cv_folds or 1, os.cpu_count() or 1)
+        self.folds: List[Tuple[np.ndarray, np.ndarray]] = []
+        if cv_folds:
+            splitter = StratifiedKFold(
+                cv_folds, shuffle=True, random_state=random_state
+            )
+            self.folds = list(splitter.split(np.zeros(len(self.y_train)), self.y_train))
+        self._cv_dir: Optional[str] = None
+        self._cv_pool: Optional[ProcessPoolExecutor] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # XGBoost matrices cannot be pickled, worker processes build their own.
+        state = self.__dict__.copy()
+        state["_matrices"] = {}
+        # Worker processes share their own copies of the arrays with their folds.
+        state["_cv_pool"] = None
+        state["_cv_dir"] = None
+        return state
+
+    def get_array(self, split: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Features of a split as a contiguous float32 array and its labels,
+        converted on first use and shared afterwards.
+        """
+        with _MATRIX_LOCK:
+            if split not in self._arrays:
+                X, y = self.splits[split]
+                self._arrays[split] = (
+                    np.ascontiguousarray(X.to_numpy(dtype=np.float32)),
+                    y.to_numpy(),
+                )
+            return self._arrays[split]
+
+    def get_matrix(
+        self, split: str, max_bin: int, reference: Optional[str] = None
+    ) -> xgb.DMatrix:
+        """
+        Quantile-binned matrix of a split, built once per `max_bin` and shared by
+        all trials. Evaluation matrices take the bin boundaries of `reference`.
+
+        param split: name of the split in `splits`
+        param max_bin: maximum number of bins per feature
+        param reference: split whose bins are reused
+        """
+        with _MATRIX_LOCK:
+            if (split, max_bin) not in self._matrices:
+                ref = self.get_matrix(reference, max_bin) if reference else None
+                if self.batch_rows:
+                    data = _FrameBatches(
+                        *self.splits[split], self.batch_rows, self.sample_weight
+                    )
+                    matrix = xgb.QuantileDMatrix(data, max_bin=max_bin, ref=ref)
+                else:
+                    X, y = self.get_array(split)
+                    matrix = xgb.QuantileDMatrix(
+                        X,
+                        y,
+                        weight=self.sample_weight(y),
+                        max_bin=max_bin,
+                        ref=ref,
+                        feature_names=self.feature_names,
+                    )
+                self._matrices[(split, max_bin)] = matrix
+            return self._matrices[(split, max_bin)]
+
+    def sample_weight(self, y) -> Optional[np.ndarray]:
+        """
+        Training weights of the rows with labels `y`, None if unweighted.
+        """
+        if self.class_weight is None:
+            return None
+
+        y = np.asarray(y)
+        return np.where(y == 1, self.class_weight[1], self.class_weight[0]).astype(
+            np.float32
+        )
+
+    def _fit_kwargs(self, y) -> Dict[str, Any]:
+        if self.class_weight is None:
+            return {}
+        return {"sample_weight": self.sample_weight(y)}
 
     def evaluate_model(self, model: Model) -> float:
         model.fit(self.X_train, self.y_train)
-        y_pred = model.predict(self.X_test)
-        f1 = f1_score(self.y_test, y_pred)
+        _, f1 = best_threshold(self.y_test, positive_scores(model, self.X_test))
         return f1
 
+    def _share_arrays(self) -> str:
+        """
+        Saves the training arrays once as .npy files, which the fold workers
+        memory-map read-only, so every process reads the same pages instead of
+        receiving a pickled copy per task.
+        """
+        with _MATRIX_LOCK:
+            if self._cv_dir is None:
+                cv_dir = tempfile.mkdtemp(prefix="cv_arrays_")
+                X, y = self.get_array("train")
+                np.save(os.path.join(cv_dir, "X.npy"), X)
+                np.save(os.path.join(cv_dir, "y.npy"), y)
+                weight = self.sample_weight(y)
+                if weight is not None:
+                    np.save(os.path.join(cv_dir, "weight.npy"), weight)
+                self._cv_dir = cv_dir
+            return self._cv_dir
+
+    def cross_validate(
+        self,
+        model: type,
+        params: Dict[str, Any],
+        early_stopping_rounds: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Scores parameters on the precomputed stratified folds of the training
+        split, training the folds in parallel worker processes.
+
+        param model: model class, trained natively on quantile matrices if it
+            is an XGBoost model
+        param params: model parameters
+        param early_stopping_rounds: rounds without improvement on a validation
+            slice of the fold's training rows after which an XGBoost model stops
+            boosting, the held out fold is only scored
+        return: best F1 score, its decision threshold, fit seconds and boosting
+            rounds used of every fold, and the mean and standard deviation of
+            the scores
+        """
+        if not self.folds:
+            raise ValueError("Cross-validation needs cv_folds.")
+
+        native = isinstance(model, type) and issubclass(model, xgb.XGBModel)
+        if native and "n_jobs" not in params:
+            # The folds share the cores.
+            params = {
+                **params,
+                "n_jobs": max(1, (os.cpu_count() or 1) // self.cv_workers),
+            }
+        cv_dir = self._share_arrays()
+        tasks = [
+            (
+                cv_dir,
+                fold,
+                train_index,
+                test_index,
+                model,
+                native,
+                params,
+                early_stopping_rounds,
+                self.feature_names,
+            )
+            for fold, (train_index, test_index) in enumerate(self.folds)
+        ]
+        if self.cv_workers > 1:
+            with _MATRIX_LOCK:
+                if self._cv_pool is None:
+                    # Spawned, forking after OpenMP started can hang the workers.
+                    self._cv_pool = ProcessPoolExecutor(
+                        max_workers=self.cv_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+            results = list(self._cv_pool.map(_fit_fold, *zip(*tasks)))
+        else:
+            results = [_fit_fold(*task) for task in tasks]
+
+        scores = [result["f1"] for result in results]
+        return {
+            "scores": scores,
+            "thresholds": [result["threshold"] for result in results],
+            "fit_seconds": [result["fit_seconds"] for result in results],
+            "n_estimators_used": [result["n_estimators_used"] for result in results],
+            "mean": float(np.mean(scores)),
+            "std": float(np.std(scores)),
+        }
+
+    def close(self) -> None:
+        """
+        Stops the cross-validation workers and removes the shared arrays and
+        the fold matrices built in this process.
+        """
+        if self._cv_pool is not None:
+            self._cv_pool.shutdown()
+            self._cv_pool = None
+        if self._cv_dir is not None:
+            shutil.rmtree(self._cv_dir, ignore_errors=True)
+            _SHARED_ARRAYS.pop(self._cv_dir, None)
+            for key in [key for key in _FOLD_MATRICES if key[0] == self._cv_dir]:
+                _FOLD_MATRICES.pop(key, None)
+            self._cv_dir = None
+
+
+def _load_shared_arrays(
+    cv_dir: str,
+) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    if cv_dir not in _SHARED_ARRAYS:
+        weight_path = os.path.join(cv_dir, "weight.npy")
+        _SHARED_ARRAYS[cv_dir] = (
+            np.load(os.path.join(cv_dir, "X.npy"), mmap_mode="r"),
+            np.load(os.path.join(cv_dir, "y.npy"), mmap_mode="r"),
+            np.load(weight_path, mmap_mode="r")
+            if os.path.exists(weight_path)
+            else None,
+        )
+    return _SHARED_ARRAYS[cv_dir]
+
+
+def _fit_fold(
+    cv_dir: str,
+    fold: int,
+    train_index: np.ndarray,
+    test_index: np.ndarray,
+    model: type,
+    native: bool,
+    params: Dict[str, Any],
+    early_stopping_rounds: Optional[int],
+    feature_names: List[str],
+) -> Dict[str, Any]:
+    """
+    Trains on one fold of the memory-mapped training arrays and scores the
+    held out rows. Early stopping watches a validation slice of the training
+    rows, so the held out rows are only used for the score and threshold. Runs
+    in a worker process, where the quantile matrices of a fold are built once
+    per `max_bin` and reused by later trials.
+    """
+    start_time = time.perf_counter()
+    X, y, weight = _load_shared_arrays(cv_dir)
+    X_test, y_test = X[test_index], y[test_index]
+    n_estimators_used = None
+    if native:
+        max_bin = params.get("max_bin", MAX_BIN_GRID[-1])
+        key = (cv_dir, fold, max_bin, bool(early_stopping_rounds))
+        if key not in _FOLD_MATRICES:
+            fit_index, val_index = train_index, None
+            if early_stopping_rounds:
+                fit_index, val_index = train_test_split(
+                    train_index, test_size=0.2, random_state=42
+                )
+            dtrain = xgb.QuantileDMatrix(
+                X[fit_index],
+                y[fit_index],
+                weight=None if weight is None else weight[fit_index],
+                max_bin=max_bin,
+                feature_names=feature_names,
+            )
+            dval = None
+            if val_index is not None:
+                dval = xgb.QuantileDMatrix(
+                    X[val_index],
+                    y[val_index],
+                    weight=None if weight is None else weight[val_index],
+                    max_bin=max_bin,
+                    ref=dtrain,
+                    feature_names=feature_names,
+                )
+            _FOLD_MATRICES[key] = (dtrain, dval)
+        dtrain, dval = _FOLD_MATRICES[key]
+
+        booster_params = ModelOptimization._booster_params(params)
+        if early_stopping_rounds:
+            booster = xgb.train(
+                {**booster_params, "eval_metric": "logloss"},
+                dtrain,
+                num_boost_round=params["n_estimators"],
+                evals=[(dval, "validation_0")],
+                early_stopping_rounds=early_stopping_rounds,
+                verbose_eval=False,
+            )
+            booster = booster[: booster.best_iteration + 1]
+        else:
+            booster = xgb.train(
+                booster_params, dtrain, num_boost_round=params["n_estimators"]
+            )
+        n_estimators_used = booster.num_boosted_rounds()
+        y_score = booster.inplace_predict(X_test)
+    else:
+        estimator = model(**params)
+        fit_kwargs = {} if weight is None else {"sample_weight": weight[train_index]}
+        estimator.fit(X[train_index], y[train_index], **fit_kwargs)
+        y_score = positive_scores(estimator, X_test)
+
+    threshold, f1 = best_threshold(y_test, y_score)
+    return {
+        "f1": f1,
+        "threshold": threshold,
+        "fit_seconds": time.perf_counter() - start_time,
+        "n_estimators_used": n_estimators_used,
+    }
+
+
+class _FrameBatches(xgb.DataIter):
+    """
+    Hands a frame to XGBoost in float32 batches, so a quantile matrix is built
+    without converting the whole frame at once.
+    """
+
+    def __init__(
+        self,
+        X: pd.DataFrame,
+        y: pd.Series,
+        batch_rows: int,
+        sample_weight: Callable[[np.ndarray], Optional[np.ndarray]],
+    ):
+        self.X = X
+        self.y = y
+        self.batch_rows = batch_rows
+        self.sample_weight = sample_weight
+        self.position = 0
+        super().__init__()
+
+    def next(self, input_data) -> bool:
+        if self.position >= len(self.X):
+            return False
+
+        rows = slice(self.position, self.position + self.batch_rows)
+        label = self.y.iloc[rows].to_numpy()
+        input_data(
+            data=np.ascontiguousarray(self.X.iloc[rows].to_numpy(dtype=np.float32)),
+            label=label,
+            weight=self.sample_weight(label),
+            feature_names=list(self.X.columns),
+        )
+        self.position = rows.stop
+        return True
+
+    def reset(self) -> None:
+        self.position = 0
+
+
+class _PruningCallback(xgb.callback.TrainingCallback):
+    """
+    Reports the validation metric of every boosting round to Optuna and stops
+    the training once the pruner deems the trial unpromising. Loss metrics are
+    reported negated, since the study maximizes.
+    """
+
+    def __init__(self, trial: optuna.Trial, metric: str, minimize: bool = True):
+        self.trial = trial
+        self.metric = metric
+        self.sign = -1.0 if minimize else 1.0
+
+    def after_iteration(self, model, epoch: int, evals_log: dict) -> bool:
+        value = evals_log["validation_0"][self.metric][-1]
+        self.trial.report(self.sign * value, step=epoch)
+        if self.trial.should_prune():
+            raise optuna.TrialPruned(f"Trial pruned at boosting round {epoch}.")
+        return False
+
 
 class ModelOptimization(ModelEvaluation):
     """
     Optimizes the model by tuning hyperparameters.
     """
 
-    def __init__(self, X: pd.DataFrame, y: pd.Series, model: Model, threshold: float):
-        super().__init__(X, y)
+    def __init__(
+        self,
+        X: pd.DataFrame,
+        y: pd.Series,
+        model: Model,
+        threshold: float,
+        early_stopping_rounds: Optional[int] = 50,
+        pruner: str = "median",
+        max_bin_grid: Sequence[int] = MAX_BIN_GRID,
+        batch_rows: Optional[int] = None,
+        class_weight: Optional[Dict[int, float]] = None,
+        cv_folds: Optional[int] = None,
+        cv_workers: Optional[int] = None,
+    ):
+        super().__init__(
+            X,
+            y,
+            batch_rows=batch_rows,
+            class_weight=class_weight,
+            cv_folds=cv_folds,
+            cv_workers=cv_workers,
+        )
         """
     param params: dictionary of hyperparameters
     param model: model to be optimized
     param threshold: threshold to check if performance is good enough
+    param early_stopping_rounds: rounds without improvement of the validation
+        metric after which a trial stops boosting, disabled if not set
+    param pruner: pruner stopping unpromising trials, one of `PRUNERS`
+    param max_bin_grid: histogram bin counts tried by the search, XGBoost models
+        are trained natively on matrices shared by all trials
+    param batch_rows: rows per batch handed to XGBoost when building the matrices
+    param class_weight: training weight of each class, unweighted if not set
+    param cv_folds: score trials by stratified k-fold cross-validation of the
+        training split instead of the single holdout, see `cross_validate`
+    param cv_workers: processes training the folds of a trial
     """
         self.X: pd.DataFrame = X
         self.y: pd.Series = y
         self.model: Model = model
         self.score: tuple = ("f1_score", 0.0)
+        self.decision_threshold: float = DEFAULT_THRESHOLD
+        self.holdout_f1: Optional[float] = None
         self.threshold: float = threshold
         self.production_ready: bool = False
+        self.nthread: Optional[int] = None
+        self.early_stopping_rounds: Optional[int] = early_stopping_rounds
+        self.pruner: str = pruner
+        self.n_estimators_used: Optional[int] = None
+        self.best_fit: Optional[Dict[str, Any]] = None
+        self.max_bin_grid: Sequence[int] = max_bin_grid
+        self.native: bool = isinstance(model, type) and issubclass(model, xgb.XGBModel)
+        self.splits["full"] = (X, y)
+        # The validation split stops boosting early and picks the decision
+        # threshold, the test split is left to the final holdout check.
+        self.X_fit, self.X_val, self.y_fit, self.y_val = train_test_split(
+            self.X_train, self.y_train, test_size=0.2, random_state=42
+        )
+        self.splits["fit"] = (self.X_fit, self.y_fit)
+        self.splits["val"] = (self.X_val, self.y_val)
 
     def _set_objective(self, trial):
         param = {
@@ -67,35 +537,440 @@ class ModelOptimization(ModelEvaluation):
             "n_estimators": trial.suggest_int("n_estimators", 100, 1000),
             "subsample": trial.suggest_float("subsample", 0.5, 1.0),
             "colsample_bytree": trial.suggest_float("colsample_bytree", 0.5, 1.0),
-            "objective": "binary:logistic",
+            **FIXED_PARAMS,
+        }
+        if self.native:
+            param["max_bin"] = trial.suggest_categorical("max_bin", self.max_bin_grid)
+        if self.nthread is not None:
+            param["n_jobs"] = self.nthread
+
+        if self.cv_folds:
+            return self._cross_validate_trial(trial, param)
+
+        start_time = time.perf_counter()
+        if self.native:
+            split = "fit" if self.early_stopping_rounds else "train"
+            model = self._train_booster(param, split, trial)
+            y_score = self._predict_booster(model, "test")
+            if self.early_stopping_rounds:
+                trial.set_user_attr("n_estimators_used", model.num_boosted_rounds())
+        else:
+            model = self.model(**param)
+            model.fit(self.X_train, self.y_train, **self._fit_kwargs(self.y_train))
+            y_score = positive_scores(model, self.X_test)
+        fit_seconds = time.perf_counter() - start_time
+        trial.set_user_attr("fit_seconds", fit_seconds)
+
+        threshold, f1 = best_threshold(self.y_test, y_score)
+        trial.set_user_attr("decision_threshold", threshold)
+        # Only a model that never trained on the validation split can pick the
+        # final threshold on it.
+        if self.native and self.early_stopping_rounds:
+            self._keep_if_best(trial.number, f1, model, y_score, fit_seconds)
+        return f1
+
+    def _cross_validate_trial(
+        self, trial: optuna.Trial, param: Dict[str, Any]
+    ) -> float:
+        """
+        Mean F1 over the folds. There is no single model to keep, the best
+        parameters are refit for the holdout check, and trials are not pruned
+        since the folds train in other processes.
+        """
+        result = self.cross_validate(self.model, param, self.early_stopping_rounds)
+        trial.set_user_attr("fold_scores", result["scores"])
+        trial.set_user_attr("fold_seconds", result["fit_seconds"])
+        trial.set_user_attr("decision_threshold", float(np.mean(result["thresholds"])))
+        trial.set_user_attr("fit_seconds", sum(result["fit_seconds"]))
+        if self.native and self.early_stopping_rounds:
+            trial.set_user_attr(
+                "n_estimators_used", int(np.mean(result["n_estimators_used"]))
+            )
+        logger.info(
+            f"Trial {trial.number} F1 {result['mean']:.4f} ± {result['std']:.4f} "
+            f"over {len(result['scores'])} folds."
+        )
+        return result["mean"]
+
+    @staticmethod
+    def _booster_params(params: Dict[str, Any]) -> Dict[str, Any]:
+        booster_params = {
+            key: value
+            for key, value in params.items()
+            if key not in ("n_estimators", "n_jobs")
         }
-        model = self.model(**param)
+        if "n_jobs" in params:
+            booster_params["nthread"] = params["n_jobs"]
+        return booster_params
+
+    def _train_booster(
+        self,
+        params: Dict[str, Any],
+        split: str,
+        trial: Optional[optuna.Trial] = None,
+    ) -> xgb.Booster:
+        """
+        Trains a booster on the shared matrix of a split. In a trial with early
+        stopping it boosts until the validation loss stops improving and is cut
+        to its best iteration.
+        """
+        max_bin = params.get("max_bin", MAX_BIN_GRID[-1])
+        booster_params = self._booster_params(params)
+        if trial is None or not self.early_stopping_rounds:
+            return xgb.train(
+                booster_params,
+                self.get_matrix(split, max_bin),
+                num_boost_round=params["n_estimators"],
+            )
+
+        booster = xgb.train(
+            {**booster_params, "eval_metric": "logloss"},
+            self.get_matrix(split, max_bin),
+            num_boost_round=params["n_estimators"],
+            evals=[(self.get_matrix("val", max_bin, reference=split), "validation_0")],
+            early_stopping_rounds=self.early_stopping_rounds,
+            callbacks=[_PruningCallback(trial, "logloss")],
+            verbose_eval=False,
+        )
+        return booster[: booster.best_iteration + 1]
+
+    def _predict_booster(self, booster: xgb.Booster, split: str) -> np.ndarray:
+        X, _ = self.get_array(split)
+        return booster.inplace_predict(X)
+
+    def _to_model(self, booster: xgb.Booster, params: Dict[str, Any]) -> Model:
+        """
+        Wraps a natively trained booster into the configured model class.
+        """
+        model = self.model(**{**params, "n_estimators": booster.num_boosted_rounds()})
+        model.load_model(bytearray(booster.save_raw("ubj")))
+        return model
+
+    def _fit(self, params: Dict[str, Any], split: str) -> Model:
+        if not self.native:
+            model = self.model(**params)
+            X, y = self.splits[split]
+            model.fit(X, y, **self._fit_kwargs(y))
+            return model
+
+        booster = self._train_booster(params, split)
+        return self._to_model(booster, params)
+
+    def _keep_if_best(
+        self, number: int, f1: float, model: Model, y_score, fit_seconds: float
+    ) -> None:
+        """
+        Keeps the fitted model and holdout scores of the best trial so far,
+        so the final threshold check does not have to train it again. Only one
+        model is retained at a time, ties go to the earlier trial like in Optuna.
+        """
+        with _BEST_FIT_LOCK:
+            best = self.best_fit
+            if best is None or (f1, -number) > (best["f1"], -best["number"]):
+                self.best_fit = {
+                    "number": number,
+                    "f1": f1,
+                    "model": model,
+                    "y_score": y_score,
+                    "fit_seconds": fit_seconds,
+                }
 
-        return self.evaluate_model(model)
+    def _validation_threshold(self, model: Union[Model, xgb.Booster]) -> float:
+        """
+        Decision threshold with the best F1 on the validation split, for a model
+        trained on the fit split.
+        """
+        if isinstance(model, xgb.Booster):
+            y_score = self._predict_booster(model, "val")
+        else:
+            y_score = positive_scores(model, self.X_val)
+        threshold, _ = best_threshold(self.y_val, y_score)
+        return threshold
 
-    def _check_performance(self, candidate_model: Model) -> bool:
-        y_pred = candidate_model.predict(self.X_test)
-        f1 = f1_score(self.y_test, y_pred)
-        return f1 > self.threshold
+    def _check_performance(
+        self, candidate_model: Optional[Model], threshold: float, y_score=None
+    ) -> bool:
+        """
+        Checks the holdout F1 at a decision threshold picked on other data, so
+        the sweep does not inflate the check. The threshold is kept as the
+        threshold of the final model.
+        """
+        if y_score is None:
+            y_score = positive_scores(candidate_model, self.X_test)
+        self.decision_threshold = threshold
+        self.holdout_f1 = f1_at_threshold(self.y_test, y_score, threshold)
+        logger.info(
+            f"Holdout F1 {self.holdout_f1:.4f} at decision threshold "
+            f"{self.decision_threshold:.4f}."
+        )
+        return self.holdout_f1 > self.threshold
 
-    def optimize(self, n_trials: int = 20) -> Model:
+    def _store_attributes(self, model: Model, params: Dict[str, Any]) -> None:
+        """
+        Saves the decision threshold and the searched hyperparameters with the
+        model, as booster attributes for XGBoost models and as attributes of
+        other models.
+        """
+        if hasattr(model, "get_booster"):
+            model.get_booster().set_attr(
+                **{
+                    THRESHOLD_ATTR: repr(self.decision_threshold),
+                    PARAMS_ATTR: json.dumps(params),
+                }
+            )
+        else:
+            setattr(model, THRESHOLD_ATTR, self.decision_threshold)
+            setattr(model, PARAMS_ATTR, dict(params))
+
+    def continue_training(
+        self,
+        champion: Model,
+        n_rounds: int = INCREMENTAL_ROUNDS,
+        refit_full: bool = True,
+    ) -> Optional[Model]:
+        """
+        Continues boosting an XGBoost champion on this data instead of searching
+        again, typically the partitions added since it was trained. It boosts up
+        to `n_rounds` more rounds on the fit split, stopping early on the
+        validation split if enabled, picks the decision threshold on the
+        validation split and checks the holdout F1 like `optimize`.
+        With `refit_full` the same number of rounds is then boosted on all data.
+
+        param champion: trained XGBoost model to continue from
+        param n_rounds: maximum number of boosting rounds added
+        param refit_full: continue on the full data once the check passes
+        return: continued model, or None if the performance is below the threshold
+        """
+        if not self.native:
+            raise ValueError("Only XGBoost models can continue training.")
+
+        params = champion_params(champion) or {}
+        champion_booster = champion.get_booster()
+        champion_rounds = champion_booster.num_boosted_rounds()
+        max_bin = params.get("max_bin", MAX_BIN_GRID[-1])
+        booster_params = self._booster_params({**params, **FIXED_PARAMS})
+        if self.early_stopping_rounds:
+            booster = xgb.train(
+                {**booster_params, "eval_metric": "logloss"},
+                self.get_matrix("fit", max_bin),
+                num_boost_round=n_rounds,
+                evals=[(self.get_matrix("val", max_bin, reference="fit"), "val")],
+                early_stopping_rounds=self.early_stopping_rounds,
+                verbose_eval=False,
+                xgb_model=champion_booster,
+            )
+            booster = booster[: booster.best_iteration + 1]
+        else:
+            booster = xgb.train(
+                booster_params,
+                self.get_matrix("fit", max_bin),
+                num_boost_round=n_rounds,
+                xgb_model=champion_booster,
+            )
+        added_rounds = booster.num_boosted_rounds() - champion_rounds
+        logger.info(
+            f"Continued the champion's {champion_rounds} boosting rounds "
+            f"by {added_rounds}."
+        )
+
+        threshold = self._validation_threshold(booster)
+        y_score = self._predict_booster(booster, "test")
+        if not self._check_performance(None, threshold, y_score):
+            self.production_ready = False
+            return None
+
+        if refit_full:
+            booster = xgb.train(
+                booster_params,
+                self.get_matrix("full", max_bin),
+                num_boost_round=added_rounds,
+                xgb_model=champion_booster,
+            )
+
+        final_model = self._to_model(booster, {**params, **FIXED_PARAMS})
+        self._store_attributes(final_model, params)
+        self.production_ready = True
+        self.score = ("f1_score", self.holdout_f1)
+        return final_model
+
+    def refit(self, params: Dict[str, Any], refit_full: bool = True) -> Optional[Model]:
+        """
+        Trains given hyperparameters without a search, with the threshold choice
+        and holdout check of `optimize`.
+
+        param params: hyperparameters of the model
+        param refit_full: retrain on the full data once the check passes
+        return: trained model, or None if the performance is below the threshold
+        """
+        model = self._fit(params, "fit")
+        if not self._check_performance(model, self._validation_threshold(model)):
+            self.production_ready = False
+            return None
+
+        final_model = self._fit(params, "full") if refit_full else model
+        self._store_attributes(
+            final_model,
+            {key: value for key, value in params.items() if key not in FIXED_PARAMS},
+        )
+        self.production_ready = True
+        self.score = ("f1_score", self.holdout_f1)
+        return final_model
+
+    def _seed_params(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Parameters of a seed trial, a histogram bin count outside the grid is
+        left to the search.
+        """
+        seed = dict(params)
+        if seed.get("max_bin") not in self.max_bin_grid:
+            seed.pop("max_bin", None)
+        return seed
+
+    def _run_trials(
+        self, storage: str, study_name: str, n_trials: int, n_jobs: int
+    ) -> Optional[Dict[str, Any]]:
+        study = optuna.load_study(
+            study_name=study_name,
+            storage=_create_storage(storage),
+            pruner=PRUNERS[self.pruner](),
+        )
+        try:
+            study.optimize(self._set_objective, n_trials=n_trials, n_jobs=n_jobs)
+        finally:
+            self.close()
+        return self.best_fit
+
+    def optimize(
+        self,
+        n_trials: int = 20,
+        n_jobs: int = 1,
+        n_processes: int = 1,
+        storage: Optional[str] = None,
+        study_name: str = STUDY_NAME,
+        refit_full: bool = True,
+        seed_params: Optional[Dict[str, Any]] = None,
+    ) -> Model:
         """
         Optimizes the model by tuning hyperparameters. If the score is high enough
         the model is deemed ready for production.
 
+        Trials run on `n_jobs` threads in each of `n_processes` processes, and
+        every trial trains with its share of the CPU cores. With a storage the
+        study is persisted, so an interrupted study resumes and only runs the
+        trials still missing to reach `n_trials`.
+
+        The decision threshold is picked on the validation split by the best
+        parameters trained on the fit split, or averaged over the folds with
+        cross-validation, and the holdout only checks the F1 at it. With early
+        stopping the best trial's model and holdout predictions are reused for
+        the check. Unless `refit_full` is set, the checked model is also returned
+        as the final one instead of training again on all data.
+
         param n_trials: number of trials to run
+        param n_jobs: number of parallel trials per process
+        param n_processes: number of processes sharing the study
+        param storage: database URL (e.g. sqlite:///optuna.db) or journal file path
+        param study_name: name of the study in the storage
+        param refit_full: retrain the best parameters on the full data
+        param seed_params: hyperparameters evaluated first, e.g. those of the
+            current champion, see `champion_params`
         """
-        study = optuna.create_study(direction="maximize")
-        study.optimize(self._set_objective, n_trials=n_trials)
-        best_params = study.best_params
-        best_model = self.model(**best_params)
-        best_model.fit(self.X_train, self.y_train)
+        if n_processes > 1 and storage is None:
+            raise ValueError("Multi-process optimization needs a shared storage.")
+
+        workers = n_jobs * n_processes
+        self.nthread = max(1, (os.cpu_count() or 1) // workers) if workers > 1 else None
+        study = optuna.create_study(
+            direction="maximize",
+            study_name=study_name,
+            storage=_create_storage(storage),
+            pruner=PRUNERS[self.pruner](),
+            load_if_exists=True,
+        )
+        finished = [
+            trial
+            for trial in study.trials
+            if trial.state in (TrialState.COMPLETE, TrialState.PRUNED)
+        ]
+        remaining = max(0, n_trials - len(finished))
+        if finished:
+            logger.info(f"Resuming study {study_name} after {len(finished)} trials.")
+        if seed_params and remaining:
+            study.enqueue_trial(self._seed_params(seed_params), skip_if_exists=True)
+
+        if n_processes > 1:
+            trials_per_process = [
+                remaining // n_processes + (i < remaining % n_processes)
+                for i in range(n_processes)
+            ]
+            # Spawned, forking after XGBoost started its OpenMP threads, e.g.
+            # when continuing a champion first, can hang the children.
+            with ProcessPoolExecutor(
+                max_workers=n_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        self._run_trials, storage, study_name, process_trials, n_jobs
+                    )
+                    for process_trials in trials_per_process
+                    if process_trials
+                ]
+                for future in futures:
+                    best_fit = future.result()
+                    if best_fit is not None:
+                        self._keep_if_best(**best_fit)
+        elif remaining:
+            try:
+                study.optimize(self._set_objective, n_trials=remaining, n_jobs=n_jobs)
+            finally:
+                self.close()
+
+        self.nthread = None
+        search_params = study.best_params
+        best_params = {**search_params, **FIXED_PARAMS}
+        self.n_estimators_used = study.best_trial.user_attrs.get("n_estimators_used")
+        if self.n_estimators_used is not None:
+            logger.info(
+                f"Best trial used {self.n_estimators_used} of "
+                f"{best_params.get('n_estimators')} boosting rounds."
+            )
+            best_params = {**best_params, "n_estimators": self.n_estimators_used}
+
+        best_fit, self.best_fit = self.best_fit, None
+        if self.cv_folds:
+            threshold = study.best_trial.user_attrs.get(
+                "decision_threshold", DEFAULT_THRESHOLD
+            )
+            best_model, y_score = self._fit(best_params, "train"), None
+        elif best_fit is not None and best_fit["number"] == study.best_trial.number:
+            threshold = self._validation_threshold(best_fit["model"])
+            best_model = self._to_model(best_fit["model"], best_params)
+            y_score = best_fit["y_score"]
+            logger.info(
+                f"Reused the model of trial {best_fit['number']}, "
+                f"saved a {best_fit['fit_seconds']:.2f}s refit."
+            )
+        else:
+            best_model, y_score = self._fit(best_params, "fit"), None
+            threshold = self._validation_threshold(best_model)
 
-        if self._check_performance(best_model):
-            final_model = self.model(**best_params)
-            final_model.fit(self.X, self.y)
+        if self._check_performance(best_model, threshold, y_score):
+            if refit_full:
+                final_model = self._fit(best_params, "full")
+            else:
+                final_model = best_model
+                if best_fit is not None:
+                    full_fit_seconds = (
+                        best_fit["fit_seconds"] * len(self.X) / len(self.X_fit)
+                    )
+                    logger.info(
+                        "Skipped the refit on the full data, "
+                        f"saved about {full_fit_seconds:.2f}s."
+                    )
+            self._store_attributes(final_model, search_params)
             self.production_ready = True
-            self.score = ("f1_score", study.best_value)
+            self.score = ("f1_score", self.holdout_f1)
         else:
             self.production_ready = False
             final_model = None
@@ -107,3 +982,25 @@ class ModelOptimization(ModelEvaluation):
         Returns the final score of the model if it satisfies the criteria.
         """
         return self.score
+
+
+def champion_params(model: Model) -> Optional[Dict[str, Any]]:
+    """
+    Searched hyperparameters saved with a model by `ModelOptimization`, None for
+    models trained before they were saved.
+    """
+    if hasattr(model, "get_booster"):
+        params = model.get_booster().attr(PARAMS_ATTR)
+        return json.loads(params) if params is not None else None
+    return getattr(model, PARAMS_ATTR, None)
+
+
+def _create_storage(storage: Optional[str]) -> Union[str, BaseStorage, None]:
+    """
+    Database URLs are passed to Optuna as they are, anything else is used as the
+    path of a journal file, which several processes can safely append to.
+    """
+    if storage is None or "://" in storage:
+        return storage
+
+    return JournalStorage(JournalFileBackend(storage))
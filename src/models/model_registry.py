@@ -1,39 +1,139 @@
+import functools
+import json
+import logging
 import os
+import tempfile
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
 
-import mlflow
-from dotenv import load_dotenv
-from mlflow import MlflowClient
-from mlflow.deployments import get_deploy_client
-from pandas import DataFrame
+from src.config.registry import (
+    CATALOG_NAME,
+    EXPERIMENT_NAME,
+    LOCAL_REGISTRY_DIR,
+    REGISTRY_BACKEND,
+    SCHEMA_NAME,
+)
+from src.data.features import FEATURE_PIPELINE_FILE
+from src.models.metrics import THRESHOLD_ATTR, stored_threshold
 
-from src.models.model_definitions import Model
+if TYPE_CHECKING:
+    from mlflow import MlflowClient
+    from pandas import DataFrame
+
+    from src.models.model_definitions import Model
+
+logger = logging.getLogger(__name__)
+
+COMPACT_ARTIFACT_PATH = "compact"
+# MLflow model from code serving a classifier at its decision threshold.
+SERVING_MODEL_CODE = os.path.join(os.path.dirname(__file__), "serving_model.py")
+# Experiment ids by tracking URI and experiment name, looked up once per process.
+_EXPERIMENT_IDS: Dict[Tuple[str, str], str] = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _load_env() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logger.debug(f"Using Databricks host {os.getenv('DATABRICKS_HOST')}.")
+
+
+@functools.lru_cache(maxsize=None)
+def _get_client(tracking_uri: str, registry_uri: str) -> "MlflowClient":
+    """
+    MLflow client shared by every registry of a process using the same servers.
+    """
+    from mlflow import MlflowClient
+
+    return MlflowClient(tracking_uri, registry_uri)
 
 
 class DatabricksModelRegistry:
+    """
+    Model registry on Databricks Unity Catalog. Nothing is imported or
+    connected until a method needs it, and the MLflow client and experiment id
+    are shared by all instances of a process.
+    """
+
+    tracking_uri = "databricks"
+    registry_uri = "databricks-uc"
+    artifact_location: Optional[str] = None
+
     def __init__(self):
-        load_dotenv()
-        print("DEBUGGING DATABRICKS_HOST:", os.getenv("DATABRICKS_HOST")[:5])
-        mlflow.set_tracking_uri("databricks")
-        mlflow.set_registry_uri("databricks-uc")
-        self.client = MlflowClient()
-        self.catalog_name = "workspace"
-        self.schema_name = "default"
-
-    def _log_model(self, model: Model, score: tuple, name: str, sample: DataFrame):
-        experiment_name = (
-            f"/Users/{os.getenv('DBX_USER')}/fraud_detection_model_registry_experiment"
-        )
-        experiment = self.client.get_experiment_by_name(experiment_name)
-        if experiment is None:
-            experiment_id = self.client.create_experiment(experiment_name)
-        else:
-            experiment_id = experiment.experiment_id
-
-        with mlflow.start_run(experiment_id=experiment_id) as run:
-            mlflow.xgboost.log_model(
-                xgb_model=model, name=name, input_example=sample.iloc[[0]]
+        self.catalog_name = CATALOG_NAME
+        self.schema_name = SCHEMA_NAME
+
+    def _configure(self) -> None:
+        _load_env()
+
+    def _mlflow(self):
+        """
+        The mlflow module, imported on first use, with the fluent API pointed
+        at this registry's servers.
+        """
+        import mlflow
+
+        self._configure()
+        mlflow.set_tracking_uri(self.tracking_uri)
+        mlflow.set_registry_uri(self.registry_uri)
+        return mlflow
+
+    @property
+    def client(self) -> "MlflowClient":
+        self._mlflow()
+        return _get_client(self.tracking_uri, self.registry_uri)
+
+    @property
+    def experiment_name(self) -> str:
+        return f"/Users/{os.getenv('DBX_USER')}/{EXPERIMENT_NAME}"
+
+    def _experiment_id(self) -> str:
+        client = self.client
+        key = (self.tracking_uri, self.experiment_name)
+        if key not in _EXPERIMENT_IDS:
+            experiment = client.get_experiment_by_name(key[1])
+            if experiment is None:
+                _EXPERIMENT_IDS[key] = client.create_experiment(
+                    key[1], artifact_location=self.artifact_location
+                )
+            else:
+                _EXPERIMENT_IDS[key] = experiment.experiment_id
+        return _EXPERIMENT_IDS[key]
+
+    def _log_model(
+        self,
+        model: "Model",
+        score: tuple,
+        name: str,
+        sample: "DataFrame",
+        feature_pipeline: Optional[Dict[str, Any]] = None,
+        metrics: Optional[Dict[str, float]] = None,
+        compact_dir: Optional[str] = None,
+    ):
+        mlflow = self._mlflow()
+        experiment_id = self._experiment_id()
+
+        with (
+            mlflow.start_run(experiment_id=experiment_id) as run,
+            tempfile.TemporaryDirectory() as model_dir,
+        ):
+            model_path = os.path.join(model_dir, "model.ubj")
+            model.save_model(model_path)
+            mlflow.pyfunc.log_model(
+                name=name,
+                python_model=SERVING_MODEL_CODE,
+                artifacts={"model": model_path},
+                model_config={THRESHOLD_ATTR: stored_threshold(model.get_booster())},
+                input_example=sample.iloc[[0]],
+                pip_requirements=mlflow.xgboost.get_default_pip_requirements(),
             )
             mlflow.log_metric(score[0], score[1])
+            if feature_pipeline is not None:
+                mlflow.log_dict(feature_pipeline, FEATURE_PIPELINE_FILE)
+            if metrics:
+                mlflow.log_metrics(metrics)
+            if compact_dir is not None:
+                mlflow.log_artifacts(compact_dir, COMPACT_ARTIFACT_PATH)
             run_id = run.info.run_id
             model_uri = f"runs:/{run_id}/{name}"
 
@@ -43,6 +143,7 @@ class DatabricksModelRegistry:
         """
         Register a model in the MLflow Model Registry.
         """
+        mlflow = self._mlflow()
         try:
             model_version_class = mlflow.register_model(model_uri, name)
             self.client.set_registered_model_alias(
@@ -58,21 +159,85 @@ class DatabricksModelRegistry:
         """
         return self.client.get_model_version(name, version)
 
-    def push_model(self, model: Model, score: tuple, name: str, sample: DataFrame):
+    def get_champion_version(self, model_name: str):
+        """
+        Get the model version currently holding the champion alias.
+        """
+        model_full_name = f"{self.catalog_name}.{self.schema_name}.{model_name}"
+        return self.client.get_model_version_by_alias(model_full_name, "champion")
+
+    def load_model(self, model_name: str, version: int):
+        """
+        Load the XGBoost model of a specific version of a registered model.
+        """
+        mlflow = self._mlflow()
+        model_full_name = f"{self.catalog_name}.{self.schema_name}.{model_name}"
+        model_uri = f"models:/{model_full_name}/{version}"
+        if "xgboost" in mlflow.models.get_model_info(model_uri).flavors:
+            # Versions registered before the served model applied the threshold.
+            return mlflow.xgboost.load_model(model_uri)
+        return mlflow.pyfunc.load_model(model_uri).unwrap_python_model().model
+
+    def load_feature_pipeline(self, model_version) -> Optional[Dict[str, Any]]:
         """
-        Push a model to the MLflow Model Registry.
+        Load the feature pipeline logged with a model version, None for versions
+        registered without one.
         """
-        run_id, model_uri = self._log_model(model, score, name, sample)
+        mlflow = self._mlflow()
+        try:
+            return mlflow.artifacts.load_dict(
+                f"runs:/{model_version.run_id}/{FEATURE_PIPELINE_FILE}"
+            )
+        except mlflow.exceptions.MlflowException:
+            return None
+
+    def load_champion(
+        self, model_name: str
+    ) -> Optional[Tuple["Model", Optional[Dict[str, Any]]]]:
+        """
+        Load the champion version of a registered model and its feature
+        pipeline, None if no version holds the champion alias yet.
+        """
+        mlflow = self._mlflow()
+        try:
+            model_version = self.get_champion_version(model_name)
+        except mlflow.exceptions.MlflowException:
+            return None
+        logger.info(f"Loading {model_name} champion version {model_version.version}.")
+        model = self.load_model(model_name, model_version.version)
+        return model, self.load_feature_pipeline(model_version)
+
+    def push_model(
+        self,
+        model: "Model",
+        score: tuple,
+        name: str,
+        sample: "DataFrame",
+        feature_pipeline: Optional[Dict[str, Any]] = None,
+        metrics: Optional[Dict[str, float]] = None,
+        compact_dir: Optional[str] = None,
+    ):
+        """
+        Push a model and its feature pipeline to the MLflow Model Registry,
+        `metrics` are logged to its run alongside the score and the files of
+        `compact_dir`, the exported model of `compact_model`, under `compact/`.
+        The model is logged as `serving_model`, so the endpoint predicts labels
+        at the decision threshold stored with it.
+        """
+        run_id, model_uri = self._log_model(
+            model, score, name, sample, feature_pipeline, metrics, compact_dir
+        )
         self._register_model(
             model_uri, f"{self.catalog_name}.{self.schema_name}.{name}", run_id
         )
 
     def deploy_model(self, endpoint_name: str, model_name: str):
+        from mlflow.deployments import get_deploy_client
+
         model_full_name = f"{self.catalog_name}.{self.schema_name}.{model_name}"
+        self._configure()
         deploy_client = get_deploy_client("databricks")
-        champion_version = self.client.get_model_version_by_alias(
-            model_full_name, "champion"
-        )
+        champion_version = self.get_champion_version(model_name)
 
         endpoint = deploy_client.create_endpoint(
             name=endpoint_name,
@@ -98,7 +263,74 @@ class DatabricksModelRegistry:
         return endpoint
 
 
+class LocalModelRegistry(DatabricksModelRegistry):
+    """
+    Stand-in registry on a local MLflow SQLite database with the artifacts on
+    disk, so the train, register and deploy flow runs and is benchmarked
+    offline. Deploying writes the champion's booster and feature pipeline to an
+    endpoint directory, which a local server such as
+    `src.benchmarks.mock_endpoint --model_path` serves.
+    """
+
+    def __init__(self, registry_dir: str = LOCAL_REGISTRY_DIR):
+        """
+        param registry_dir: directory of the tracking database, the artifacts
+            and the deployed endpoints
+        """
+        super().__init__()
+        self.registry_dir = os.path.abspath(registry_dir)
+        database_path = os.path.join(self.registry_dir, "mlflow.db")
+        self.tracking_uri = self.registry_uri = f"sqlite:///{database_path}"
+        self.artifact_location = f"file:{os.path.join(self.registry_dir, 'artifacts')}"
+
+    def _configure(self) -> None:
+        os.makedirs(self.registry_dir, exist_ok=True)
+
+    @property
+    def experiment_name(self) -> str:
+        return EXPERIMENT_NAME
+
+    def deploy_model(self, endpoint_name: str, model_name: str):
+        model_full_name = f"{self.catalog_name}.{self.schema_name}.{model_name}"
+        champion_version = self.get_champion_version(model_name)
+        model = self.load_model(model_name, champion_version.version)
+        feature_pipeline = self.load_feature_pipeline(champion_version)
+
+        endpoint_dir = os.path.join(self.registry_dir, "endpoints", endpoint_name)
+        os.makedirs(endpoint_dir, exist_ok=True)
+        endpoint = {
+            "name": endpoint_name,
+            "entity_name": model_full_name,
+            "entity_version": champion_version.version,
+            "model_path": os.path.join(endpoint_dir, "model.ubj"),
+        }
+        model.get_booster().save_model(endpoint["model_path"])
+        if feature_pipeline is not None:
+            endpoint["feature_pipeline_path"] = os.path.join(
+                endpoint_dir, FEATURE_PIPELINE_FILE
+            )
+            with open(endpoint["feature_pipeline_path"], "w") as file:
+                json.dump(feature_pipeline, file)
+        with open(os.path.join(endpoint_dir, "endpoint.json"), "w") as file:
+            json.dump(endpoint, file, indent=2)
+        return endpoint
+
+
+REGISTRIES = {"databricks": DatabricksModelRegistry, "local": LocalModelRegistry}
+
+
+def get_registry(backend: str = REGISTRY_BACKEND) -> DatabricksModelRegistry:
+    """
+    Registry of a backend in `REGISTRIES`, Databricks by default or as set by
+    the MODEL_REGISTRY_BACKEND environment variable.
+    """
+    if backend not in REGISTRIES:
+        raise ValueError(f"Unknown registry backend {backend}.")
+    return REGISTRIES[backend]()
+
+
 if __name__ == "__main__":
-    registry = DatabricksModelRegistry()
+    logging.basicConfig(level=logging.INFO)
+    registry = get_registry()
 
-    print(registry.client)
+    logger.info(registry.client)
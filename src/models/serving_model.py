@@ -0,0 +1,27 @@
+"""
+Model served by the endpoint, logged by `DatabricksModelRegistry` as an MLflow
+model from code: the registered XGBoost classifier predicting labels at the
+decision threshold chosen at training time instead of XGBoost's fixed 0.5.
+
+MLflow copies this file into the model, so it only imports packages of the
+serving environment.
+"""
+
+import numpy as np
+import xgboost as xgb
+from mlflow.models import set_model
+from mlflow.pyfunc import PythonModel
+
+
+class ThresholdedClassifier(PythonModel):
+    def load_context(self, context) -> None:
+        self.model = xgb.XGBClassifier()
+        self.model.load_model(context.artifacts["model"])
+        self.threshold = float(context.model_config["decision_threshold"])
+
+    def predict(self, context, model_input, params=None) -> np.ndarray:
+        scores = self.model.predict_proba(model_input)[:, 1]
+        return (scores >= self.threshold).astype(int)
+
+
+set_model(ThresholdedClassifier())
@@ -1,12 +1,34 @@
-from typing import Tuple, Union
+import logging
+from typing import Dict, Optional, Sequence, Tuple, Union
 
 import pandas as pd
 
-from src.models.model_definitions import Model, ModelOptimization
+from src.config.modelling import INCREMENTAL_ROUNDS
+from src.models.model_definitions import (
+    MAX_BIN_GRID,
+    Model,
+    ModelOptimization,
+    champion_params,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def train(
-    X: pd.DataFrame, y: pd.Series, model: Model, performance_threshold: float
+    X: pd.DataFrame,
+    y: pd.Series,
+    model: Model,
+    performance_threshold: float,
+    early_stopping_rounds: Optional[int] = 50,
+    pruner: str = "median",
+    max_bin_grid: Sequence[int] = MAX_BIN_GRID,
+    batch_rows: Optional[int] = None,
+    class_weight: Optional[Dict[int, float]] = None,
+    cv_folds: Optional[int] = None,
+    cv_workers: Optional[int] = None,
+    champion: Optional[Model] = None,
+    incremental_rounds: int = INCREMENTAL_ROUNDS,
+    **optimize_kwargs,
 ) -> Tuple[Union[Model, None], tuple]:
     """
     Trains and optimizes the model. If the performance is below the threshold
@@ -15,9 +37,46 @@ def train(
     param data: data to be used for training
     param model: model to be trained
     param performance_threshold: threshold to check if performance is good enough
+    param early_stopping_rounds: rounds without improvement before a trial stops
+    param pruner: pruner stopping unpromising trials
+    param max_bin_grid: histogram bin counts tried by the search
+    param batch_rows: rows per batch handed to XGBoost, all at once if not set
+    param class_weight: training weight of each class, unweighted if not set
+    param cv_folds: score trials by stratified k-fold cross-validation
+    param cv_workers: processes training the folds of a trial
+    param champion: current production model, boosting continues from it on this
+        data and the hyperparameters are only searched again, seeded with its
+        own, if the continued model falls below the threshold
+    param incremental_rounds: maximum boosting rounds added to the champion
+    param optimize_kwargs: search options passed to `ModelOptimization.optimize`
     return: trained model and best score, or None and 0.0 if not ready for production
     """
 
-    mo = ModelOptimization(X, y, model, performance_threshold)
+    mo = ModelOptimization(
+        X,
+        y,
+        model,
+        performance_threshold,
+        early_stopping_rounds,
+        pruner,
+        max_bin_grid,
+        batch_rows,
+        class_weight,
+        cv_folds,
+        cv_workers,
+    )
+
+    seed_params = None
+    if champion is not None:
+        if mo.native:
+            model = mo.continue_training(
+                champion,
+                incremental_rounds,
+                refit_full=optimize_kwargs.get("refit_full", True),
+            )
+            if model is not None:
+                return model, mo.score
+            logger.info("Continued champion below the threshold, searching again.")
+        seed_params = champion_params(champion)
 
-    return mo.optimize(), mo.score
+    return mo.optimize(seed_params=seed_params, **optimize_kwargs), mo.score
@@ -1,13 +1,41 @@
 import argparse
 import logging
+import os
+import tempfile
+from datetime import date
+from typing import Optional, Tuple
 
 import xgboost as xgb
 
-from src.config.modelling import TARGET
-from src.data.extraction import load_data
-from src.data.preprocessing import preprocess
-from src.models.model_registry import DatabricksModelRegistry
+from src.config.modelling import (
+    CHUNK_SIZE,
+    FEATURE_DTYPE,
+    INCREMENTAL_ROUNDS,
+    MEMORY_BUDGET_MB,
+    TARGET,
+)
+from src.config.registry import REGISTRY_BACKEND
+from src.data.cache import S3DataCache
+from src.data.extraction import (
+    load_data,
+    load_data_in_chunks,
+    load_dataset_from_s3,
+    load_dataset_in_chunks,
+    resolve_data_path,
+)
+from src.data.features import FILL_STRATEGIES, FeaturePipeline
+from src.data.preprocessing import (
+    REBALANCE_STRATEGIES,
+    preprocess,
+    undersample_in_chunks,
+)
+from src.models.compaction import compact_model
+from src.models.metrics import THRESHOLD_ATTR, stored_threshold
+from src.models.model_definitions import MAX_BIN_GRID, PRUNERS, STUDY_NAME, Model
+from src.models.model_registry import REGISTRIES, get_registry
 from src.models.train_model import train
+from src.utils.aws import parse_s3_path
+from src.utils.instrumentation import count, instrumentation, span
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,27 +58,330 @@ def parse_args():
         default=0.8,
         help="Performance threshold for production readiness.",
     )
+    parser.add_argument(
+        "--start_date",
+        type=date.fromisoformat,
+        help="First daily S3 partition to train on (YYYY-MM-DD).",
+    )
+    parser.add_argument(
+        "--end_date",
+        type=date.fromisoformat,
+        help="Last daily S3 partition to train on (YYYY-MM-DD).",
+    )
+    parser.add_argument(
+        "--latest_n",
+        type=int,
+        help="Train on the newest N selected S3 partitions.",
+    )
+    parser.add_argument(
+        "--max_workers",
+        type=int,
+        default=8,
+        help="Number of S3 partitions downloaded concurrently.",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=os.getenv("DATA_CACHE_DIR"),
+        help="Directory of the local S3 data cache, disabled if not set.",
+    )
+    parser.add_argument(
+        "--rebalance",
+        type=str,
+        choices=REBALANCE_STRATEGIES,
+        default="undersample",
+        help="Undersample the majority class or weight the minority class up, in memory.",
+    )
+    parser.add_argument(
+        "--majority_ratio",
+        type=float,
+        default=1.0,
+        help="Majority to minority class ratio after rebalancing.",
+    )
+    parser.add_argument(
+        "--fill_missing",
+        type=str,
+        choices=FILL_STRATEGIES,
+        default="none",
+        help="Fill missing feature values, or leave them to XGBoost.",
+    )
+    parser.add_argument(
+        "--out_of_core",
+        action="store_true",
+        help="Stream the data in chunks and undersample it within --memory_budget_mb.",
+    )
+    parser.add_argument(
+        "--memory_budget_mb",
+        type=int,
+        default=MEMORY_BUDGET_MB,
+        help="Memory available for the sampled training data with --out_of_core.",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="Rows per chunk read and handed to XGBoost with --out_of_core.",
+    )
+    parser.add_argument(
+        "--n_trials",
+        type=int,
+        default=20,
+        help="Number of hyperparameter search trials.",
+    )
+    parser.add_argument(
+        "--n_jobs",
+        type=int,
+        default=1,
+        help="Number of trials run in parallel threads of each process.",
+    )
+    parser.add_argument(
+        "--n_processes",
+        type=int,
+        default=1,
+        help="Number of processes sharing the study, requires --study_storage.",
+    )
+    parser.add_argument(
+        "--study_storage",
+        type=str,
+        help="Database URL or journal file persisting the study, so it can resume.",
+    )
+    parser.add_argument(
+        "--study_name",
+        type=str,
+        default=STUDY_NAME,
+        help="Name of the study in --study_storage.",
+    )
+    parser.add_argument(
+        "--early_stopping_rounds",
+        type=int,
+        default=50,
+        help="Rounds without validation improvement before a trial stops, 0 disables.",
+    )
+    parser.add_argument(
+        "--pruner",
+        type=str,
+        choices=sorted(PRUNERS),
+        default="median",
+        help="Pruner stopping unpromising trials early.",
+    )
+    parser.add_argument(
+        "--max_bin_grid",
+        type=int,
+        nargs="+",
+        default=list(MAX_BIN_GRID),
+        help="Histogram bin counts tried by the search.",
+    )
+    parser.add_argument(
+        "--cv_folds",
+        type=int,
+        help="Score trials by stratified k-fold cross-validation instead of one split.",
+    )
+    parser.add_argument(
+        "--cv_workers",
+        type=int,
+        help="Processes training the folds of a trial, one per fold by default.",
+    )
+    parser.add_argument(
+        "--skip_full_refit",
+        action="store_true",
+        help="Register the best trial's model instead of refitting on all data.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Continue boosting the champion on the selected data, e.g. the newest "
+        "partitions, searching again only if it falls below the threshold.",
+    )
+    parser.add_argument(
+        "--incremental_rounds",
+        type=int,
+        default=INCREMENTAL_ROUNDS,
+        help="Maximum boosting rounds added to the champion with --incremental.",
+    )
+    parser.add_argument(
+        "--champion_path",
+        type=str,
+        help="Local model file used as the champion with --incremental, instead of "
+        "the registered champion.",
+    )
+    parser.add_argument(
+        "--champion_pipeline_path",
+        type=str,
+        help="Feature pipeline JSON of --champion_path, refit if not set.",
+    )
+    parser.add_argument(
+        "--max_features",
+        type=int,
+        help="Retrain the registered model on its features of highest gain, if it "
+        "still passes the performance threshold.",
+    )
+    parser.add_argument(
+        "--registry_backend",
+        type=str,
+        choices=sorted(REGISTRIES),
+        default=REGISTRY_BACKEND,
+        help="Model registry, Databricks or the local MLflow stand-in.",
+    )
+    parser.add_argument(
+        "--metrics_path",
+        type=str,
+        help="Record stage timings, counters and peak RSS, exported to this JSON "
+        "or .prom file and logged with the model.",
+    )
 
     return parser.parse_args()
 
 
 def main():
     args = parse_args()
+    if args.metrics_path:
+        instrumentation.enable()
+    try:
+        run(args)
+    finally:
+        if args.metrics_path:
+            instrumentation.export(args.metrics_path)
+
+
+def load_champion(
+    args: argparse.Namespace,
+) -> Tuple[Optional[Model], Optional[FeaturePipeline]]:
+    """
+    Champion to continue training from and its feature pipeline, from
+    --champion_path or the registry. Both are None without a champion.
+    """
+    if args.champion_path:
+        champion = xgb.XGBClassifier()
+        champion.load_model(args.champion_path)
+        pipeline = (
+            FeaturePipeline.load(args.champion_pipeline_path)
+            if args.champion_pipeline_path
+            else None
+        )
+        return champion, pipeline
+
+    loaded = get_registry(args.registry_backend).load_champion(args.model_name)
+    if loaded is None:
+        return None, None
+    champion, pipeline = loaded
+    return champion, FeaturePipeline.from_dict(pipeline) if pipeline else None
+
 
+def run(args: argparse.Namespace) -> None:
     logging.info("Starting model training and registration.")
 
     logging.info(f"Loading data from {args.data_path}")
-    X, y = preprocess(load_data(args.data_path), target_column=TARGET)
+    cache = S3DataCache(args.cache_dir) if args.cache_dir else None
+    partitioned = args.start_date or args.end_date or args.latest_n
+    if args.out_of_core:
+        if partitioned:
+            chunks = load_dataset_in_chunks(
+                *parse_s3_path(args.data_path),
+                chunk_size=args.chunk_size,
+                start_date=args.start_date,
+                end_date=args.end_date,
+                latest_n=args.latest_n,
+            )
+        else:
+            chunks = load_data_in_chunks(
+                resolve_data_path(args.data_path), args.chunk_size
+            )
+        with span("load_and_undersample"):
+            X, y = undersample_in_chunks(
+                chunks, TARGET, args.memory_budget_mb * 1024**2
+            )
+        class_weight = None
+    else:
+        with span("load_data"):
+            if partitioned:
+                data = load_dataset_from_s3(
+                    *parse_s3_path(args.data_path),
+                    start_date=args.start_date,
+                    end_date=args.end_date,
+                    latest_n=args.latest_n,
+                    max_workers=args.max_workers,
+                    feature_dtype=FEATURE_DTYPE,
+                    cache=cache,
+                )
+            else:
+                data = load_data(
+                    args.data_path, feature_dtype=FEATURE_DTYPE, cache=cache
+                )
+        count("rows_loaded", len(data))
+        with span("preprocess"):
+            X, y, class_weight = preprocess(
+                data, TARGET, strategy=args.rebalance, ratio=args.majority_ratio
+            )
+    count("rows_trained", len(X))
+
+    champion, feature_pipeline = None, None
+    if args.incremental:
+        with span("load_champion"):
+            champion, feature_pipeline = load_champion(args)
+        if champion is None:
+            logging.warning("No champion to continue from, running a full search.")
+
+    with span("feature_pipeline"):
+        # A continued champion keeps the features it was trained on.
+        if feature_pipeline is None:
+            feature_pipeline = FeaturePipeline.fit(X, fill_strategy=args.fill_missing)
+        X = feature_pipeline.transform_frame(X)
 
     logging.info("Commencing model training.")
-    trained_model, score = train(
-        X, y, model=xgb.XGBClassifier, performance_threshold=args.performance_threshold
-    )
+    with span("train"):
+        trained_model, score = train(
+            X,
+            y,
+            model=xgb.XGBClassifier,
+            performance_threshold=args.performance_threshold,
+            early_stopping_rounds=args.early_stopping_rounds,
+            pruner=args.pruner,
+            max_bin_grid=args.max_bin_grid,
+            batch_rows=args.chunk_size if args.out_of_core else None,
+            class_weight=class_weight,
+            cv_folds=args.cv_folds,
+            cv_workers=args.cv_workers,
+            n_trials=args.n_trials,
+            n_jobs=args.n_jobs,
+            n_processes=args.n_processes,
+            storage=args.study_storage,
+            study_name=args.study_name,
+            refit_full=not args.skip_full_refit,
+            champion=champion,
+            incremental_rounds=args.incremental_rounds,
+        )
 
     if trained_model:
         logging.info("Model training completed and satisfies criteria.")
-        registry = DatabricksModelRegistry()
-        registry.push_model(trained_model, score, args.model_name, sample=X)
+        with tempfile.TemporaryDirectory() as compact_dir:
+            with span("compact_model"):
+                trained_model, feature_pipeline, score, report = compact_model(
+                    trained_model,
+                    X,
+                    y,
+                    feature_pipeline,
+                    compact_dir,
+                    score=score,
+                    max_features=args.max_features,
+                    performance_threshold=args.performance_threshold,
+                    class_weight=class_weight,
+                )
+            metrics = (
+                instrumentation.mlflow_metrics() if instrumentation.enabled else {}
+            )
+            metrics[THRESHOLD_ATTR] = stored_threshold(trained_model.get_booster())
+            metrics.update({f"serving_{name}": value for name, value in report.items()})
+            with span("register_model"):
+                registry = get_registry(args.registry_backend)
+                registry.push_model(
+                    trained_model,
+                    score,
+                    args.model_name,
+                    sample=X[feature_pipeline.columns],
+                    feature_pipeline=feature_pipeline.to_dict(),
+                    metrics=metrics,
+                    compact_dir=compact_dir,
+                )
         logging.info(f"Model {args.model_name} registered successfully.")
     else:
         logging.warning("Model not ready for production.")
@@ -0,0 +1,181 @@
+import functools
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, Optional
+
+from src.utils.memory import RssSampler
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "thesis_mlops"
+
+_NULL_SPAN = nullcontext()
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+class Instrumentation:
+    """
+    Collects spans (calls, wall time and process CPU time per named block),
+    counters and the peak RSS of a run, and exports them as JSON, Prometheus text or
+    MLflow metrics. It starts disabled, then `span` returns a shared no-op
+    context and `count` returns at once, so instrumented code costs next to
+    nothing.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.sampler: Optional[RssSampler] = None
+
+    def enable(self, rss_interval: float = 0.1) -> None:
+        """
+        Starts collecting, the RSS is sampled every `rss_interval` seconds.
+        """
+        if self.enabled:
+            return
+        self.enabled = True
+        self.sampler = RssSampler(rss_interval).__enter__()
+
+    def disable(self) -> None:
+        if self.sampler is not None:
+            self.sampler.__exit__(None, None, None)
+        self.enabled = False
+
+    def reset(self) -> None:
+        self.disable()
+        self.spans = {}
+        self.counters = {}
+        self.sampler = None
+
+    def span(self, name: str) -> ContextManager[None]:
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name: str) -> Iterator[None]:
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall_seconds = time.perf_counter() - wall_start
+            cpu_seconds = time.process_time() - cpu_start
+            with self.lock:
+                stats = self.spans.setdefault(
+                    name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0}
+                )
+                stats["calls"] += 1
+                stats["wall_seconds"] += wall_seconds
+                stats["cpu_seconds"] += cpu_seconds
+                if self.sampler is not None:
+                    stats["peak_rss_bytes"] = self.sampler.peak
+
+    def timed(self, name: Optional[str] = None) -> Callable:
+        """
+        Decorator running the function in a span, named after it by default.
+        """
+
+        def decorator(func: Callable) -> Callable:
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self._span(span_name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def count(self, name: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @property
+    def peak_rss(self) -> Optional[int]:
+        return self.sampler.peak if self.sampler is not None else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "spans": {name: dict(stats) for name, stats in self.spans.items()},
+                "counters": dict(self.counters),
+                "peak_rss_bytes": self.peak_rss,
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Snapshot in the Prometheus text exposition format, e.g. for the node
+        exporter's textfile collector.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for field, metric_type in [
+            ("calls", "counter"),
+            ("wall_seconds", "counter"),
+            ("cpu_seconds", "counter"),
+            ("peak_rss_bytes", "gauge"),
+        ]:
+            metric = f"{METRIC_PREFIX}_span_{field}"
+            samples = [
+                f'{metric}{{span="{name}"}} {stats[field]}'
+                for name, stats in snapshot["spans"].items()
+                if field in stats
+            ]
+            if samples:
+                lines += [f"# TYPE {metric} {metric_type}", *samples]
+        for name, value in snapshot["counters"].items():
+            metric = f"{METRIC_PREFIX}_{_metric_name(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        if snapshot["peak_rss_bytes"] is not None:
+            metric = f"{METRIC_PREFIX}_peak_rss_bytes"
+            lines += [
+                f"# TYPE {metric} gauge",
+                f"{metric} {snapshot['peak_rss_bytes']}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def export(self, file_path: str) -> None:
+        """
+        Writes the snapshot to a local file, in the Prometheus text format for
+        `.prom` files and as JSON otherwise.
+        """
+        with open(file_path, "w") as file:
+            if file_path.endswith(".prom"):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), file, indent=2)
+        logger.info(f"Exported instrumentation to {file_path}.")
+
+    def mlflow_metrics(self) -> Dict[str, float]:
+        snapshot = self.snapshot()
+        metrics = {
+            f"{name}_{field}": value
+            for name, stats in snapshot["spans"].items()
+            for field, value in stats.items()
+        }
+        metrics.update(
+            {f"{name}_total": value for name, value in snapshot["counters"].items()}
+        )
+        if snapshot["peak_rss_bytes"] is not None:
+            metrics["peak_rss_bytes"] = snapshot["peak_rss_bytes"]
+        return {_metric_name(name): value for name, value in metrics.items()}
+
+
+instrumentation = Instrumentation()
+span = instrumentation.span
+timed = instrumentation.timed
+count = instrumentation.count
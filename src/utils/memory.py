@@ -0,0 +1,62 @@
+import os
+import resource
+import sys
+import threading
+from typing import Optional
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> int:
+    """
+    Resident set size of the process in bytes. Read from /proc where available,
+    otherwise the peak RSS is the closest the standard library gets.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return peak_rss()
+
+
+def peak_rss() -> int:
+    """
+    Highest resident set size of the process so far in bytes.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class RssSampler:
+    """
+    Samples the RSS in a background thread while the block runs, giving the
+    peak of that block rather than of the whole process.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        """
+        param interval: seconds between samples
+        """
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while True:
+            self.peak = max(self.peak, current_rss())
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
@@ -1,9 +1,21 @@
+import os
+from datetime import date, datetime
+from io import BytesIO
 from unittest.mock import MagicMock, patch
 
+import numpy as np
 import pandas as pd
 import pytest
 
-from src.data import extraction
+from src.data import extraction, sinks
+from src.data.cache import S3DataCache
+from src.data.features import FeaturePipeline
+from src.data.preprocessing import (
+    ReservoirSampler,
+    preprocess,
+    rebalance_indices,
+    undersample_in_chunks,
+)
 
 
 @patch("src.data.extraction.parse_s3_path")
@@ -15,7 +27,9 @@ def test_load_data_s3(mock_load_data_from_s3, mock_parse_s3_path):
     result = extraction.load_data("s3://bucket/key")
     assert result.equals(mock_df)
     mock_parse_s3_path.assert_called_once()
-    mock_load_data_from_s3.assert_called_once_with("bucket", "key")
+    mock_load_data_from_s3.assert_called_once_with(
+        "bucket", "key", columns=None, feature_dtype=None, cache=None
+    )
 
 
 @patch("src.data.extraction.parse_s3_path")
@@ -73,8 +87,298 @@ def test_save_data_to_s3_exception(mock_boto_client):
 
 def test_find_most_recent_file_in_s3_no_csv():
     mock_s3 = MagicMock()
-    mock_s3.list_objects_v2.return_value = {
-        "Contents": [{"Key": "a.txt", "LastModified": 1}]
-    }
+    mock_s3.get_paginator.return_value.paginate.return_value = [
+        {"Contents": [{"Key": "a.txt", "LastModified": 1}]}
+    ]
     with pytest.raises(ValueError):
         extraction.find_most_recent_file_in_s3(mock_s3, "bucket", "prefix")
+
+
+def test_load_data_in_chunks_skips_committed_rows(tmp_path):
+    file_path = tmp_path / "data.csv"
+    pd.DataFrame({"id": range(5), "a": range(5)}).to_csv(file_path, index=False)
+    chunks = list(extraction.load_data_in_chunks(str(file_path), 2, skip_rows=1))
+    assert [len(chunk) for chunk in chunks] == [2, 2]
+    assert chunks[0]["id"].tolist() == [1, 2]
+
+
+def test_local_csv_sink_resume_truncates_uncommitted_data(tmp_path):
+    file_path = str(tmp_path / "out.csv")
+    sink = sinks.LocalCsvSink(file_path)
+    sink.write(pd.DataFrame({"id": [1], "a": [1]}))
+    state = sink.checkpoint()
+    sink.write(pd.DataFrame({"id": [2], "a": [2]}))
+    sink.close()
+
+    sink = sinks.LocalCsvSink(file_path, state=state)
+    sink.write(pd.DataFrame({"id": [3], "a": [3]}))
+    sink.close()
+    assert pd.read_csv(file_path)["id"].tolist() == [1, 3]
+
+
+def test_open_sink_rejects_parquet_output(tmp_path):
+    with pytest.raises(ValueError):
+        sinks.open_sink(str(tmp_path / "out.parquet"))
+    with pytest.raises(ValueError):
+        sinks.open_sink("s3://bucket/out.parquet")
+
+
+@patch("src.data.sinks.boto3.client")
+def test_s3_multipart_sink_uploads_full_parts(mock_boto_client):
+    mock_s3 = MagicMock()
+    mock_boto_client.return_value = mock_s3
+    mock_s3.create_multipart_upload.return_value = {"UploadId": "upload"}
+    mock_s3.upload_part.return_value = {"ETag": "etag"}
+
+    sink = sinks.S3MultipartSink("bucket", "key", part_size=sinks.MIN_PART_SIZE)
+    sink.write(pd.DataFrame({"id": [1]}))
+    assert sink.checkpoint() is None
+    sink.write(pd.DataFrame({"id": ["x" * sinks.MIN_PART_SIZE]}))
+    assert sink.checkpoint() == {
+        "upload_id": "upload",
+        "parts": [{"PartNumber": 1, "ETag": "etag"}],
+    }
+    sink.write(pd.DataFrame({"id": [2]}))
+    sink.close()
+    assert mock_s3.upload_part.call_count == 2
+    _, kwargs = mock_s3.complete_multipart_upload.call_args
+    assert len(kwargs["MultipartUpload"]["Parts"]) == 2
+
+
+def test_parquet_roundtrip_with_projection_and_dtype(tmp_path):
+    file_path = str(tmp_path / "data.parquet")
+    df = pd.DataFrame({"id": [1, 2], "a": [0.5, 1.5], "b": [1, 2], "Class": [0, 1]})
+    extraction.save_data(df, file_path)
+    result = extraction.load_data(
+        file_path, columns=["id", "a", "Class"], feature_dtype="float32"
+    )
+    assert result.columns.tolist() == ["id", "a", "Class"]
+    assert result["a"].dtype == "float32"
+    assert result["Class"].dtype == "int64"
+
+
+@patch("src.data.extraction.find_most_recent_file_in_s3")
+@patch("src.data.extraction.boto3.client")
+def test_load_parquet_from_s3(mock_boto_client, mock_find_most_recent):
+    buffer = BytesIO()
+    pd.DataFrame({"id": [1], "a": [2.0]}).to_parquet(buffer)
+    mock_s3 = MagicMock()
+    mock_boto_client.return_value = mock_s3
+    mock_find_most_recent.return_value = "file.parquet"
+    mock_s3.get_object.return_value = {
+        "Body": MagicMock(read=MagicMock(return_value=buffer.getvalue()))
+    }
+    result = extraction.load_data_from_s3("bucket", "prefix", feature_dtype="float32")
+    assert result["a"].dtype == "float32"
+    assert result["id"].tolist() == [1]
+
+
+@patch("src.data.extraction.boto3.client")
+def test_save_parquet_to_s3(mock_boto_client):
+    mock_s3 = MagicMock()
+    mock_boto_client.return_value = mock_s3
+    extraction.save_data_to_s3(pd.DataFrame({"a": [1, 2]}), "bucket", "key.parquet")
+    _, kwargs = mock_s3.put_object.call_args
+    assert pd.read_parquet(BytesIO(kwargs["Body"]))["a"].tolist() == [1, 2]
+
+
+def test_find_most_recent_file_in_s3_follows_pagination():
+    mock_s3 = MagicMock()
+    mock_s3.get_paginator.return_value.paginate.return_value = [
+        {"Contents": [{"Key": "a.csv", "LastModified": 1}]},
+        {"Contents": [{"Key": "b.csv", "LastModified": 2}]},
+        {"Contents": [{"Key": "c.txt", "LastModified": 3}]},
+    ]
+    assert extraction.find_most_recent_file_in_s3(mock_s3, "bucket", "p") == "b.csv"
+
+
+def test_select_partitions_by_date_range_and_latest_n():
+    modified = datetime(2025, 1, 1)
+    s3_objects = [
+        {"Key": f"data/date=2025-06-0{day}/part.csv", "LastModified": modified}
+        for day in (3, 1, 4, 2)
+    ]
+    selected = extraction.select_partitions(
+        s3_objects, start_date=date(2025, 6, 2), latest_n=2
+    )
+    assert [s3_object["Key"][10:20] for s3_object in selected] == [
+        "2025-06-03",
+        "2025-06-04",
+    ]
+
+
+@patch("src.data.extraction.boto3.client")
+def test_load_dataset_from_s3_concatenates_partitions(mock_boto_client):
+    mock_s3 = MagicMock()
+    mock_boto_client.return_value = mock_s3
+    mock_s3.get_paginator.return_value.paginate.return_value = [
+        {
+            "Contents": [
+                {"Key": "p/2025-06-02.csv", "LastModified": datetime(2025, 6, 2)},
+                {"Key": "p/2025-06-01.csv", "LastModified": datetime(2025, 6, 1)},
+            ]
+        }
+    ]
+    mock_s3.get_object.side_effect = lambda Bucket, Key: {
+        "Body": BytesIO(f"id\n{Key[2:12]}\n".encode())
+    }
+    result = extraction.load_dataset_from_s3("bucket", "p", max_workers=2)
+    assert result["id"].tolist() == ["2025-06-01", "2025-06-02"]
+    assert mock_boto_client.call_count == 1
+
+
+@patch("src.data.extraction.find_most_recent_file_in_s3")
+@patch("src.data.extraction.boto3.client")
+def test_load_data_from_s3_serves_cache_hits(
+    mock_boto_client, mock_find_most_recent, tmp_path
+):
+    mock_s3 = MagicMock()
+    mock_boto_client.return_value = mock_s3
+    mock_find_most_recent.return_value = "file.csv"
+    mock_s3.head_object.return_value = {"ETag": '"v1"'}
+    mock_s3.get_object.side_effect = lambda **kwargs: {"Body": BytesIO(b"id,a\n1,2\n")}
+    cache = S3DataCache(str(tmp_path))
+
+    first = extraction.load_data_from_s3("bucket", "prefix", cache=cache)
+    second = extraction.load_data_from_s3("bucket", "prefix", cache=cache)
+    assert first.equals(second)
+    mock_s3.get_object.assert_called_once_with(
+        Bucket="bucket", Key="file.csv", IfMatch='"v1"'
+    )
+
+    mock_s3.head_object.return_value = {"ETag": '"v2"'}
+    extraction.load_data_from_s3("bucket", "prefix", cache=cache)
+    assert mock_s3.get_object.call_count == 2
+
+
+def test_s3_data_cache_evicts_least_recently_used(tmp_path):
+    data = pd.DataFrame({"a": range(1000)})
+    cache = S3DataCache(str(tmp_path))
+    cache.put("bucket", "old", "etag", data)
+    cache.put("bucket", "new", "etag", data)
+    entry_size = max(entry.stat().st_size for entry in tmp_path.iterdir())
+
+    cache.max_bytes = 2 * entry_size
+    cache.put("bucket", "newest", "etag", data)
+    assert cache.get("bucket", "old", "etag") is None
+    assert cache.get("bucket", "new", "etag")["a"].tolist() == list(range(1000))
+
+
+def test_s3_data_cache_eviction_skips_entries_removed_concurrently(tmp_path):
+    data = pd.DataFrame({"a": range(1000)})
+    cache = S3DataCache(str(tmp_path), max_bytes=0)
+    cache.put("bucket", "old", "etag", data)
+    remove = os.remove
+
+    def remove_twice(path):
+        # Another worker evicts the same entry first.
+        remove(path)
+        remove(path)
+
+    with patch("src.data.cache.os.remove", side_effect=remove_twice):
+        cache.put("bucket", "new", "etag", data)
+    assert cache.get("bucket", "old", "etag") is None
+
+
+def test_s3_data_cache_misses_entries_evicted_during_a_hit(tmp_path):
+    cache = S3DataCache(str(tmp_path))
+    cache.put("bucket", "key", "etag", pd.DataFrame({"a": range(10)}))
+    utime = os.utime
+
+    def evict_after_utime(path):
+        # Another worker evicts the entry between the touch and the read.
+        utime(path)
+        os.remove(path)
+
+    with patch("src.data.cache.os.utime", side_effect=evict_after_utime):
+        assert cache.get("bucket", "key", "etag") is None
+
+
+def test_reservoir_sampler_is_uniform():
+    counts = np.zeros(100)
+    for seed in range(500):
+        sampler = ReservoirSampler(10, 1, np.random.default_rng(seed))
+        for start in range(0, 100, 30):
+            sampler.add(np.arange(start, min(start + 30, 100))[:, None])
+        assert sampler.seen == 100
+        counts[sampler.sample().ravel().astype(int)] += 1
+    assert counts.sum() == 5000
+    assert counts.min() > 20 and counts.max() < 80
+
+
+def test_undersample_in_chunks_balances_classes():
+    data = pd.DataFrame(
+        {"id": range(1000), "a": np.arange(1000.0), "Class": [1] * 50 + [0] * 950}
+    )
+    chunks = (data.iloc[start : start + 128] for start in range(0, 1000, 128))
+    X, y = undersample_in_chunks(chunks, "Class", memory_budget_bytes=4 * 4 * 400)
+    assert list(X.columns) == ["a"]
+    assert X.dtypes["a"] == np.float32
+    assert (y == 1).sum() == (y == 0).sum() == 50
+    assert set(X["a"][y == 1]) == set(range(50))
+    assert (X["a"][y == 0] >= 50).all()
+
+
+def test_undersample_in_chunks_bounds_minority_by_budget():
+    data = pd.DataFrame({"a": np.arange(100.0), "Class": [1] * 80 + [0] * 20})
+    X, y = undersample_in_chunks([data], "Class", memory_budget_bytes=4 * 4 * 30)
+    assert (y == 1).sum() == 30
+    assert (y == 0).sum() == 20
+
+
+def test_rebalance_indices_undersamples_to_ratio():
+    target = np.array([1, 0, 0, 0, 1, 0, 0, 0, 0, 0])
+    positions, class_weight = rebalance_indices(target, ratio=2.0)
+    assert class_weight is None
+    assert list(positions) == sorted(positions)
+    assert (target[positions] == 1).sum() == 2
+    assert (target[positions] == 0).sum() == 4
+
+
+def test_rebalance_indices_weights_minority_class():
+    target = np.array([1, 0, 0, 0, 1, 0, 0, 0, 0, 0])
+    positions, class_weight = rebalance_indices(target, strategy="class_weight")
+    assert list(positions) == list(range(10))
+    assert class_weight == {0: 1.0, 1: 4.0}
+
+
+def test_preprocess_takes_kept_rows_indexed_by_id():
+    data = pd.DataFrame(
+        {
+            "id": [10, 11, 12, 13, 14, 15],
+            "a": np.arange(6, dtype=np.float32),
+            "Class": [0, 1, 0, 0, 1, 0],
+        }
+    )
+    X, y, class_weight = preprocess(data, "Class")
+    assert class_weight is None
+    assert list(X.columns) == ["a"]
+    assert X.index.name == "id"
+    assert y.sum() == 2 and len(y) == 4
+    assert (X["a"].to_numpy() == X.index.to_numpy() - 10).all()
+    assert (y.to_numpy() == data.set_index("id").loc[y.index, "Class"]).all()
+
+    X, y, class_weight = preprocess(data, "Class", strategy="class_weight")
+    assert class_weight == {0: 1.0, 1: 2.0}
+    assert X.index.tolist() == data["id"].tolist()
+    assert (X["a"].to_numpy() == data["a"].to_numpy()).all()
+    assert data.index.tolist() == list(range(6))
+
+
+def test_feature_pipeline_reorders_casts_and_fills(tmp_path):
+    X = pd.DataFrame({"a": [1.0, np.nan, 3.0], "b": [4.0, 5.0, 7.0]})
+    pipeline = FeaturePipeline.fit(X, fill_strategy="median")
+    path = str(tmp_path / "pipeline.json")
+    pipeline.save(path)
+
+    data = pd.DataFrame({"id": [1, 2], "b": [np.nan, 1.0], "a": [np.nan, 2.0]})
+    features = FeaturePipeline.load(path).transform(data)
+    assert features.dtype == np.float32
+    assert features.flags["C_CONTIGUOUS"]
+    assert features.tolist() == [[2.0, 5.0], [2.0, 1.0]]
+
+
+def test_feature_pipeline_rejects_missing_columns():
+    pipeline = FeaturePipeline(["a", "b"])
+    with pytest.raises(ValueError):
+        pipeline.transform(pd.DataFrame({"a": [1.0]}))
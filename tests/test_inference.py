@@ -1,10 +1,40 @@
+import asyncio
+import json
+import re
 from unittest import mock
 from unittest.mock import MagicMock, patch
 
+import numpy as np
 import pandas as pd
 import pytest
+import requests
+import xgboost as xgb
 
-from src.inference.inference import create_serving_json, prepare_dataset, score_model
+from src.benchmarks.mock_endpoint import MockEndpoint
+from src.data.features import FeaturePipeline
+from src.inference import serialization
+from src.inference.async_client import (
+    AsyncScoringClient,
+    MicroBatcher,
+    score_model_async,
+)
+from src.inference.client import (
+    AdaptiveConcurrencyLimiter,
+    ScoringClient,
+    parse_retry_after,
+)
+from src.inference.inference import (
+    LocalScorer,
+    RemoteScorer,
+    create_serving_json,
+    prepare_dataset,
+    score_model,
+    score_model_in_batches,
+    stream_inference,
+)
+from src.inference.prediction_cache import CachedScorer, PredictionCache
+from src.models.model_registry import LocalModelRegistry
+from src.utils.instrumentation import instrumentation
 
 
 def test_create_serving_json_with_dict():
@@ -14,6 +44,11 @@ def test_create_serving_json_with_dict():
     assert set(result["inputs"].keys()) == {"a", "b"}
 
 
+def test_create_serving_json_with_dataframe():
+    df = pd.DataFrame({"a": [1, 2], "b": [3.5, 4.5]})
+    assert create_serving_json(df) == {"inputs": {"a": [1, 2], "b": [3.5, 4.5]}}
+
+
 def test_prepare_dataset_with_dataframe():
     df = pd.DataFrame({"a": [1, 2], "b": [3, 4]})
     result = prepare_dataset(df)
@@ -40,8 +75,9 @@ def test_send_request_success(mock_getenv, mock_post):
     from src.inference.inference import send_request
 
     url = "https://test_url"
-    result = send_request(url, '{"foo": "bar"}')
+    result = send_request(url, '{"foo": "bar"}', timeout=(1, 2))
     assert result == {"predictions": [1, 0]}
+    assert mock_post.call_args.kwargs["timeout"] == (1, 2)
 
 
 @patch("src.inference.inference.requests.post")
@@ -89,3 +125,427 @@ def test_main_success(
     )
     mock_load_data.return_value = pd.DataFrame({"id": [1, 2], "a": [3, 4]})
     mock_score_model.return_value = {"predictions": [[0], [1]]}
+
+
+def endpoint_session(predict, status_code=200):
+    """
+    Session whose POSTs answer with `predict(inputs)` as the predictions.
+    """
+
+    def post(url, headers, data, timeout):
+        inputs = json.loads(data)["inputs"]
+        response = MagicMock(status_code=status_code, headers={})
+        response.json.return_value = {"predictions": predict(inputs)}
+        return response
+
+    session = MagicMock()
+    session.post.side_effect = post
+    return session
+
+
+def test_score_model_in_batches_keeps_order():
+    session = endpoint_session(lambda inputs: inputs["a"])
+    df = pd.DataFrame({"id": [10, 11, 12, 13, 14], "a": [5, 6, 7, 8, 9]})
+    result = score_model_in_batches(
+        "http://test-url", df, batch_size=2, concurrency=3, session=session
+    )
+    assert session.post.call_count == 3
+    assert result["id"].tolist() == [10, 11, 12, 13, 14]
+    assert result[0].tolist() == [5, 6, 7, 8, 9]
+
+
+def test_score_model_in_batches_applies_feature_pipeline():
+    sent = []
+    session = endpoint_session(lambda inputs: sent.append(inputs) or [0, 1])
+    df = pd.DataFrame({"id": [10, 11], "b": [1, 2], "a": [3, None]})
+    pipeline = FeaturePipeline(["a", "b"], fill_values=[0.5, 0.0])
+    result = score_model_in_batches(
+        "http://test-url", df, session=session, pipeline=pipeline
+    )
+    assert sent == [{"a": [3.0, 0.5], "b": [1.0, 2.0]}]
+    assert result["id"].tolist() == [10, 11]
+
+
+def test_score_model_in_batches_invalid_batch_size():
+    df = pd.DataFrame({"id": [1], "a": [1]})
+    with pytest.raises(ValueError):
+        score_model_in_batches("http://test-url", df, batch_size=0)
+
+
+@patch("src.inference.client.create_session")
+def test_stream_inference_resumes_after_failure(mock_create_session, tmp_path):
+    input_path = str(tmp_path / "input.csv")
+    output_path = str(tmp_path / "output.csv")
+    pd.DataFrame({"id": range(6), "a": range(6)}).to_csv(input_path, index=False)
+
+    def predict_until_id_4(inputs):
+        if 4 in inputs["id"]:
+            raise requests.ConnectionError("Endpoint unavailable")
+        return inputs["a"]
+
+    mock_create_session.return_value = endpoint_session(predict_until_id_4)
+    with pytest.raises(requests.ConnectionError):
+        stream_inference(
+            input_path,
+            output_path,
+            RemoteScorer("http://test-url", max_retries=0),
+            chunk_size=2,
+        )
+
+    mock_create_session.return_value = endpoint_session(lambda inputs: inputs["a"])
+    rows = stream_inference(
+        input_path, output_path, RemoteScorer("http://test-url"), chunk_size=2
+    )
+    assert rows == 2
+    assert pd.read_csv(output_path)["id"].tolist() == list(range(6))
+
+
+def response(status_code, headers=None):
+    mock_response = MagicMock(status_code=status_code, headers=headers or {})
+    mock_response.json.return_value = {"predictions": [1]}
+    if status_code >= 400:
+        mock_response.raise_for_status.side_effect = requests.HTTPError(
+            str(status_code)
+        )
+    return mock_response
+
+
+@patch("src.inference.client.time.sleep")
+def test_scoring_client_retries_throttled_requests(mock_sleep):
+    session = MagicMock()
+    session.post.side_effect = [
+        response(429, {"Retry-After": "7"}),
+        response(503),
+        response(200),
+    ]
+    client = ScoringClient("http://test-url", session=session, backoff_base=0.1)
+    assert client.score(pd.DataFrame({"a": [1.0]})) == {"predictions": [1]}
+    assert session.post.call_count == 3
+    assert client.retries == 2
+    assert mock_sleep.call_args_list[0].args == (7.0,)
+    assert 0 <= mock_sleep.call_args_list[1].args[0] <= 0.2
+    assert session.post.call_args.kwargs["timeout"] == client.timeout
+
+
+@patch("src.inference.client.time.sleep")
+def test_scoring_client_gives_up(mock_sleep):
+    session = MagicMock()
+    session.post.side_effect = [response(500)] * 3 + [response(400)]
+    client = ScoringClient("http://test-url", session=session, max_retries=2)
+    with pytest.raises(requests.HTTPError):
+        client.score(pd.DataFrame({"a": [1.0]}))
+    assert session.post.call_count == 3
+
+    session.post.side_effect = [response(400)]
+    with pytest.raises(requests.HTTPError):
+        client.score(pd.DataFrame({"a": [1.0]}))
+    assert session.post.call_count == 4
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+
+def test_adaptive_concurrency_limiter_aimd():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=8)
+    tokens = [limiter.acquire() for _ in range(4)]
+    limiter.release(tokens[0], throttled=True)
+    limiter.release(tokens[1], throttled=True)
+    assert limiter.limit == 2.0
+    limiter.release(tokens[2])
+    limiter.release(tokens[3])
+    assert limiter.limit == pytest.approx(2.9)
+    for _ in range(100):
+        limiter.release(limiter.acquire())
+    assert limiter.limit == 8
+
+
+@pytest.fixture
+def booster():
+    X = pd.DataFrame({"a": np.arange(20, dtype=float), "b": np.zeros(20)})
+    y = (X["a"] >= 10).astype(int)
+    return xgb.XGBClassifier(n_estimators=5).fit(X, y).get_booster()
+
+
+def test_local_scorer_predicts_on_model_features(booster):
+    data = pd.DataFrame({"id": [7, 8], "b": [0.0, 0.0], "a": [0.0, 19.0]})
+    result = LocalScorer(booster, nthread=2).predict(data)
+    assert result["id"].tolist() == [7, 8]
+    assert result[0].tolist() == [0, 1]
+
+
+def test_local_scorer_applies_stored_decision_threshold(booster):
+    data = pd.DataFrame({"id": [7, 8], "a": [0.0, 19.0], "b": [0.0, 0.0]})
+    scores = booster.inplace_predict(data[["a", "b"]].to_numpy())
+    booster.set_attr(decision_threshold=repr(float(scores.max()) + 0.01))
+    assert LocalScorer(booster).predict(data)[0].tolist() == [0, 0]
+    assert LocalScorer(booster, threshold=0.0).predict(data)[0].tolist() == [1, 1]
+
+
+@patch("src.inference.client.create_session")
+def test_remote_scorer_applies_registered_decision_threshold(
+    mock_create_session, booster, tmp_path
+):
+    import mlflow
+
+    data = pd.DataFrame({"id": [7, 8], "a": [0.0, 19.0], "b": [0.0, 0.0]})
+    scores = booster.inplace_predict(data[["a", "b"]].to_numpy())
+    booster.set_attr(decision_threshold=repr(float(scores.max()) + 0.01))
+    model = xgb.XGBClassifier()
+    model.load_model(bytearray(booster.save_raw("ubj")))
+
+    registry = LocalModelRegistry(str(tmp_path))
+    registry.push_model(model, ("f1_score", 1.0), "fraud", data[["a", "b"]])
+    served = mlflow.pyfunc.load_model("models:/workspace.default.fraud/1")
+    mock_create_session.return_value = endpoint_session(
+        lambda inputs: served.predict(pd.DataFrame(inputs)).tolist()
+    )
+
+    result = RemoteScorer("http://test-url").predict(data)
+    assert result[0].tolist() == [0, 0]
+    assert registry.load_model("fraud", 1).get_booster().attr(
+        "decision_threshold"
+    ) == booster.attr("decision_threshold")
+
+
+@patch("src.inference.inference.get_registry")
+def test_local_scorer_caches_model_by_version(mock_get_registry, booster, tmp_path):
+    mock_registry = mock_get_registry.return_value
+    mock_registry.get_champion_version.return_value = MagicMock(version="3")
+    mock_registry.load_model.return_value = booster
+    mock_registry.load_feature_pipeline.return_value = FeaturePipeline(
+        ["a", "b"]
+    ).to_dict()
+
+    LocalScorer.from_registry("fraud", cache_dir=str(tmp_path))
+    scorer = LocalScorer.from_registry("fraud", cache_dir=str(tmp_path))
+    mock_registry.load_model.assert_called_once_with("fraud", "3")
+    mock_registry.load_feature_pipeline.assert_called_once()
+    assert (tmp_path / "fraud" / "3" / "model.ubj").exists()
+    assert scorer.pipeline.columns == ["a", "b"]
+
+
+def test_encode_payload_writes_columns_in_pieces():
+    df = pd.DataFrame(
+        {"id": np.arange(5), "a": np.array([0.5, 1, 2, 3, 4], dtype=np.float32)}
+    )
+    pieces = list(serialization.iter_column_json(df, piece_rows=2))
+    assert len(pieces) > 6
+    assert json.loads(b"".join(pieces)) == {
+        "inputs": {"id": [0, 1, 2, 3, 4], "a": [0.5, 1.0, 2.0, 3.0, 4.0]}
+    }
+
+
+def test_encode_payload_streams_gzip_body():
+    import gzip
+
+    df = pd.DataFrame({"a": np.arange(3.0), "b": ["x", "y", "z"]})
+    body, content_encoding = serialization.encode_payload(
+        df, compress=True, stream=True
+    )
+    assert content_encoding == "gzip"
+    assert json.loads(gzip.decompress(b"".join(body))) == {
+        "inputs": {"a": [0.0, 1.0, 2.0], "b": ["x", "y", "z"]}
+    }
+
+
+def test_encode_payload_writes_nan_as_null():
+    body, content_encoding = serialization.encode_payload(
+        pd.DataFrame({"a": [1.0, np.nan], "b": ["x", np.nan]})
+    )
+    assert content_encoding is None
+    assert body == b'{"inputs":{"a":[1.0,null],"b":["x",null]}}'
+
+
+async def serve(respond):
+    """
+    Local HTTP/1.1 server answering every request with `respond(inputs)`, a
+    status code and a JSON payload.
+    """
+    requests_seen = []
+
+    async def handle(reader, writer):
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            length = int(re.search(rb"Content-Length: (\d+)", head).group(1))
+            inputs = json.loads(await reader.readexactly(length))["inputs"]
+            requests_seen.append(inputs)
+            status_code, payload = respond(inputs)
+            body = json.dumps(payload).encode()
+            writer.write(
+                f"HTTP/1.1 {status_code} X\r\nTransfer-Encoding: chunked\r\n\r\n"
+                f"{len(body):x}\r\n".encode()
+                + body
+                + b"\r\n0\r\n\r\n"
+            )
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/invocations"
+    return server, url, requests_seen
+
+
+def test_micro_batcher_coalesces_transactions():
+    async def run():
+        server, url, requests_seen = await serve(
+            lambda inputs: (200, {"predictions": [2 * a for a in inputs["a"]]})
+        )
+        client = AsyncScoringClient(url)
+        batcher = MicroBatcher(client, max_batch_size=4, max_latency=0.05)
+        results = await asyncio.gather(*(batcher.score({"a": i}) for i in range(10)))
+        await batcher.close()
+        await client.close()
+        server.close()
+        return results, requests_seen
+
+    results, requests_seen = asyncio.run(run())
+    assert results == [2 * i for i in range(10)]
+    assert [len(inputs["a"]) for inputs in requests_seen] == [4, 4, 2]
+
+
+def test_micro_batcher_fails_every_caller_on_missing_predictions():
+    async def run():
+        server, url, _ = await serve(
+            lambda inputs: (200, {"predictions": inputs["a"][:-1]})
+        )
+        client = AsyncScoringClient(url)
+        batcher = MicroBatcher(client, max_batch_size=3)
+        results = await asyncio.wait_for(
+            asyncio.gather(
+                *(batcher.score({"a": i}) for i in range(3)), return_exceptions=True
+            ),
+            timeout=5,
+        )
+        await client.close()
+        server.close()
+        return results
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(run()))
+
+
+def test_async_scoring_client_retries_and_fans_out_errors():
+    async def run():
+        statuses = iter([503, 200, 400])
+        server, url, requests_seen = await serve(
+            lambda inputs: (next(statuses), {"predictions": inputs["a"]})
+        )
+        client = AsyncScoringClient(url, backoff_base=0.001)
+        response = await score_model_async(url, pd.DataFrame({"a": [1.0]}), client)
+        batcher = MicroBatcher(client, max_latency=0.01)
+        errors = await asyncio.gather(
+            batcher.score({"a": 1.0}), batcher.score({"a": 2.0}), return_exceptions=True
+        )
+        await client.close()
+        server.close()
+        return response, errors, requests_seen
+
+    response, errors, requests_seen = asyncio.run(run())
+    assert response == {"predictions": [1.0]}
+    assert len(requests_seen) == 3
+    assert [error.status_code for error in errors] == [400, 400]
+
+
+def cached_scorer(path, model_version="1", **cache_kwargs):
+    scorer = MagicMock()
+    scorer.predict.side_effect = lambda data: pd.concat(
+        [data["id"], pd.DataFrame(data["a"] * 2, index=data.index)], axis=1
+    )
+    cache = PredictionCache(str(path), model_version, **cache_kwargs)
+    return CachedScorer(scorer, cache), scorer
+
+
+def test_cached_scorer_only_scores_misses(tmp_path):
+    cached, scorer = cached_scorer(tmp_path / "cache.db")
+    cached.predict(pd.DataFrame({"id": [1, 2], "a": [1.0, 2.0]}))
+    result = cached.predict(pd.DataFrame({"id": [3, 4, 5], "a": [2.0, 3.0, 1.0]}))
+
+    assert result["id"].tolist() == [3, 4, 5]
+    assert result[0].tolist() == [4.0, 6.0, 2.0]
+    assert [len(call.args[0]) for call in scorer.predict.call_args_list] == [2, 1]
+    assert cached.cache.hit_rate == pytest.approx(2 / 5)
+
+
+def test_prediction_cache_is_cleared_by_new_model_version(tmp_path):
+    data = pd.DataFrame({"id": [1], "a": [1.0]})
+    cached, _ = cached_scorer(tmp_path / "cache.db", "1")
+    cached.predict(data)
+    cached.close()
+
+    cached, scorer = cached_scorer(tmp_path / "cache.db", "2")
+    cached.predict(data)
+    scorer.predict.assert_called_once()
+
+
+def test_prediction_cache_expires_and_evicts(tmp_path):
+    cache = PredictionCache(str(tmp_path / "cache.db"), "1", ttl=60, max_entries=2)
+    keys = np.array([1, 2, 3])
+    with patch("src.inference.prediction_cache.time.time", return_value=1000.0):
+        cache.put(keys[:1], np.array([0]))
+    with patch("src.inference.prediction_cache.time.time", return_value=1001.0):
+        cache.put(keys[1:], np.array([1, 1]))
+        found, predictions = cache.get(keys)
+    assert found.tolist() == [False, True, True]
+    assert predictions[1:].tolist() == [1, 1]
+
+    with patch("src.inference.prediction_cache.time.time", return_value=1100.0):
+        found, _ = cache.get(keys)
+    assert not found.any()
+
+
+@patch("src.inference.client.time.sleep")
+def test_mock_endpoint_scores_through_throttling(mock_sleep, booster):
+    data = pd.DataFrame(
+        {"id": range(40), "a": np.linspace(0, 20, 40), "b": np.zeros(40)}
+    )
+    expected = booster.inplace_predict(data[["a", "b"]].to_numpy()) > 0.5
+
+    with MockEndpoint(booster, throttle_rate=0.3, random_state=0) as endpoint:
+        result = score_model_in_batches(
+            endpoint.url, data, batch_size=10, concurrency=2, compress=True
+        )
+        endpoint.throttle_rate = 0.0
+        single = score_model(endpoint.url, data.iloc[:5])
+
+    assert result[0].tolist() == expected.astype(int).tolist()
+    assert single["predictions"] == expected[:5].astype(int).tolist()
+    assert 429 in endpoint.statuses
+
+
+@patch("src.inference.client.time.sleep")
+def test_instrumentation_counts_requests_and_exports(mock_sleep, tmp_path):
+    session = MagicMock()
+    session.post.side_effect = [response(503), response(200)]
+    client = ScoringClient("http://test-url", session=session)
+    data = pd.DataFrame({"a": [1.0]})
+
+    client.score(data)
+    assert instrumentation.snapshot()["counters"] == {}
+
+    instrumentation.enable()
+    try:
+        session.post.side_effect = [response(503), response(200)]
+        with instrumentation.span("score"):
+            client.score(data)
+        instrumentation.export(str(tmp_path / "metrics.json"))
+        instrumentation.export(str(tmp_path / "metrics.prom"))
+    finally:
+        instrumentation.reset()
+
+    metrics = json.loads((tmp_path / "metrics.json").read_text())
+    assert metrics["counters"] == {
+        "requests": 2,
+        "retries": 1,
+        "request_bytes": 2 * len(b'{"inputs":{"a":[1.0]}}'),
+    }
+    assert metrics["spans"]["score"]["calls"] == 1
+    assert metrics["peak_rss_bytes"] > 0
+    prometheus = (tmp_path / "metrics.prom").read_text()
+    assert "thesis_mlops_retries_total 1" in prometheus
+    assert 'thesis_mlops_span_calls{span="score"} 1' in prometheus
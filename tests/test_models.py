@@ -1,10 +1,31 @@
+import json
+import os
 from unittest.mock import MagicMock, patch
 
 import numpy as np
+import optuna
 import pandas as pd
 import pytest
+import xgboost as xgb
+from sklearn.metrics import f1_score, precision_score, recall_score
 
-from src.models.model_definitions import ModelEvaluation, ModelOptimization
+from src.data.features import FeaturePipeline
+from src.models.compaction import compact_model, reduce_features
+from src.models.metrics import (
+    best_threshold,
+    f1_at_threshold,
+    positive_scores,
+    threshold_sweep,
+)
+from src.models.model_definitions import (
+    _FOLD_MATRICES,
+    ModelEvaluation,
+    ModelOptimization,
+    _create_storage,
+    champion_params,
+)
+from src.models.model_registry import LocalModelRegistry, get_registry
+from src.models.train_model import train
 
 
 class DummyModel:
@@ -42,7 +63,7 @@ def test_model_optimization_optimize_returns_none_if_below_threshold(
     mock_study.best_params = {}
     mock_study.best_value = 0.0
     mock_create_study.return_value = mock_study
-    mock_study.optimize = lambda func, n_trials: None
+    mock_study.optimize = lambda func, n_trials, n_jobs: None
 
     X, y = sample_data
     opt = ModelOptimization(X, y, DummyModel, threshold=1.0)
@@ -57,3 +78,299 @@ def test_model_optimization_get_score(sample_data):
     # Set score manually for test
     opt.score = ("f1_score", 0.5)
     assert opt.get_score() == ("f1_score", 0.5)
+
+
+@pytest.fixture
+def xgb_data():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(200, 4)), columns=["a", "b", "c", "d"])
+    y = pd.Series((X["a"] + rng.normal(scale=0.5, size=200) > 0).astype(int))
+    return X, y
+
+
+def test_model_optimization_resumes_study_from_storage(xgb_data, tmp_path):
+    X, y = xgb_data
+    storage = str(tmp_path / "study.journal")
+    opt = ModelOptimization(X, y, xgb.XGBClassifier, threshold=0.0)
+    opt.optimize(n_trials=2, n_jobs=2, storage=storage)
+
+    opt = ModelOptimization(X, y, xgb.XGBClassifier, threshold=0.0)
+    with patch.object(opt, "_set_objective", wraps=opt._set_objective) as objective:
+        model = opt.optimize(n_trials=3, storage=storage)
+    assert objective.call_count == 1
+    assert model is not None
+
+
+def test_model_optimization_requires_storage_for_processes(sample_data):
+    X, y = sample_data
+    opt = ModelOptimization(X, y, DummyModel, threshold=0.0)
+    with pytest.raises(ValueError):
+        opt.optimize(n_processes=2)
+
+
+def test_model_optimization_records_boosting_rounds_used(xgb_data):
+    X, y = xgb_data
+    opt = ModelOptimization(
+        X, y, xgb.XGBClassifier, threshold=0.0, early_stopping_rounds=5
+    )
+    model = opt.optimize(n_trials=2)
+    assert opt.n_estimators_used is not None
+    assert model.n_estimators == opt.n_estimators_used
+
+
+def test_pruning_callback_prunes_trial():
+    from src.models.model_definitions import _PruningCallback
+
+    trial = MagicMock()
+    trial.should_prune.return_value = True
+    callback = _PruningCallback(trial, "logloss")
+    with pytest.raises(optuna.TrialPruned):
+        callback.after_iteration(None, 3, {"validation_0": {"logloss": [0.3, 0.2]}})
+    trial.report.assert_called_once_with(-0.2, step=3)
+
+
+def test_model_optimization_reuses_best_trial_model(xgb_data):
+    X, y = xgb_data
+    opt = ModelOptimization(X, y, xgb.XGBClassifier, threshold=0.0)
+    with patch("src.models.model_definitions.xgb.train", wraps=xgb.train) as train:
+        model = opt.optimize(n_trials=3, refit_full=False)
+    assert train.call_count == 3
+    assert isinstance(model, xgb.XGBClassifier)
+    assert opt.best_fit is None
+
+
+def test_model_optimization_shares_matrices_across_trials(xgb_data):
+    X, y = xgb_data
+    opt = ModelOptimization(X, y, xgb.XGBClassifier, threshold=0.0, max_bin_grid=[32])
+    with patch(
+        "src.models.model_definitions.xgb.QuantileDMatrix", wraps=xgb.QuantileDMatrix
+    ) as matrix:
+        opt.optimize(n_trials=3)
+    assert matrix.call_count == 3
+    assert set(opt._matrices) == {("fit", 32), ("val", 32), ("full", 32)}
+    assert opt.get_array("test")[0].dtype == np.float32
+
+
+def test_model_optimization_refits_binary_classifier(xgb_data):
+    X, y = xgb_data
+    opt = ModelOptimization(X, y, xgb.XGBClassifier, threshold=0.0)
+    model = opt.optimize(n_trials=2)
+    config = json.loads(model.get_booster().save_config())
+    assert config["learner"]["objective"]["name"] == "binary:logistic"
+
+
+def test_model_optimization_builds_matrices_in_batches(xgb_data):
+    X, y = xgb_data
+    opt = ModelOptimization(
+        X, y, xgb.XGBClassifier, threshold=0.0, max_bin_grid=[32], batch_rows=50
+    )
+    model = opt.optimize(n_trials=2)
+    assert model is not None
+    assert opt._matrices[("fit", 32)].num_row() == len(opt.X_fit)
+    assert opt._matrices[("full", 32)].feature_names == ["a", "b", "c", "d"]
+
+
+def test_model_optimization_weights_classes(xgb_data):
+    X, y = xgb_data
+    opt = ModelOptimization(
+        X,
+        y,
+        xgb.XGBClassifier,
+        threshold=0.0,
+        max_bin_grid=[32],
+        class_weight={0: 1.0, 1: 3.0},
+    )
+    model = opt.optimize(n_trials=1)
+    assert model is not None
+    weights = opt._matrices[("fit", 32)].get_weight()
+    assert (weights == np.where(opt.y_fit == 1, 3.0, 1.0)).all()
+
+
+def test_cross_validate_reuses_stratified_folds(xgb_data):
+    X, y = xgb_data
+    evaluator = ModelEvaluation(X, y, cv_folds=4, cv_workers=1)
+    folds = evaluator.folds
+    params = {"n_estimators": 10, "max_depth": 2, "max_bin": 32}
+    try:
+        first = evaluator.cross_validate(xgb.XGBClassifier, params)
+        second = evaluator.cross_validate(xgb.XGBClassifier, params)
+        assert os.path.exists(os.path.join(evaluator._cv_dir, "X.npy"))
+        evaluator.cross_validate(xgb.XGBClassifier, params, early_stopping_rounds=2)
+        cv_dir = evaluator._cv_dir
+        train_rows = len(folds[0][0])
+        dtrain, dval = _FOLD_MATRICES[(cv_dir, 0, 32, True)]
+        # Early stopping watches a slice of the training rows, not the fold.
+        assert dtrain.num_row() + dval.num_row() == train_rows
+        assert _FOLD_MATRICES[(cv_dir, 0, 32, False)][0].num_row() == train_rows
+    finally:
+        evaluator.close()
+    assert not [key for key in _FOLD_MATRICES if key[0] == cv_dir]
+
+    assert evaluator.folds is folds
+    assert first["scores"] == second["scores"]
+    assert len(first["scores"]) == len(first["fit_seconds"]) == 4
+    assert first["mean"] == pytest.approx(np.mean(first["scores"]))
+    for _, test_index in folds:
+        assert evaluator.y_train.iloc[test_index].mean() == pytest.approx(
+            evaluator.y_train.mean(), abs=0.05
+        )
+    assert evaluator._cv_dir is None
+
+
+def test_model_optimization_cross_validates_trials_in_processes(xgb_data, tmp_path):
+    X, y = xgb_data
+    opt = ModelOptimization(
+        X,
+        y,
+        xgb.XGBClassifier,
+        threshold=0.0,
+        early_stopping_rounds=5,
+        max_bin_grid=[32],
+        cv_folds=3,
+        cv_workers=2,
+    )
+    storage = str(tmp_path / "study.journal")
+    model = opt.optimize(n_trials=2, storage=storage)
+
+    study = optuna.load_study(
+        study_name="model_optimization", storage=_create_storage(storage)
+    )
+    for trial in study.trials:
+        assert len(trial.user_attrs["fold_scores"]) == 3
+        assert len(trial.user_attrs["fold_seconds"]) == 3
+    assert study.best_value == pytest.approx(
+        np.mean(study.best_trial.user_attrs["fold_scores"])
+    )
+    assert model.n_estimators == opt.n_estimators_used
+    assert opt._cv_pool is None and opt._cv_dir is None
+
+
+def test_threshold_sweep_matches_sklearn_at_every_threshold():
+    rng = np.random.default_rng(0)
+    y_true = rng.integers(0, 2, 300)
+    y_score = np.round(rng.random(300), 2)
+    sweep = threshold_sweep(y_true, y_score)
+
+    assert (np.diff(sweep["thresholds"]) < 0).all()
+    for threshold, precision, recall, f1 in zip(
+        sweep["thresholds"], sweep["precision"], sweep["recall"], sweep["f1"]
+    ):
+        y_pred = (y_score >= threshold).astype(int)
+        assert precision == pytest.approx(precision_score(y_true, y_pred))
+        assert recall == pytest.approx(recall_score(y_true, y_pred))
+        assert f1 == pytest.approx(f1_score(y_true, y_pred))
+
+    threshold, f1 = best_threshold(y_true, y_score)
+    assert f1 == pytest.approx(sweep["f1"].max())
+    assert f1 == pytest.approx(f1_score(y_true, y_score >= threshold))
+
+
+def test_model_optimization_stores_decision_threshold(xgb_data):
+    X, y = xgb_data
+    opt = ModelOptimization(X, y, xgb.XGBClassifier, threshold=0.0)
+    model = opt.optimize(n_trials=2)
+    stored = float(model.get_booster().attr("decision_threshold"))
+    assert stored == opt.decision_threshold
+    assert 0.0 < stored < 1.0
+
+
+def test_model_optimization_picks_threshold_off_the_holdout(xgb_data):
+    X, y = xgb_data
+    opt = ModelOptimization(X, y, xgb.XGBClassifier, threshold=0.0)
+    model = opt.optimize(n_trials=2, refit_full=False)
+    threshold, _ = best_threshold(opt.y_val, positive_scores(model, opt.X_val))
+    assert opt.decision_threshold == threshold
+    assert opt.holdout_f1 == pytest.approx(
+        f1_at_threshold(opt.y_test, positive_scores(model, opt.X_test), threshold)
+    )
+    assert opt.get_score() == ("f1_score", opt.holdout_f1)
+
+
+def test_train_continues_champion_without_searching(xgb_data):
+    X, y = xgb_data
+    opt = ModelOptimization(X, y, xgb.XGBClassifier, threshold=0.0)
+    champion = opt.optimize(n_trials=2)
+    champion_rounds = champion.get_booster().num_boosted_rounds()
+
+    with patch.object(ModelOptimization, "optimize") as optimize:
+        model, score = train(
+            X, y, xgb.XGBClassifier, 0.0, champion=champion, incremental_rounds=5
+        )
+    optimize.assert_not_called()
+    assert champion.get_booster().num_boosted_rounds() == champion_rounds
+    assert champion_rounds < model.get_booster().num_boosted_rounds()
+    assert champion_params(model) == champion_params(champion)
+    assert score[1] > 0.0
+
+
+def test_train_searches_seeded_with_champion_below_threshold(xgb_data):
+    X, y = xgb_data
+    champion = ModelOptimization(X, y, xgb.XGBClassifier, threshold=0.0).optimize(
+        n_trials=1
+    )
+    seed = champion_params(champion)
+
+    with patch.object(optuna.study.Study, "enqueue_trial") as enqueue_trial:
+        model, _ = train(X, y, xgb.XGBClassifier, 1.0, champion=champion, n_trials=1)
+    assert model is None
+    enqueue_trial.assert_called_once_with(seed, skip_if_exists=True)
+
+
+def test_compact_model_exports_servable_model(xgb_data, tmp_path):
+    X, y = xgb_data
+    model = xgb.XGBClassifier(n_estimators=20)
+    model.fit(X, y)
+    pipeline = FeaturePipeline.fit(X)
+
+    compacted, compacted_pipeline, score, report = compact_model(
+        model, X, y, pipeline, str(tmp_path), score=("f1_score", 0.5)
+    )
+    assert compacted is model
+    assert compacted_pipeline is pipeline
+    assert score == ("f1_score", 0.5)
+    assert report["trees"] == 20
+    assert report["batch_1_us_per_row"] > 0
+    booster = xgb.Booster(model_file=str(tmp_path / "model.ubj"))
+    np.testing.assert_allclose(
+        booster.inplace_predict(X), compacted.predict_proba(X)[:, 1], rtol=1e-6
+    )
+    assert (tmp_path / "feature_pipeline.json").exists()
+    assert (tmp_path / "latency_report.json").exists()
+
+
+def test_reduce_features_keeps_features_of_highest_gain(xgb_data):
+    X, y = xgb_data
+    model = ModelOptimization(X, y, xgb.XGBClassifier, threshold=0.0).optimize(
+        n_trials=1
+    )
+    pipeline = FeaturePipeline.fit(X, fill_strategy="median")
+
+    with patch.object(
+        ModelOptimization, "refit", autospec=True, side_effect=ModelOptimization.refit
+    ) as refit:
+        reduced, reduced_pipeline, score = reduce_features(
+            model, X, y, pipeline, 1, 0.0
+        )
+    assert score == refit.call_args.args[0].get_score()
+    assert reduced.get_booster().feature_names == ["a"]
+    assert reduced_pipeline.columns == ["a"]
+    assert reduced_pipeline.fill_values.tolist() == [pipeline.fill_values[0]]
+    assert champion_params(reduced)["max_depth"] == champion_params(model)["max_depth"]
+
+
+@patch("src.models.model_registry.DatabricksModelRegistry._mlflow")
+@patch("src.models.model_registry._get_client")
+def test_registry_shares_client_and_experiment_id(
+    mock_get_client, mock_mlflow, tmp_path
+):
+    client = mock_get_client.return_value
+    client.get_experiment_by_name.return_value = None
+    client.create_experiment.return_value = "7"
+
+    registries = [LocalModelRegistry(str(tmp_path / name)) for name in "ab"]
+    assert [registry._experiment_id() for registry in registries * 2] == ["7"] * 4
+    # One lookup per tracking database, not one per push.
+    assert client.get_experiment_by_name.call_count == 2
+    assert isinstance(get_registry("local"), LocalModelRegistry)
+    with pytest.raises(ValueError):
+        get_registry("unknown")